@@ -1,5 +1,20 @@
-import re
-from typing import TypedDict, List
+import os
+import sys
+import copy
+import queue
+import asyncio
+import contextvars
+import threading
+import weakref
+from typing import Any, Callable, TypedDict, List
+from cache import SimilarityCache, TTLCache, cache_key
+from database import CheckpointStore
+from normalize import normalize_product_data
+from resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    aretry_with_backoff,
+)
 from agents import (
     PrimaryResearcherAgent,
     ProductDetailAgent,
@@ -9,29 +24,82 @@ from agents import (
 )
 
 # ---------------------------------------------------------------------------
-# Progress-callback plumbing (unchanged)
+# Progress-callback plumbing
 # ---------------------------------------------------------------------------
-_progress_callback = None
+# emit_progress only enqueues; a daemon thread does the stdout writes and UI
+# callbacks in batches, so agents never wait on stdio or a slow SSE sink.
+# The thread is started by set_progress_callback (or the pipeline entry
+# points); anything emitted before that simply waits in the queue.
+#
+# The callback lives in a ContextVar, so each request's task (and the
+# to_thread workers it spawns) sees its own and concurrent runs never
+# receive each other's progress.
+_progress_cv: "contextvars.ContextVar[Callable | None]" = contextvars.ContextVar(
+    "progress_callback", default=None
+)
+_progress_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+_progress_flusher: threading.Thread | None = None
+_progress_flusher_lock = threading.Lock()
+_PROGRESS_BATCH = 64
 
 
-def set_progress_callback(callback):
-    global _progress_callback
-    _progress_callback = callback
+def set_progress_callback(callback) -> contextvars.Token:
+    """Route progress in the current context to callback; returns a reset token."""
+    _ensure_progress_flusher()
+    return _progress_cv.set(callback)
 
 
-def clear_progress_callback():
-    global _progress_callback
-    _progress_callback = None
+def clear_progress_callback(token: contextvars.Token) -> None:
+    _progress_cv.reset(token)
 
 
 def emit_progress(message: str):
-    global _progress_callback
-    print(message)
-    if _progress_callback:
-        try:
-            _progress_callback(message)
-        except Exception as e:
-            print(f"Error in progress callback: {e}")
+    # Capture the callback now: it may be reset before the flusher runs
+    _progress_queue.put_nowait((message, _progress_cv.get()))
+
+
+def flush_progress(timeout: float = 5.0) -> None:
+    """Block until every message emitted so far has been delivered."""
+    done = threading.Event()
+    _ensure_progress_flusher()
+    _progress_queue.put_nowait(done)
+    done.wait(timeout)
+
+
+def _ensure_progress_flusher() -> None:
+    global _progress_flusher
+    if _progress_flusher is not None:
+        return
+    with _progress_flusher_lock:
+        if _progress_flusher is None:
+            _progress_flusher = threading.Thread(
+                target=_drain_progress, name="progress-flusher", daemon=True
+            )
+            _progress_flusher.start()
+
+
+def _drain_progress() -> None:
+    while True:
+        batch = [_progress_queue.get()]
+        while len(batch) < _PROGRESS_BATCH:
+            try:
+                batch.append(_progress_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        messages = [item for item in batch if isinstance(item, tuple)]
+        if messages:
+            sys.stdout.write("".join(f"{message}\n" for message, _ in messages))
+            sys.stdout.flush()
+        for message, callback in messages:
+            if callback:
+                try:
+                    callback(message)
+                except Exception as e:
+                    print(f"Error in progress callback: {e}")
+        for item in batch:
+            if isinstance(item, threading.Event):
+                item.set()
 
 
 # ---------------------------------------------------------------------------
@@ -55,97 +123,317 @@ link_verification_agent = LinkVerificationAgent()
 recommendation_agent = RecommendationAgent()
 
 MAX_PRODUCTS = 3
+MAX_PRICE_CHECKS = 3  # concurrent compare_prices calls per pipeline run
+# Pipeline runs doing work at once per process; further searches queue for
+# a slot instead of all contending for the LLM and search rate limits
+RESEARCH_CONCURRENCY = int(os.getenv("RESEARCH_CONCURRENCY", "8"))
+
+# Per-stage wall-clock budgets (seconds). compare_prices and link
+# verification scrape several retailer pages, so they get the most headroom.
+SEARCH_TIMEOUT = 30.0
+DETAILS_TIMEOUT = 30.0
+PRICE_TIMEOUT = 45.0
+VERIFY_TIMEOUT = 45.0
+RECOMMEND_TIMEOUT = 30.0
 
 
 # ---------------------------------------------------------------------------
-# Normalisation
+# Agent call wrappers: response caching + circuit breaking
 # ---------------------------------------------------------------------------
+RESEARCH_CACHE_TTL = 24 * 60 * 60  # candidates + product details
+PRICE_CACHE_TTL = 6 * 60 * 60  # retailer prices move faster
+
+# Candidate search and product analysis are the expensive, query-determined
+# stages, so they are checkpointed to the database as well and a re-run
+# after a restart skips them.
+_search_cache = TTLCache(
+    maxsize=512, ttl=RESEARCH_CACHE_TTL,
+    store=CheckpointStore("search", max_age=RESEARCH_CACHE_TTL),
+)
+_details_cache = TTLCache(
+    maxsize=512, ttl=RESEARCH_CACHE_TTL,
+    store=CheckpointStore("details", max_age=RESEARCH_CACHE_TTL),
+)
+_price_cache = TTLCache(maxsize=512, ttl=PRICE_CACHE_TTL)
+# Whole pipeline results, shared by near-duplicate phrasings of a query
+_result_cache = SimilarityCache(maxsize=256, ttl=PRICE_CACHE_TTL)
 
-def normalize_product_data(product: dict) -> dict:
-    """Ensure product data matches the Product Pydantic model."""
 
-    # -- name --
-    if not product.get("name"):
-        product["name"] = "Unknown Product"
+# Upstream outages trip a per-agent breaker so later calls fail fast
+# instead of each paying the full provider timeout.
+_research_breaker = CircuitBreaker("primary_researcher", fail_threshold=3, reset_after=60)
+_details_breaker = CircuitBreaker("product_detail", fail_threshold=3, reset_after=60)
+_price_breaker = CircuitBreaker("price_comparison", fail_threshold=3, reset_after=60)
 
-    # -- price --
-    price = product.get("price")
-    if isinstance(price, dict):
-        for key in ("starting", "msrp", "price", "lowPrice"):
-            if key in price:
-                product["price"] = price[key]
-                break
-        else:
-            vals = [v for v in price.values() if isinstance(v, (int, float))]
-            product["price"] = vals[0] if vals else "Price varies"
-    elif price is None or price == "":
-        product["price"] = "Price not available"
-
-    # -- rating (float 1.0-5.0) --
-    rating = product.get("rating", 4.0)
-    if isinstance(rating, dict):
-        rating = rating.get("score", rating.get("value", 4.0))
-    if isinstance(rating, str):
-        m = re.search(r"(\d+\.?\d*)", rating)
-        rating = float(m.group(1)) if m else 4.0
-    if rating is None:
-        rating = 4.0
-    try:
-        rating = float(rating)
-    except (ValueError, TypeError):
-        rating = 4.0
-    product["rating"] = max(1.0, min(5.0, rating))
-
-    # -- features --
-    features = product.get("features", [])
-    if isinstance(features, dict):
-        features = [f"{k}: {v}" for k, v in features.items()]
-    elif not isinstance(features, list):
-        features = []
-    product["features"] = features
-
-    # -- pros / cons --
-    for key in ("pros", "cons"):
-        val = product.get(key, [])
-        if not isinstance(val, list):
-            product[key] = []
-
-    # -- reviews_count --
-    rc = product.get("reviews_count")
-    if isinstance(rc, dict):
-        product["reviews_count"] = None
-    elif isinstance(rc, str):
-        m = re.search(r"\d+", rc.replace(",", ""))
-        product["reviews_count"] = int(m.group()) if m else None
-
-    # -- urls --
-    if not product.get("url"):
-        product["url"] = ""
-    if not product.get("cheapest_link"):
-        product["cheapest_link"] = product.get("url", "")
-
-    # -- image --
-    if not product.get("image_url"):
-        product["image_url"] = None
-    product["image_data"] = None  # legacy field, not used
-
-    # -- drop internal-only keys --
-    product.pop("source_urls", None)
-    product.pop("search_image", None)
-
-    # -- link_verified (from LinkVerificationAgent) --
-    if "link_verified" not in product:
-        product["link_verified"] = False
-
-    return product
+
+async def _aresilient(breaker: CircuitBreaker, fn, *args):
+    """Await fn behind breaker, retrying transient errors with jittered backoff."""
+    return await breaker.acall(aretry_with_backoff, fn, *args)
+
+
+async def search_products(query: str) -> list[dict]:
+    return await _search_cache.aget_or_call(
+        cache_key(query),
+        _aresilient, _research_breaker, primary_researcher.asearch_products, query,
+    )
+
+
+async def prefetch_candidates(query: str) -> list[dict] | None:
+    """Candidate search for query ahead of its research run.
+
+    None when a near-duplicate result is already cached (the run will
+    return that instead). Otherwise it waits for a research slot like a
+    pipeline run, so prefetches count against RESEARCH_CONCURRENCY.
+    """
+    if _result_cache.get(query) is not None:
+        return None
+    async with _research_slots():
+        candidates = await asyncio.wait_for(search_products(query), SEARCH_TIMEOUT)
+    return _candidate_list(candidates)
+
+
+def _candidate_list(candidates: Any) -> list[dict]:
+    if isinstance(candidates, dict) and "products" in candidates:
+        candidates = candidates["products"]
+    return (candidates or [])[:MAX_PRODUCTS] if isinstance(candidates, list) else []
+
+
+def _details_worth_caching(details: dict) -> bool:
+    # Don't pin an empty analysis (e.g. search outage) for a whole day
+    return bool(details.get("features") or details.get("pros"))
+
+
+async def gather_details(name: str) -> dict:
+    return await _details_cache.aget_or_call(
+        cache_key(name),
+        _aresilient, _details_breaker, product_detail_agent.agather_details, name,
+        should_cache=_details_worth_caching,
+    )
+
+
+async def gather_details_many(
+    names: list[str], on_result: Callable[[int, Any], None] | None = None
+) -> list:
+    """Details for every name, one entry per name (a dict or the exception).
+
+    Uncached names are analysed together in a single batched LLM call; any
+    the batch couldn't answer fall back to a per-product gather_details.
+    ``on_result(i, details)`` is called as each name's details are known
+    (streamed batch entries arrive early), so callers needn't wait for all.
+    A name may be reported twice if the batch is retried.
+    """
+    report = on_result or (lambda i, details: None)
+    results: list = list(
+        await asyncio.gather(*[_details_cache.aget(cache_key(n)) for n in names])
+    )
+    missing = [i for i, r in enumerate(results) if r is None]
+    for i, details in enumerate(results):
+        if details is not None:
+            report(i, details)
+
+    if len(missing) > 1:
+        try:
+            batch = await _aresilient(
+                _details_breaker, product_detail_agent.agather_details_batch,
+                [names[i] for i in missing],
+                lambda j, details: report(missing[j], details),
+            )
+        except Exception as exc:
+            print(f"[pipeline] batched details failed, falling back: {exc}")
+            batch = [None] * len(missing)
+        for i, details in zip(missing, batch):
+            if details is not None:
+                results[i] = details
+                report(i, details)
+                if _details_worth_caching(details):
+                    _details_cache.set(cache_key(names[i]), details)
+
+    leftovers = [i for i, r in enumerate(results) if r is None]
+    singles = await asyncio.gather(
+        *[gather_details(names[i]) for i in leftovers], return_exceptions=True
+    )
+    for i, details in zip(leftovers, singles):
+        results[i] = details
+        report(i, details)
+    return results
+
+
+def _start_details(names: list[str]) -> tuple[list[asyncio.Future], asyncio.Task]:
+    """Run gather_details_many in the background with one future per name."""
+    loop = asyncio.get_running_loop()
+    ready = [loop.create_future() for _ in names]
+
+    def _deliver(i: int, details: Any) -> None:
+        if not ready[i].done():
+            ready[i].set_result(details)
+
+    def _finish(task: asyncio.Task) -> None:
+        # Cancelled or crashed: release anyone still waiting
+        exc = None if task.cancelled() else task.exception()
+        for future in ready:
+            if future.done():
+                continue
+            if exc is None:
+                future.cancel()
+            else:
+                future.set_exception(exc)
+
+    task = asyncio.ensure_future(gather_details_many(names, _deliver))
+    task.add_done_callback(_finish)
+    return ready, task
+
+
+async def compare_prices(name: str) -> dict:
+    return await _price_cache.aget_or_call(
+        cache_key(name),
+        _aresilient, _price_breaker, price_comparison_agent.acompare_prices, name,
+        should_cache=lambda d: bool(d.get("url") or d.get("price_comparison")),
+    )
+
+
+# ---------------------------------------------------------------------------
+# Per-candidate research
+# ---------------------------------------------------------------------------
+
+_MISSING_PRICES = ("Price not available", "Price varies", None, "")
+
+
+async def _run_agent(fn, *args, timeout: float):
+    """Run a blocking agent call in a worker thread with a deadline.
+
+    On timeout the awaiting coroutine gives up; the worker thread cannot be
+    interrupted and finishes in the background, but no longer holds up the
+    pipeline.
+    """
+    return await asyncio.wait_for(asyncio.to_thread(fn, *args), timeout)
+
+
+def _report_failure(action: str, name: str, exc: BaseException) -> None:
+    if isinstance(exc, CircuitOpenError):
+        emit_progress(f"Circuit open for {name}, returning fallback")
+    elif isinstance(exc, asyncio.TimeoutError):
+        emit_progress(f"Timed out {action} {name}, returning fallback")
+    else:
+        emit_progress(f"Error {action} {name}: {exc}")
+
+
+def _apply_price_data(product: dict, price_data, name: str) -> None:
+    """Merge a compare_prices result (or the exception it raised) into product."""
+    if isinstance(price_data, Exception):
+        _report_failure("comparing prices for", name, price_data)
+        product.setdefault("url", "")
+        product.setdefault("image_url", None)
+        product.setdefault("price", "Price not available")
+        product.setdefault("price_comparison", [])
+        product.setdefault("cheapest_link", "")
+        return
+
+    # URL and image come from price comparison (retailer pages)
+    product["url"] = price_data.get("url", "")
+    product["image_url"] = price_data.get("image_url")
+    product["price"] = price_data.get("price", "Price not available")
+    product["price_comparison"] = price_data.get("price_comparison", [])
+    product["cheapest_link"] = price_data.get("cheapest_link", product.get("url", ""))
+
+    # Use best_price if our price is still missing
+    best_price = price_data.get("best_price")
+    if best_price and product.get("price") in _MISSING_PRICES:
+        product["price"] = best_price
+
+    img_status = "with image" if product.get("image_url") else "no image"
+    emit_progress(
+        f"Best price for {name}: {product.get('price', 'N/A')} ({img_status})"
+    )
+
+
+async def _research_candidate(
+    candidate: dict, idx: int, total: int, price_slots: asyncio.Semaphore,
+    details_ready: asyncio.Future | None = None,
+) -> dict | None:
+    """Details, concurrently with price comparison and then link verification.
+
+    Verification only needs the retailer data, so it doesn't wait for the
+    analysis; a candidate finishes in max(details, prices + links).
+
+    ``details_ready`` is this candidate's slot from _start_details; without
+    it the details are gathered for this one alone.
+    Returns the normalised product, or None if it was skipped.
+    """
+    name = candidate.get("name", "Unknown")
+    label = f"{name} ({idx}/{total})"  # shared by this candidate's messages
+    emit_progress(f"Validating & researching {label} ...")
+
+    async def _details() -> dict:
+        if details_ready is None:
+            return await gather_details(name)
+        # shield: a timeout here mustn't cancel the shared batch's future
+        details = await asyncio.shield(details_ready)
+        if isinstance(details, BaseException):
+            raise details
+        return details
+
+    async def _links() -> dict:
+        async with price_slots:
+            emit_progress(f"Finding buy links & prices for {label}")
+            try:
+                price_data = await asyncio.wait_for(compare_prices(name), PRICE_TIMEOUT)
+            except Exception as exc:
+                price_data = exc
+        links = {"name": name}
+        _apply_price_data(links, price_data, name)
+
+        emit_progress(f"Verifying links for {label}")
+        try:
+            # verify_product_links mutates its argument; hand it a copy so a
+            # timed-out worker can't keep editing the links we return
+            links = await _run_agent(
+                link_verification_agent.verify_product_links, dict(links),
+                timeout=VERIFY_TIMEOUT,
+            )
+            verified_status = "verified" if links.get("link_verified") else "could not verify"
+            emit_progress(f"Links for {name}: {verified_status}")
+        except Exception as exc:
+            _report_failure("verifying links for", name, exc)
+        return links
+
+    details, links = await asyncio.gather(
+        asyncio.wait_for(_details(), DETAILS_TIMEOUT), _links(), return_exceptions=True,
+    )
+
+    if isinstance(details, Exception):
+        _report_failure("researching", name, details)
+        return None
+    if not details.get("is_valid_product", True):
+        emit_progress(f"Skipped {name} — does not appear to be a valid product")
+        return None
+
+    # Build product dict from details, then layer retailer data on top
+    product = {
+        "name": details.get("name", name),
+        "rating": details.get("rating", 4.0),
+        "reviews_count": details.get("reviews_count"),
+        "features": details.get("features", []),
+        "pros": details.get("pros", []),
+        "cons": details.get("cons", []),
+        "why_to_buy": details.get("why_to_buy", ""),
+    }
+    emit_progress(f"Completed details for {name}")
+    product.update((k, v) for k, v in links.items() if k != "name")
+    # The analyst's estimate when no retailer page gave a price
+    approximate_price = details.get("approximate_price")
+    if approximate_price and product.get("price") in _MISSING_PRICES:
+        product["price"] = approximate_price
+
+    # Finish the product here so each one is walked once, not once per stage
+    return normalize_product_data(product)
 
 
 # ---------------------------------------------------------------------------
 # Pipeline
 # ---------------------------------------------------------------------------
 
-def run_shopping_pipeline(query: str) -> dict:
-    """Sequential multi-agent orchestration with progress hooks.
+async def run_shopping_pipeline_async(query: str, candidates: list | None = None) -> dict:
+    """Multi-agent orchestration with progress hooks.
 
     Pipeline:
       1. Primary Research   → top 3 product candidates (names)
@@ -153,9 +441,46 @@ def run_shopping_pipeline(query: str) -> dict:
       3. Price Comparison   → find retailer buy pages → URL, image, price
       4. Link Verification  → verify all buy links are real purchase pages
       5. Normalise          → clean data for API response
+         (per candidate, 2 runs alongside 3 → 4, and 5 joins them; all
+         candidates are processed in parallel)
       6. Recommendation     → final LLM recommendation
+
+    candidates, when given (e.g. prefetched for a personalization
+    session), replace step 1.
     """
 
+    # Hot queries return before any pipeline state is set up (and never
+    # wait for a slot)
+    cached = _result_cache.get(query)
+    if cached is not None:
+        emit_progress("Found recent results for a near-identical search")
+        emit_progress("Research complete!")
+        cached["query"] = query
+        return cached
+
+    slots = _research_slots()
+    if slots.locked():
+        emit_progress("Waiting for a free research slot...")
+    async with slots:
+        return await _run_research(query, candidates)
+
+
+# asyncio semaphores belong to one event loop, and the sync entry point
+# runs each pipeline on a fresh one
+_loop_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _research_slots() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    slots = _loop_slots.get(loop)
+    if slots is None:
+        slots = _loop_slots[loop] = asyncio.Semaphore(RESEARCH_CONCURRENCY)
+    return slots
+
+
+async def _run_research(query: str, candidates: list | None = None) -> dict:
     state: ShoppingState = {
         "query": query,
         "product_candidates": [],
@@ -165,129 +490,150 @@ def run_shopping_pipeline(query: str) -> dict:
 
     # ── Step 1: Primary research ───────────────────────────────
     emit_progress(f"Analyzing query '{query[:60]}' ...")
-    emit_progress("Searching the web for top products...")
-
-    candidates = primary_researcher.search_products(query)
-    if isinstance(candidates, dict) and "products" in candidates:
-        candidates = candidates["products"]
-    state["product_candidates"] = (
-        (candidates or [])[:MAX_PRODUCTS] if isinstance(candidates, list) else []
-    )
-    emit_progress(
-        f"Found {len(state['product_candidates'])} product candidates"
+    if candidates:
+        emit_progress("Using the products found while you personalized the search...")
+    else:
+        emit_progress("Searching the web for top products...")
+        try:
+            candidates = await asyncio.wait_for(search_products(query), SEARCH_TIMEOUT)
+        except (CircuitOpenError, asyncio.TimeoutError) as exc:
+            _report_failure("searching for", "products", exc)
+            candidates = []
+    state["product_candidates"] = _candidate_list(candidates)
+    total = len(state["product_candidates"])
+    emit_progress(f"Found {total} product candidates")
+
+    # ── Steps 2-5: per-candidate fan-out ──────────────────────
+    # Details and retailer data are independent, so each candidate analyses
+    # the product while it compares prices and verifies its links; all
+    # candidates run in parallel, so the critical path is one candidate, not
+    # the sum of stages.
+    # The detail analyses for all candidates share one batched LLM call.
+    price_slots = asyncio.Semaphore(MAX_PRICE_CHECKS)
+    emit_progress("Researching products and buy links across retailers...")
+    # Each candidate moves on as soon as its own analysis has streamed in.
+    details_ready, details_task = _start_details(
+        [c.get("name", "Unknown") for c in state["product_candidates"]]
     )
-
-    # ── Step 2: Product detail (validate picks + features/pros/cons) ──
-    products: list[dict] = []
-    for idx, candidate in enumerate(state["product_candidates"], 1):
-        name = candidate.get("name", "Unknown")
-        emit_progress(
-            f"Validating & researching {name} ({idx}/{len(state['product_candidates'])}) ..."
+    try:
+        results = await asyncio.gather(
+            *[
+                _research_candidate(candidate, idx, total, price_slots, ready)
+                for (idx, candidate), ready in zip(
+                    enumerate(state["product_candidates"], 1), details_ready
+                )
+            ]
         )
-        try:
-            details = product_detail_agent.gather_details(name)
-
-            if not details.get("is_valid_product", True):
-                emit_progress(f"Skipped {name} — does not appear to be a valid product")
-                continue
-
-            # Build product dict: details only, no URLs/images yet
-            product = {
-                "name": details.get("name", name),
-                "approximate_price": details.get("approximate_price"),
-                "rating": details.get("rating", 4.0),
-                "reviews_count": details.get("reviews_count"),
-                "features": details.get("features", []),
-                "pros": details.get("pros", []),
-                "cons": details.get("cons", []),
-                "why_to_buy": details.get("why_to_buy", ""),
-            }
-            products.append(product)
-            emit_progress(f"Completed details for {name}")
-        except Exception as exc:
-            emit_progress(f"Error researching {name}: {exc}")
-
-    # ── Step 3: Price comparison → URL, image, price from retailers ──
-    emit_progress("Searching for best deals and buy links across retailers...")
-    for idx, product in enumerate(products, 1):
-        name = product.get("name", "Unknown")
-        emit_progress(f"Finding buy links & prices for {name} ({idx}/{len(products)})")
-        try:
-            price_data = price_comparison_agent.compare_prices(
-                name, product.get("approximate_price")
-            )
-
-            # URL and image come from price comparison (retailer pages)
-            product["url"] = price_data.get("url", "")
-            product["image_url"] = price_data.get("image_url")
-            product["price"] = price_data.get("price", "Price not available")
-            product["price_comparison"] = price_data.get("price_comparison", [])
-            product["cheapest_link"] = price_data.get("cheapest_link", product.get("url", ""))
-
-            # Use best_price if our price is still missing
-            best_price = price_data.get("best_price")
-            if best_price and product.get("price") in (
-                "Price not available", "Price varies", None, "",
-            ):
-                product["price"] = best_price
-
-            img_status = "with image" if product.get("image_url") else "no image"
-            emit_progress(
-                f"Best price for {name}: {product.get('price', 'N/A')} ({img_status})"
-            )
-        except Exception as exc:
-            emit_progress(f"Error comparing prices for {name}: {exc}")
-            product.setdefault("url", "")
-            product.setdefault("image_url", None)
-            product.setdefault("price", product.get("approximate_price", "Price not available"))
-            product.setdefault("price_comparison", [])
-            product.setdefault("cheapest_link", "")
-
-    # Remove the internal-only approximate_price field
-    for product in products:
-        product.pop("approximate_price", None)
-
-    # ── Step 4: Link verification ──────────────────────────────
-    emit_progress("Verifying product buy links...")
-    for idx, product in enumerate(products, 1):
-        name = product.get("name", "Unknown")
-        emit_progress(f"Verifying links for {name} ({idx}/{len(products)})")
-        try:
-            product = link_verification_agent.verify_product_links(product)
-            products[idx - 1] = product
-            verified_status = "verified" if product.get("link_verified") else "could not verify"
-            emit_progress(f"Links for {name}: {verified_status}")
-        except Exception as exc:
-            emit_progress(f"Error verifying links for {name}: {exc}")
-
-    # ── Step 5: Normalise ──────────────────────────────────────
-    normalized = [normalize_product_data(p) for p in products]
+    finally:
+        if not details_task.done():
+            details_task.cancel()
+    normalized = [p for p in results if p is not None]
     state["detailed_products"] = normalized
 
     # ── Step 6: Final recommendation ───────────────────────────
     emit_progress("Compiling final recommendation...")
-    recommendation = recommendation_agent.recommend(normalized, query)
+    try:
+        recommendation = await recommendation_agent.arecommend(
+            normalized, query, timeout=RECOMMEND_TIMEOUT
+        )
+    except asyncio.TimeoutError as exc:
+        _report_failure("compiling", "recommendation", exc)
+        recommendation = ""
 
     state["final_response"] = {
         "products": normalized,
         "final_recommendation": recommendation
         or "Here are the top products found.",
     }
+    if normalized:
+        _result_cache.set(query, state)
     emit_progress("Research complete!")
 
     return state
 
 
+def run_shopping_pipeline(query: str) -> dict:
+    """Synchronous entry point for callers without a running event loop."""
+    return asyncio.run(run_shopping_pipeline_async(query))
+
+
 # ---------------------------------------------------------------------------
-# Thin wrapper to keep the .invoke() interface expected by main.py
+# Thin wrapper exposing .invoke() / .ainvoke() to main.py
 # ---------------------------------------------------------------------------
 
 class SimpleShoppingApp:
+    def __init__(self):
+        # Pipelines currently running on the event loop, keyed by query hash,
+        # with the number of callers awaiting each and their progress callbacks
+        self._inflight: dict[str, list] = {}
+
     def invoke(self, initial_state):
-        query = (
-            initial_state.get("query", "") if isinstance(initial_state, dict) else ""
-        )
-        return run_shopping_pipeline(query)
+        _ensure_progress_flusher()
+        try:
+            return run_shopping_pipeline(self._query(initial_state))
+        finally:
+            flush_progress()
+
+    async def ainvoke(self, initial_state):
+        """Await the pipeline on the caller's event loop (FastAPI routes).
+
+        Concurrent calls for the same (normalized) query share one pipeline
+        run; when more than one caller shared it, each gets its own copy of
+        the result (a lone caller gets the pipeline's dict as is).
+        """
+        _ensure_progress_flusher()
+        query = self._query(initial_state)
+        key = cache_key(query)
+        flight = self._inflight.get(key)
+        if flight is None:
+            callbacks: list = []
+            candidates = (
+                initial_state.get("product_candidates") if isinstance(initial_state, dict) else None
+            ) or None
+            task = asyncio.ensure_future(self._run_shared(query, callbacks, candidates))
+            flight = self._inflight[key] = [task, 0, callbacks]
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            emit_progress("Joining an identical search already in progress...")
+        task = flight[0]
+        flight[1] += 1
+        callback = _progress_cv.get()
+        if callback:
+            flight[2].append(callback)
+        try:
+            # shield: a disconnecting caller must not cancel the shared run
+            result = await asyncio.shield(task)
+            # Nobody can join a finished run, so the count is final here
+            return copy.deepcopy(result) if flight[1] > 1 else result
+        finally:
+            # Deliver queued progress before the caller sees the result
+            await asyncio.to_thread(flush_progress)
+
+    async def abatch(self, initial_states: list) -> list:
+        """ainvoke for several queries at once; results in input order.
+
+        Runs share the agents' caches, breakers and the LLM concurrency cap,
+        and identical queries in the batch share one run.
+        """
+        return list(await asyncio.gather(*[self.ainvoke(s) for s in initial_states]))
+
+    @staticmethod
+    async def _run_shared(query: str, callbacks: list, candidates: list | None = None):
+        # The task runs in a copy of the first caller's context; send its
+        # progress to every caller that joins instead
+        def fan_out(message: str):
+            for callback in list(callbacks):
+                try:
+                    callback(message)
+                except Exception as e:
+                    print(f"Error in progress callback: {e}")
+
+        _progress_cv.set(fan_out)
+        return await run_shopping_pipeline_async(query, candidates)
+
+    @staticmethod
+    def _query(initial_state) -> str:
+        return initial_state.get("query", "") if isinstance(initial_state, dict) else ""
 
 
 app = SimpleShoppingApp()
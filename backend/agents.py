@@ -1,12 +1,36 @@
 import os
 import re
-import json
+import functools
+import time
+import asyncio
+import atexit
+import threading
+import weakref
 import httpx
-from typing import Any, Optional
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps as lc_dumps, loads as lc_loads
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+from langchain_core.output_parsers import BaseOutputParser, StrOutputParser
+from langchain_core.runnables import RunnableLambda
 from dotenv import load_dotenv
 
+from cache import SimilarityCache, TTLCache, cache_key, content_key
+from database import CheckpointStore
+from jsonutil import loads as _json_loads
+from resilience import RateLimiter
+from html_parse import (
+    HAVE_LXML,
+    parse_product_metadata,
+    parse_verification_signals,
+    product_name_matches_title as _product_name_matches_title,
+    run_parser,
+    shutdown_pool,
+    warm_pool,
+)
+
 load_dotenv()
 
 # ---------------------------------------------------------------------------
@@ -14,18 +38,182 @@ load_dotenv()
 # ---------------------------------------------------------------------------
 
 
+_THINK_RE = re.compile(r"<think>.*?</think>", re.DOTALL)
+# Think blocks and markdown fences, stripped in one pass
+_NOISE_RE = re.compile(r"<think>.*?</think>|```(?:json)?\s*", re.DOTALL)
+_WORD_RE = re.compile(r"\w+")
+_MAX_JSON_CANDIDATES = 5
+# The only characters that matter to the bracket scan
+_JSON_SYNTAX_RE = re.compile(r'[{}\[\]"\\]')
+# A JSON string (kept as is) or a comma before a closing bracket
+_TRAILING_COMMA_RE = re.compile(r'"(?:[^"\\]|\\.)*"|,(?=\s*[}\]])')
+
+
+def _balanced_end(text: str, start: int) -> int:
+    """Index of the bracket closing the one at text[start], or -1.
+
+    One forward pass tracking nesting depth; brackets inside JSON strings
+    are skipped. The regex jumps between syntax characters, so runs of
+    ordinary text are skipped in C rather than stepped through in Python.
+    """
+    depth = 0
+    in_string = False
+    skip = -1  # position escaped by a preceding backslash
+    for m in _JSON_SYNTAX_RE.finditer(text, start):
+        i = m.start()
+        if i == skip:
+            continue
+        ch = text[i]
+        if in_string:
+            if ch == "\\":
+                skip = i + 1
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{" or ch == "[":
+            depth += 1
+        elif ch == "}" or ch == "]":
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+
+def _json_candidates(text: str):
+    """Yield balanced {...} / [...] spans, earliest first.
+
+    The first opener through the last closer comes first: for the usual
+    single value wrapped in prose it is the answer, and it's checked by one
+    C-level parse instead of a bracket scan. (If it parses, it's the same
+    span the scan would find.)
+    """
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        return
+    end = max(text.rfind("}"), text.rfind("]"))
+    if end > min(starts):
+        yield text[min(starts) : end + 1]
+    pos = 0
+    for _ in range(_MAX_JSON_CANDIDATES):
+        starts = [i for i in (text.find("{", pos), text.find("[", pos)) if i != -1]
+        if not starts:
+            return
+        start = min(starts)
+        end = _balanced_end(text, start)
+        if end == -1:
+            return
+        yield text[start : end + 1]
+        pos = start + 1
+
+
 def parse_json_output(text: str) -> Any:
     """Extract JSON from LLM output, stripping think tags and markdown fences."""
-    text = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL)
-    text = re.sub(r"```json\s*", "", text)
-    text = re.sub(r"```\s*", "", text)
-    match = re.search(r"(\[.*\]|\{.*\})", text, re.DOTALL)
-    if match:
-        text = match.group(0)
+    # JSON-mode answers are bare JSON: parse before any regex pass
     try:
-        return json.loads(text)
-    except json.JSONDecodeError:
-        return {}
+        return _json_loads(text)
+    except ValueError:
+        pass
+    # Surrounding whitespace doesn't stop a parse, so without think tags or
+    # fences there is nothing to retry before scanning for a span
+    if "<think>" in text or "```" in text:
+        text = _NOISE_RE.sub("", text)
+        try:
+            return _json_loads(text)
+        except ValueError:
+            pass
+    # Prose around the JSON: try each balanced span in turn
+    for candidate in _json_candidates(text):
+        try:
+            return _json_loads(candidate)
+        except ValueError:
+            pass
+        # Trailing commas are the usual slip in smaller models' JSON;
+        # recovering the answer saves the cascade an escalation
+        repaired = _TRAILING_COMMA_RE.sub(_keep_strings, candidate)
+        if repaired != candidate:
+            try:
+                return _json_loads(repaired)
+            except ValueError:
+                pass
+    return {}
+
+
+def _keep_strings(m: re.Match) -> str:
+    return "" if m.group() == "," else m.group()
+
+
+class _JsonParser(BaseOutputParser[Any]):
+    """Chain stage running parse_json_output on the model's answer."""
+
+    def parse(self, text: str) -> Any:
+        return parse_json_output(text)
+
+    @property
+    def _type(self) -> str:
+        return "maven_json"
+
+
+_TEXT_PARSER = StrOutputParser()
+_JSON_PARSER = _JsonParser()
+
+
+class _JsonArrayStream:
+    """Incrementally pull finished objects out of a streamed ``{"key": [...]}``.
+
+    feed() takes each new chunk of LLM output and returns ``(position, obj)``
+    for every array element that has closed since the last call, so callers
+    can act on early elements while later ones are still being generated.
+    """
+
+    def __init__(self, key: str):
+        self._marker = f'"{key}"'
+        self._buf = ""
+        self._pos = -1  # scan position inside the array, -1 until it opens
+        self._count = 0
+        self._done = False
+
+    def feed(self, chunk: str) -> list[tuple[int, Any]]:
+        self._buf += chunk
+        if self._done:
+            return []
+        if self._pos == -1 and not self._open_array():
+            return []
+        items = []
+        buf = self._buf
+        while True:
+            i = self._pos
+            while i < len(buf) and (buf[i].isspace() or buf[i] == ","):
+                i += 1
+            if i >= len(buf):
+                break
+            if buf[i] != "{":
+                self._done = buf[i] == "]"
+                break
+            end = _balanced_end(buf, i)
+            if end == -1:
+                break
+            try:
+                items.append((self._count, _json_loads(buf[i : end + 1])))
+            except ValueError:
+                pass
+            self._count += 1
+            self._pos = end + 1
+        return items
+
+    def _open_array(self) -> bool:
+        start = 0
+        if "<think>" in self._buf:
+            close = self._buf.find("</think>")
+            if close == -1:
+                return False
+            start = close
+        key = self._buf.find(self._marker, start)
+        bracket = self._buf.find("[", key) if key != -1 else -1
+        if bracket == -1:
+            return False
+        self._pos = bracket + 1
+        return True
 
 
 def _get_required_env(name: str, provider: str) -> str:
@@ -35,11 +223,114 @@ def _get_required_env(name: str, provider: str) -> str:
     return value
 
 
-def _create_llm():
+_PROVIDER_ENV = {
+    "gemini": ("GEMINI_MODEL", "GEMINI_API_KEY"),
+    "groq": ("GROQ_MODEL", "GROQ_API_KEY"),
+}
+
+
+def _llm_provider() -> str:
     provider = os.getenv("LLM_PROVIDER", "").strip().lower()
-    if provider not in {"gemini", "groq"}:
+    if provider not in _PROVIDER_ENV:
         raise ValueError("LLM_PROVIDER must be set to either 'gemini' or 'groq'")
+    for name in _PROVIDER_ENV[provider]:
+        _get_required_env(name, provider)
+    return provider
+
+
+# Misconfiguration still fails at import; the client itself (and its
+# provider SDK import) is only built on first use.
+LLM_PROVIDER = _llm_provider()
+
+
+# Completions are cached in the app database keyed on (prompt, model
+# params), so a repeated prompt (same query and search results) costs a
+# lookup instead of a generation. LLM_CACHE=0 turns it off. Streamed calls
+# bypass it; their results are cached at the pipeline level instead.
+LLM_CACHE = os.getenv("LLM_CACHE", "1").strip() != "0"
+LLM_CACHE_TTL = 24 * 60 * 60
+
+
+class _CheckpointLLMCache(BaseCache):
+    """LangChain LLM cache on a CheckpointStore.
+
+    Saves go through the store's writer thread, so a generation returns
+    without waiting on a database commit; entries expire after
+    LLM_CACHE_TTL and are pruned with the other checkpoints.
+    """
+
+    def __init__(self):
+        self._store = CheckpointStore("llm", max_age=LLM_CACHE_TTL)
+
+    def lookup(self, prompt: str, llm_string: str):
+        row = self._store.load(content_key([prompt, llm_string]))
+        if row is None or time.time() - row[1] > LLM_CACHE_TTL:
+            return None
+        return [lc_loads(gen) for gen in row[0]]
+
+    def update(self, prompt: str, llm_string: str, return_val) -> None:
+        self._store.save(
+            content_key([prompt, llm_string]), [lc_dumps(gen) for gen in return_val]
+        )
+
+    def clear(self, **kwargs: Any) -> None:
+        pass  # entries expire on their own
+
+
+@functools.cache
+def _enable_llm_cache() -> None:
+    # once per process: every LLM getter calls this, and they share one cache
+    try:
+        from langchain_core.globals import set_llm_cache
+
+        set_llm_cache(_CheckpointLLMCache())
+    except Exception as e:
+        print(f"[llm-cache] disabled: {e}")
 
+
+@functools.cache
+def get_default_llm():
+    """The process-wide chat model, created on first call."""
+    if LLM_CACHE:
+        _enable_llm_cache()
+    model_env = _PROVIDER_ENV[LLM_PROVIDER][0]
+    return _make_llm(_get_required_env(model_env, LLM_PROVIDER))
+
+
+@functools.cache
+def get_cheap_llm():
+    """Smaller model for the cascade's first try, or None if not configured.
+
+    Set GEMINI_CHEAP_MODEL / GROQ_CHEAP_MODEL (e.g. llama-3.1-8b-instant)
+    for the selected provider to enable it.
+    """
+    model = os.getenv(f"{LLM_PROVIDER.upper()}_CHEAP_MODEL", "").strip()
+    if not model:
+        return None
+    if LLM_CACHE:
+        _enable_llm_cache()
+    return _make_llm(model)
+
+
+# Prompts that answer with a JSON object run on a copy of the model in the
+# provider's JSON mode, so the answer always parses on the first loads()
+# with no prose, fences or think tags to generate and strip. LLM_JSON_MODE=0
+# turns it off (e.g. for a model without JSON mode support).
+LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "1").strip() != "0"
+
+
+@functools.cache
+def get_json_llm():
+    """The default model constrained to JSON-object output."""
+    if not LLM_JSON_MODE:
+        return get_default_llm()
+    get_default_llm()  # same setup (LLM cache) as the default model
+    model_env = _PROVIDER_ENV[LLM_PROVIDER][0]
+    return _make_llm(_get_required_env(model_env, LLM_PROVIDER), json_mode=True)
+
+
+def _make_llm(model: str, json_mode: bool = False):
+    provider = LLM_PROVIDER
     if provider == "gemini":
         try:
             from langchain_google_genai import ChatGoogleGenerativeAI
@@ -50,8 +341,9 @@ def _create_llm():
             ) from exc
 
         return ChatGoogleGenerativeAI(
-            model=_get_required_env("GEMINI_MODEL", provider),
+            model=model,
             google_api_key=_get_required_env("GEMINI_API_KEY", provider),
+            **({"response_mime_type": "application/json"} if json_mode else {}),
         )
 
     # groq
@@ -64,12 +356,185 @@ def _create_llm():
         ) from exc
 
     return ChatGroq(
-        model=_get_required_env("GROQ_MODEL", provider),
+        model=model,
         groq_api_key=_get_required_env("GROQ_API_KEY", provider),
+        **(
+            {"model_kwargs": {"response_format": {"type": "json_object"}}}
+            if json_mode else {}
+        ),
     )
 
 
-default_llm = _create_llm()
+# Cap on LLM requests in flight, so a burst of concurrent searches queues
+# here instead of tripping provider rate limits (429s that then cost a
+# retry with backoff). Sync calls from worker threads share the threading
+# semaphore; async calls wait on a per-loop asyncio one, so a queued
+# coroutine never parks a thread the slot holders may need.
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+_llm_slots = threading.BoundedSemaphore(LLM_CONCURRENCY)
+_loop_llm_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _allm_slots() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    slots = _loop_llm_slots.get(loop)
+    if slots is None:
+        slots = _loop_llm_slots[loop] = asyncio.Semaphore(LLM_CONCURRENCY)
+    return slots
+
+
+# Requests per minute, per provider; 0 disables. Defaults sit under the
+# free-tier ceilings and can be raised for paid plans.
+LLM_RPM = float(os.getenv("LLM_RPM", "120"))
+TAVILY_RPM = float(os.getenv("TAVILY_RPM", "50"))
+_llm_limiter = RateLimiter("llm", LLM_RPM)
+_tavily_limiter = RateLimiter("tavily", TAVILY_RPM)
+
+
+class _SlottedChain:
+    """A chain whose calls each hold one of the shared LLM slots."""
+
+    def __init__(self, runnable):
+        self.runnable = runnable
+
+    def invoke(self, inputs, config=None):
+        _llm_limiter.acquire()
+        with _llm_slots:
+            return self.runnable.invoke(inputs, config)
+
+    async def ainvoke(self, inputs, config=None):
+        await _llm_limiter.aacquire()
+        async with _allm_slots():
+            return await self.runnable.ainvoke(inputs, config)
+
+    async def astream(self, inputs, config=None):
+        await _llm_limiter.aacquire()
+        async with _allm_slots():
+            async for chunk in self.runnable.astream(inputs, config):
+                yield chunk
+
+    def batch(self, inputs: list, config=None, **kwargs) -> list:
+        """Runnable.batch, with each element holding its own slot."""
+        return self._per_item.batch(inputs, config, **kwargs)
+
+    async def abatch(self, inputs: list, config=None, **kwargs) -> list:
+        return await self._per_item.abatch(inputs, config, **kwargs)
+
+    @functools.cached_property
+    def _per_item(self):
+        return RunnableLambda(self.invoke, afunc=self.ainvoke)
+
+
+class _LLMAgent:
+    """Base for agents backed by the default LLM unless one is assigned."""
+
+    _llm = None
+    # Names of prompts whose answer is a single JSON object (see get_json_llm)
+    _JSON_PROMPTS: tuple[str, ...] = ()
+
+    @property
+    def llm(self):
+        return self._llm or get_default_llm()
+
+    @llm.setter
+    def llm(self, value) -> None:
+        self._llm = value
+
+    def _chain(self, prompt: ChatPromptTemplate, llm=None, parser=_TEXT_PARSER):
+        """``prompt | llm | parser``, built once per prompt, model and parser.
+
+        Prompts are class attributes compiled at import, and chains are
+        shared module-wide, so every instance of an agent reuses them. The
+        cached chain holds its model, so ids stay unique while the entry
+        exists. Calls go through _SlottedChain, bounded by LLM_CONCURRENCY.
+        Unless a model is given or assigned, _JSON_PROMPTS use get_json_llm.
+        """
+        if llm is None:
+            llm = self._llm or (
+                get_json_llm() if self._is_json_prompt(prompt) else get_default_llm()
+            )
+        key = (id(prompt), id(llm), id(parser))
+        chain = _CHAINS.get(key)
+        if chain is None:
+            chain = _CHAINS[key] = _SlottedChain(prompt | llm | parser)
+        return chain
+
+    def _json_chain(self, prompt: ChatPromptTemplate, llm=None):
+        """_chain whose calls return the answer's parsed JSON (see parse_json_output)."""
+        return self._chain(prompt, llm, _JSON_PARSER)
+
+    def _cascade(
+        self, prompt: ChatPromptTemplate, inputs: dict, accept: Callable[[Any], bool]
+    ) -> Any:
+        """Parsed JSON answer, from the cheap model if ``accept`` passes it.
+
+        Escalates to the agent's model when no cheap model is configured
+        (or a specific model was assigned), the cheap call fails, or its
+        answer doesn't parse into something ``accept`` takes.
+        """
+        cheap = None if self._llm else get_cheap_llm()
+        if cheap is not None:
+            try:
+                raw = self._json_chain(prompt, cheap).invoke(inputs)
+                if self._accepted(raw, accept):
+                    return raw
+            except Exception as e:
+                self._escalating(f"cheap model failed ({e})")
+        return self._json_chain(prompt).invoke(inputs)
+
+    async def _acascade(
+        self, prompt: ChatPromptTemplate, inputs: dict, accept: Callable[[Any], bool]
+    ) -> Any:
+        """_cascade with non-blocking LLM calls."""
+        cheap = None if self._llm else get_cheap_llm()
+        if cheap is not None:
+            try:
+                raw = await self._json_chain(prompt, cheap).ainvoke(inputs)
+                if self._accepted(raw, accept):
+                    return raw
+            except Exception as e:
+                self._escalating(f"cheap model failed ({e})")
+        return await self._json_chain(prompt).ainvoke(inputs)
+
+    def _accepted(self, raw: Any, accept: Callable[[Any], bool]) -> bool:
+        if accept(raw):
+            return True
+        self._escalating("cheap answer rejected")
+        return False
+
+    def _escalating(self, reason: str) -> None:
+        print(f"[cascade] {type(self).__name__}: {reason}, escalating")
+
+    @classmethod
+    def _is_json_prompt(cls, prompt: ChatPromptTemplate) -> bool:
+        return any(getattr(cls, name) is prompt for name in cls._JSON_PROMPTS)
+
+    @classmethod
+    def _prompts(cls) -> list[ChatPromptTemplate]:
+        return [v for v in vars(cls).values() if isinstance(v, ChatPromptTemplate)]
+
+
+_CHAINS: dict[tuple[int, int, int], _SlottedChain] = {}
+
+
+def _all_agent_classes(cls=_LLMAgent):
+    for sub in cls.__subclasses__():
+        yield sub
+        yield from _all_agent_classes(sub)
+
+
+def _prebuild_chains() -> None:
+    """Compose every agent prompt with its model (and the cheap one) ahead of use."""
+    cheap = get_cheap_llm()
+    for cls in _all_agent_classes():
+        agent = cls()
+        for prompt in cls._prompts():
+            for parser in (_TEXT_PARSER, _JSON_PARSER):
+                agent._chain(prompt, parser=parser)
+                if cheap is not None:
+                    agent._chain(prompt, cheap, parser)
 
 # ---------------------------------------------------------------------------
 # Tavily - prefer raw client for richer results, fall back to langchain tool
@@ -79,17 +544,61 @@ _tavily_api_key = os.getenv("TAVILY_API_KEY", "").strip()
 if not _tavily_api_key:
     raise ValueError("TAVILY_API_KEY environment variable is required")
 
-_tavily_client = None
-try:
-    from tavily import TavilyClient
 
-    _tavily_client = TavilyClient(api_key=_tavily_api_key)
-except ImportError:
-    pass
+@functools.cache
+def _get_tavily_client():
+    """Raw Tavily client (created on first call), or None if not installed."""
+    try:
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        from tavily import TavilyClient
+    except ImportError:
+        return None
+    # requests' default pool keeps 10 connections per host; concurrent agent
+    # searches overflowed it and re-handshook with the API on every call.
+    # A failed connect is retried here, on the connection, rather than by
+    # re-running the whole agent call; read errors and statuses are not
+    # (searches are POSTs and may already have been billed).
+    session = requests.Session()
+    session.mount(
+        "https://",
+        HTTPAdapter(
+            pool_maxsize=32,
+            max_retries=Retry(total=2, read=0, status=0, backoff_factor=0.2),
+        ),
+    )
+    return TavilyClient(api_key=_tavily_api_key, session=session)
+
 
-from langchain_tavily import TavilySearch as _LCTavilySearch
+@functools.cache
+def _get_lc_tavily():
+    from langchain_tavily import TavilySearch
 
-_lc_tavily = _LCTavilySearch(max_results=5)
+    return TavilySearch(max_results=5)
+
+
+SEARCH_CACHE_TTL = 60 * 60
+# Searches asking about the moment aren't cached: an hour-old answer to
+# "deals today" is a wrong answer
+_TIME_SENSITIVE_RE = re.compile(
+    r"\b(?:today|tonight|right now|this week(?:end)?|flash sale|live)\b", re.IGNORECASE
+)
+# A product's image doesn't change, and names repeat across users and
+# sessions, so found images are kept for a week and survive restarts
+IMAGE_CACHE_TTL = 7 * 24 * 60 * 60
+_search_results_cache = TTLCache(
+    maxsize=512, ttl=SEARCH_CACHE_TTL,
+    store=CheckpointStore("tavily", max_age=SEARCH_CACHE_TTL),
+)
+_image_cache = TTLCache(
+    maxsize=1024, ttl=IMAGE_CACHE_TTL,
+    store=CheckpointStore("images", max_age=IMAGE_CACHE_TTL),
+)
+
+# Lets one agent call issue independent searches concurrently. tavily_search
+# never raises, so callers can .result() without extra handling.
+_search_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="tavily")
 
 
 def tavily_search(
@@ -98,27 +607,77 @@ def tavily_search(
     search_depth: str = "advanced",
     include_images: bool = False,
 ) -> dict:
-    """Unified Tavily search returning {results: [...], images: [...]}."""
-    if _tavily_client:
+    """Unified Tavily search returning {results: [...], images: [...]}.
+
+    Repeats of the same (normalized) search are served from the cache (in
+    memory, backed by the checkpoint store) for SEARCH_CACHE_TTL; agents
+    often search overlapping product queries. Time-sensitive queries are
+    always searched afresh.
+    """
+    if _TIME_SENSITIVE_RE.search(query):
+        return _tavily_search_uncached(query, max_results, search_depth, include_images)
+    return _search_results_cache.get_or_call(
+        cache_key(query, max_results, search_depth, include_images),
+        _tavily_search_uncached, query, max_results, search_depth, include_images,
+        should_cache=lambda data: bool(data.get("results")),
+    )
+
+
+def _tavily_search_uncached(
+    query: str, max_results: int, search_depth: str, include_images: bool
+) -> dict:
+    client = _get_tavily_client()
+    if client:
         try:
-            return _tavily_client.search(
-                query=query,
-                search_depth=search_depth,
-                include_images=include_images,
-                max_results=max_results,
+            _tavily_limiter.acquire()
+            return _compact_search(
+                client.search(
+                    query=query,
+                    search_depth=search_depth,
+                    include_images=include_images,
+                    max_results=max_results,
+                )
             )
         except Exception as e:
             print(f"[tavily-client] error: {e}")
 
     # Fallback - langchain wrapper (no images, string output)
     try:
-        text = _lc_tavily.invoke({"query": query})
+        _tavily_limiter.acquire()
+        text = _get_lc_tavily().invoke({"query": query})
         return {"results": [{"content": text, "url": "", "title": ""}], "images": []}
     except Exception as e:
         print(f"[tavily-lc] error: {e}")
         return {"results": [], "images": []}
 
 
+# Only these result fields are read downstream. Dropping score, raw_content
+# and the like keeps the cached and checkpointed payloads small.
+_RESULT_FIELDS = ("url", "title", "content")
+_WS_RE = re.compile(r"\s+")
+
+
+def _compact_search(data: dict) -> dict:
+    return {
+        "results": [
+            {k: r.get(k, "") for k in _RESULT_FIELDS}
+            for r in data.get("results", [])
+            if isinstance(r, dict)
+        ],
+        "images": data.get("images", []),
+    }
+
+
+def _snippet(result: dict, limit: int) -> str:
+    """A result's content for a prompt: whitespace collapsed, cut to limit.
+
+    Page extracts are full of newline and indentation runs that cost
+    tokens and tell the model nothing.
+    """
+    text = (result.get("content") or "")[: limit * 2]
+    return _WS_RE.sub(" ", text).strip()[:limit]
+
+
 # ---------------------------------------------------------------------------
 # Web-scraping utilities
 # ---------------------------------------------------------------------------
@@ -136,6 +695,80 @@ _SCRAPER_HEADERS = {
     "Accept-Language": "en-US,en;q=0.9",
 }
 
+# One pooled client for all scraping, so repeat visits to the same retailer
+# reuse the TCP/TLS connection instead of handshaking on every page. With
+# h2 installed, concurrent scrapes of one retailer (the candidates' buy and
+# comparison links) also share a single multiplexed HTTP/2 connection.
+# Connections that fail to open are retried by the transport (httpx only
+# retries connect errors, so a request is never sent twice).
+_HTTP_CONNECT_RETRIES = 1
+_HTTP_LIMITS = httpx.Limits(
+    max_connections=32, max_keepalive_connections=16, keepalive_expiry=30.0
+)
+try:
+    import h2  # noqa: F401  (httpx's optional HTTP/2 support)
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+_http_client: httpx.Client | None = None
+# Page fetches fanned out by a single agent call (scrape_page_metadata
+# never raises, so callers can .result() without extra handling)
+_scrape_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="scrape")
+# Retailer pages one price lookup keeps in flight (see PriceComparisonAgent)
+_SCRAPE_WINDOW = 2
+_http_client_lock = threading.Lock()
+
+
+def get_http_client() -> httpx.Client:
+    """Return the shared scraping client, creating it on first use."""
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                _http_client = httpx.Client(
+                    follow_redirects=True,
+                    headers=_SCRAPER_HEADERS,
+                    transport=httpx.HTTPTransport(
+                        limits=_HTTP_LIMITS, http2=HTTP2, retries=_HTTP_CONNECT_RETRIES
+                    ),
+                )
+    return _http_client
+
+
+@atexit.register
+def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        _http_client.close()
+        _http_client = None
+    shutdown_pool()
+
+
+def warmup() -> None:
+    """Pay one-time scraping costs up front instead of on the first request.
+
+    Builds the LLM and Tavily clients and every agent's chain, starts the
+    HTML parse workers, builds the pooled HTTP client (and its SSL context)
+    and opens a connection to the Tavily API host. Every step is
+    best-effort; failures are logged and ignored.
+    """
+    start = time.monotonic()
+    try:
+        get_default_llm()
+        _prebuild_chains()
+        _get_tavily_client()
+    except Exception as e:
+        print(f"[warmup] clients: {e}")
+    try:
+        warm_pool()
+    except Exception as e:
+        print(f"[warmup] parser: {e}")
+    try:
+        get_http_client().head("https://api.tavily.com", timeout=3.0)
+    except Exception as e:
+        print(f"[warmup] http: {e}")
+    print(f"[warmup] done in {time.monotonic() - start:.2f}s")
+
 
 def scrape_page_metadata(
     url: str,
@@ -154,215 +787,106 @@ def scrape_page_metadata(
     }
     if not url or not url.startswith("http"):
         return data
-    try:
-        from bs4 import BeautifulSoup
-    except ImportError:
-        print("Warning: beautifulsoup4 not installed - scraping disabled")
+    if not HAVE_LXML:
+        print("Warning: lxml not installed - scraping disabled")
         return data
 
     try:
-        with httpx.Client(
-            follow_redirects=True, timeout=timeout, headers=_SCRAPER_HEADERS
-        ) as client:
-            resp = client.get(url)
-            if resp.status_code >= 400:
-                return data
-            html = resp.text
-            soup = BeautifulSoup(html, "lxml")
-
-            # -- Title --
-            tag = soup.find("meta", property="og:title")
-            if tag and tag.get("content"):
-                data["title"] = tag["content"]
-            elif soup.title and soup.title.string:
-                data["title"] = soup.title.string.strip()
-
-            # -- Detect listing / multi-product page --
-            is_listing = _detect_listing_page(html, soup)
-            if is_listing:
-                data["is_single_product"] = False
-                # On a listing page, only return canonical URL / title — not
-                # image or price, because they belong to the page, not our product.
-                canon = soup.find("link", rel="canonical")
-                if canon and canon.get("href"):
-                    data["url"] = canon["href"]
-                return data
-
-            # -- If target_product_name given, verify title matches --
-            title_matches = True
-            if target_product_name and data["title"]:
-                title_matches = _product_name_matches_title(
-                    target_product_name, data["title"]
-                )
+        html = _fetch_html(url, timeout)
+        if html is None:
+            return data
+        return run_parser(parse_product_metadata, html, url, target_product_name)
+    except Exception as e:
+        print(f"[scraper] {url}: {e}")
 
-            data["is_single_product"] = True
+    return data
 
-            # -- Image (only if title matches) --
-            if title_matches:
-                for prop in ("og:image", "og:image:url"):
-                    tag = soup.find("meta", property=prop)
-                    if tag and tag.get("content", "").startswith("http"):
-                        data["image_url"] = tag["content"]
-                        break
-                if not data["image_url"]:
-                    tag = soup.find("meta", attrs={"name": "twitter:image"})
-                    if tag and tag.get("content", "").startswith("http"):
-                        data["image_url"] = tag["content"]
-
-            # -- Price (meta, only if title matches) --
-            if title_matches:
-                for prop in ("og:price:amount", "product:price:amount"):
-                    tag = soup.find("meta", property=prop)
-                    if tag and tag.get("content"):
-                        data["price"] = tag["content"]
-                        break
 
-            # -- Price (JSON-LD, with product-name guard) --
-            if not data["price"]:
-                for script in soup.find_all("script", type="application/ld+json"):
-                    try:
-                        ld = json.loads(script.string or "")
-                        if isinstance(ld, list):
-                            ld = ld[0] if ld else {}
-                        ld_type = str(ld.get("@type", "")).lower()
-                        # Skip non-product schemas
-                        if ld_type not in (
-                            "product", "offer", "indivproduct",
-                        ):
-                            continue
-                        # If we have a target name, verify JSON-LD name matches
-                        ld_name = ld.get("name", "")
-                        if target_product_name and ld_name:
-                            if not _product_name_matches_title(
-                                target_product_name, ld_name
-                            ):
-                                continue
-                        offers = ld.get("offers", ld.get("Offers", {}))
-                        if isinstance(offers, list):
-                            offers = offers[0] if offers else {}
-                        if isinstance(offers, dict):
-                            pv = offers.get("price") or offers.get("lowPrice")
-                            if pv:
-                                data["price"] = str(pv)
-                                break
-                    except Exception:
-                        continue
+# Price comparison and link verification scrape the same retailer pages
+# within a run, and repeat runs of a query revisit them; a fetched page is
+# reused for a few minutes (few entries: pages run to hundreds of KB).
+PAGE_CACHE_TTL = 15 * 60
+_page_cache = TTLCache(maxsize=64, ttl=PAGE_CACHE_TTL)
 
-            # -- Canonical URL --
-            canon = soup.find("link", rel="canonical")
-            if canon and canon.get("href"):
-                data["url"] = canon["href"]
-    except Exception as e:
-        print(f"[scraper] {url}: {e}")
 
-    return data
+def _fetch_html(url: str, timeout: float) -> str | None:
+    """The page's HTML, or None for an error status or a non-HTML response.
 
+    Served from _page_cache when the URL was fetched recently; concurrent
+    fetches of one URL share a single request.
+    """
+    return _page_cache.get_or_call(url, _fetch_html_uncached, url, timeout)
 
-def _detect_listing_page(html: str, soup) -> bool:
-    """Detect whether an HTML page is a listing/category page with multiple products.
 
-    Checks: multiple add-to-cart buttons, ItemList/CollectionPage JSON-LD,
-    product-grid CSS patterns, and <h1> content.
+# Everything the parsers read (meta tags, JSON-LD, the first screens of
+# product cards) sits well inside this; the rest of an oversized page is
+# never downloaded.
+MAX_PAGE_BYTES = 3 * 1024 * 1024
+
+
+def _fetch_html_uncached(url: str, timeout: float) -> str | None:
+    """_fetch_html without the cache.
+
+    The status and Content-Type are checked before the body is read, so a
+    search hit that turns out to be a PDF, image or video is dropped after
+    its headers instead of being downloaded and parsed. The body is read
+    up to MAX_PAGE_BYTES.
     """
-    html_lower = html.lower()
+    with get_http_client().stream("GET", url, timeout=timeout) as resp:
+        if resp.status_code >= 400:
+            return None
+        content_type = resp.headers.get("Content-Type", "").lower()
+        if content_type and "html" not in content_type and "xml" not in content_type:
+            return None
+        chunks: list[bytes] = []
+        size = 0
+        for chunk in resp.iter_bytes():
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= MAX_PAGE_BYTES:
+                print(f"[scrape] {url}: page truncated at {MAX_PAGE_BYTES} bytes")
+                break
+        body = b"".join(chunks)[:MAX_PAGE_BYTES]
+        return body.decode(resp.encoding or "utf-8", errors="replace")
 
-    # 1. Count "add to cart" / "buy now" occurrences — a product page has ~1,
-    #    a listing page has many.
-    atc_signals = [
-        "add to cart", "add-to-cart", "addtocart",
-        "add to bag", "add to basket",
-    ]
-    atc_count = sum(html_lower.count(s) for s in atc_signals)
-    if atc_count > 3:
-        return True
 
-    # 2. JSON-LD types that mean "listing" not "single product"
-    for script in soup.find_all("script", type="application/ld+json"):
-        try:
-            ld = json.loads(script.string or "")
-            if isinstance(ld, list):
-                # Multiple Product objects in one JSON-LD block → listing
-                product_count = sum(
-                    1 for item in ld
-                    if isinstance(item, dict)
-                    and str(item.get("@type", "")).lower() == "product"
-                )
-                if product_count > 1:
-                    return True
-                ld = ld[0] if ld else {}
-            ld_type = str(ld.get("@type", "")).lower()
-            if ld_type in (
-                "itemlist", "collectionpage", "searchresultspage",
-                "offerlist", "breadcrumblist",
-            ):
-                # BreadcrumbList alone is fine on product pages — only flag if
-                # it's the ONLY LD+JSON block (no Product block found)
-                if ld_type != "breadcrumblist":
-                    return True
-            # Check for itemListElement with many entries
-            items = ld.get("itemListElement", [])
-            if isinstance(items, list) and len(items) > 3:
-                return True
-        except Exception:
-            continue
+_RASTER_IMAGE_RE = re.compile(r"\.(?:jpe?g|png|webp)(?:$|[?#])", re.IGNORECASE)
 
-    # 3. CSS class patterns typical of product grids
-    grid_patterns = [
-        'class="product-grid', 'class="product-list',
-        'class="products-grid', 'class="products-list',
-        'class="search-results', 'class="collection-products',
-        'data-product-grid', 'product-card',
-    ]
-    grid_hits = sum(1 for p in grid_patterns if p in html_lower)
-    if grid_hits >= 2:
-        return True
 
-    # 4. Count separate product-card-like elements
-    product_cards = soup.find_all(
-        class_=re.compile(
-            r"product[-_]?card|product[-_]?tile|product[-_]?item",
-            re.IGNORECASE,
-        )
-    )
-    if len(product_cards) > 2:
-        return True
+def _image_urls(urls) -> list[str]:
+    """Absolute http(s) URLs, plain photo files first.
 
-    return False
+    Search image results mix product shots with SVG logos, GIF spinners and
+    extension-less tracking URLs; a .jpg/.png/.webp is the safer pick.
+    """
+    urls = [u for u in urls if isinstance(u, str) and u.startswith("http")]
+    return sorted(urls, key=lambda u: not _RASTER_IMAGE_RE.search(u))
 
 
 def _search_images_tavily(product_name: str) -> list[str]:
     """Return product image URLs via Tavily include_images."""
-    if not _tavily_client:
-        return []
-    try:
-        res = _tavily_client.search(
-            query=f"{product_name} product image",
-            search_depth="basic",
-            include_images=True,
-            max_results=3,
-        )
-        return [
-            img
-            for img in res.get("images", [])
-            if isinstance(img, str) and img.startswith("http")
-        ][:5]
-    except Exception as e:
-        print(f"[tavily-img] {product_name}: {e}")
-        return []
+    if not _get_tavily_client():
+        return []  # the langchain fallback returns no images
+    res = tavily_search(
+        query=f"{product_name} product image",
+        search_depth="basic",
+        include_images=True,
+        max_results=3,
+    )
+    return _image_urls(res.get("images", []))[:5]
 
 
 def _search_images_ddg(product_name: str, max_results: int = 5) -> list[str]:
     """Return product image URLs via DuckDuckGo (free, no API key)."""
     try:
-        from duckduckgo_search import DDGS
+        try:
+            from ddgs import DDGS
+        except ImportError:  # the package's name before v9
+            from duckduckgo_search import DDGS
 
         with DDGS() as ddgs:
-            hits = list(
-                ddgs.images(f"{product_name} product official", max_results=max_results)
-            )
-            return [
-                h["image"] for h in hits if h.get("image", "").startswith("http")
-            ]
+            hits = ddgs.images(f"{product_name} product official", max_results=max_results)
+        return _image_urls(h.get("image") for h in hits)
     except Exception as e:
         print(f"[ddg-img] {product_name}: {e}")
         return []
@@ -374,7 +898,12 @@ def find_product_image(
     """Best-effort product image: scraped -> Tavily -> DuckDuckGo."""
     if scraped_image and scraped_image.startswith("http"):
         return scraped_image
+    return _image_cache.get_or_call(
+        cache_key(product_name), _search_product_image, product_name
+    )
 
+
+def _search_product_image(product_name: str) -> Optional[str]:
     imgs = _search_images_tavily(product_name)
     if imgs:
         return imgs[0]
@@ -426,6 +955,12 @@ def _default_personalization_questions(query: str) -> list[dict[str, Any]]:
     ]
 
 
+_QUESTION_TYPES = frozenset({"text", "select"})
+_MAX_QUESTIONS = 6
+_MAX_OPTIONS = 8
+_OPTION_TYPES = (str, int, float)
+
+
 def _normalize_questions(raw: Any, query: str) -> list[dict[str, Any]]:
     if not isinstance(raw, list):
         return _default_personalization_questions(query)
@@ -438,52 +973,74 @@ def _normalize_questions(raw: Any, query: str) -> list[dict[str, Any]]:
             continue
         qid = str(item.get("id", "")).strip()
         question = str(item.get("question", "")).strip()
-        qtype = str(item.get("type", "text")).strip() or "text"
-        options = item.get("options", [])
         if not qid or not question or qid in seen:
             continue
-        if qtype not in {"text", "select"}:
-            qtype = "text"
-        if not isinstance(options, list) or qtype != "select":
-            options = []
+        qtype = str(item.get("type", "text")).strip()
+        options = item.get("options")
+        if qtype == "select" and isinstance(options, list):
+            options = [str(o) for o in options if isinstance(o, _OPTION_TYPES)][:_MAX_OPTIONS]
         else:
-            options = [str(o) for o in options if isinstance(o, (str, int, float))][:8]
+            options = []
+            if qtype not in _QUESTION_TYPES:
+                qtype = "text"
         normalized.append(
             {"id": qid, "question": question, "type": qtype, "options": options}
         )
         seen.add(qid)
-        if len(normalized) >= 6:
+        if len(normalized) == _MAX_QUESTIONS:
             break
 
     return normalized or _default_personalization_questions(query)
 
 
-class PersonalizationAgent:
+# Clarifying questions depend on what is being shopped for, not on the
+# phrasing, so near-duplicate queries ('best wireless earbuds' / 'top
+# wireless earbud') share one generation. Only model answers are cached.
+QUESTIONS_CACHE_TTL = 24 * 60 * 60
+_questions_cache = SimilarityCache(maxsize=256, ttl=QUESTIONS_CACHE_TTL)
+
+
+class PersonalizationAgent(_LLMAgent):
     """Generate clarifying questions to personalize product research."""
 
-    def __init__(self):
-        self.llm = default_llm
+    _prompt = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                "You generate short clarifying questions for shopping research.\n"
+                "Return ONLY a JSON array of 4-6 objects with keys: "
+                "id (snake_case), question (string), type (text|select), "
+                "options (array, only if select).\n"
+                "No <think> tags. No commentary. No markdown fences.",
+            ),
+            (
+                "user",
+                "User query: {query}\n\nGenerate 4-6 questions to personalize results.",
+            ),
+        ]
+    )
 
     def generate_questions(self, query: str) -> list[dict[str, Any]]:
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                (
-                    "system",
-                    "You generate short clarifying questions for shopping research.\n"
-                    "Return ONLY a JSON array of 4-6 objects with keys: "
-                    "id (snake_case), question (string), type (text|select), "
-                    "options (array, only if select).\n"
-                    "No <think> tags. No commentary. No markdown fences.",
-                ),
-                (
-                    "user",
-                    "User query: {query}\n\nGenerate 4-6 questions to personalize results.",
-                ),
-            ]
-        )
-        chain = prompt | self.llm | StrOutputParser()
-        raw = parse_json_output(chain.invoke({"query": query}))
-        return _normalize_questions(raw, query)
+        cached = _questions_cache.get(query)
+        if cached is not None:
+            return cached
+        raw = self._json_chain(self._prompt).invoke({"query": query})
+        return self._store_questions(query, raw)
+
+    async def agenerate_questions(self, query: str) -> list[dict[str, Any]]:
+        """generate_questions with a non-blocking LLM call (FastAPI routes)."""
+        cached = _questions_cache.get(query)
+        if cached is not None:
+            return cached
+        raw = await self._json_chain(self._prompt).ainvoke({"query": query})
+        return self._store_questions(query, raw)
+
+    @staticmethod
+    def _store_questions(query: str, raw: Any) -> list[dict[str, Any]]:
+        questions = _normalize_questions(raw, query)
+        if isinstance(raw, list) and questions != _default_personalization_questions(query):
+            _questions_cache.set(query, questions)
+        return questions
 
 
 # ---------------------------------------------------------------------------
@@ -491,17 +1048,44 @@ class PersonalizationAgent:
 # ---------------------------------------------------------------------------
 
 
-class PrimaryResearcherAgent:
+class PrimaryResearcherAgent(_LLMAgent):
     """Identifies top 3 product candidates from web search.
 
     Key design: product URLs come directly from Tavily search results,
     never from LLM generation, so buy-links are always real.
     """
 
-    def __init__(self):
-        self.llm = default_llm
+    _prompt = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                "You are a Product Research Specialist.\n"
+                "Identify the top 3 SPECIFIC products from the numbered search results below.\n\n"
+                "RULES:\n"
+                "1. Use FULL product names (e.g. 'Sony WH-1000XM5', not 'Sony headphones').\n"
+                "2. For each product include the search-result index [0]-[4] that mentions it.\n"
+                "3. Return ONLY a JSON array - no <think> tags, no markdown fences, no commentary.\n\n"
+                'Format: [{{"name": "Full Product Name", "source_index": 0}}, ...]',
+            ),
+            (
+                "user",
+                "User Query: {query}\n\nSearch Results:\n{search_results}",
+            ),
+        ]
+    )
 
     def search_products(self, query: str) -> list[dict]:
+        search_data, inputs, accept = self._search_inputs(query)
+        return self._products(self._cascade(self._prompt, inputs, accept), search_data)
+
+    async def asearch_products(self, query: str) -> list[dict]:
+        """search_products with non-blocking LLM calls (search runs in a thread)."""
+        search_data, inputs, accept = await asyncio.to_thread(self._search_inputs, query)
+        return self._products(
+            await self._acascade(self._prompt, inputs, accept), search_data
+        )
+
+    def _search_inputs(self, query: str) -> tuple[dict, dict, Callable[[Any], bool]]:
         # 1. Broad search
         search_data = tavily_search(
             query=f"best {query} 2025 review comparison",
@@ -510,7 +1094,6 @@ class PrimaryResearcherAgent:
             include_images=True,
         )
         results = search_data.get("results", [])
-        images = search_data.get("images", [])
 
         # 2. Number each result so the LLM can reference them by index
         numbered = []
@@ -518,43 +1101,27 @@ class PrimaryResearcherAgent:
             numbered.append(
                 f"[{i}] Title: {r.get('title', '')}\n"
                 f"    URL: {r.get('url', '')}\n"
-                f"    Snippet: {r.get('content', '')[:600]}"
+                f"    Snippet: {_snippet(r, 500)}"
             )
         search_text = "\n\n".join(numbered)
 
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                (
-                    "system",
-                    "You are a Product Research Specialist.\n"
-                    "Identify the top 3 SPECIFIC products from the numbered search results below.\n\n"
-                    "RULES:\n"
-                    "1. Use FULL product names (e.g. 'Sony WH-1000XM5', not 'Sony headphones').\n"
-                    "2. For each product include the search-result index [0]-[4] that mentions it.\n"
-                    "3. Return ONLY a JSON array - no <think> tags, no markdown fences, no commentary.\n\n"
-                    'Format: [{{"name": "Full Product Name", "source_index": 0}}, ...]',
-                ),
-                (
-                    "user",
-                    "User Query: {query}\n\nSearch Results:\n{search_results}",
-                ),
-            ]
+        # Picking names out of five snippets is easy enough for the cheap
+        # model; escalate only if it didn't name every product it could
+        wanted = min(3, len(results))
+        return (
+            search_data,
+            {"query": query, "search_results": search_text},
+            lambda raw: len(self._candidates(raw)) >= wanted,
         )
-        chain = prompt | self.llm | StrOutputParser()
-        raw = parse_json_output(
-            chain.invoke({"query": query, "search_results": search_text})
-        )
-        if not isinstance(raw, list):
-            raw = raw.get("products", []) if isinstance(raw, dict) else []
+
+    def _products(self, raw: Any, search_data: dict) -> list[dict]:
+        results = search_data.get("results", [])
+        images = search_data.get("images", [])
 
         # 3. Map source_index to real URL
         products: list[dict] = []
-        for item in raw[:3]:
-            if not isinstance(item, dict):
-                continue
-            name = str(item.get("name", "")).strip()
-            if not name:
-                continue
+        for item in self._candidates(raw):
+            name = str(item["name"]).strip()
 
             idx = item.get("source_index")
             url = ""
@@ -578,13 +1145,46 @@ class PrimaryResearcherAgent:
 
         return products
 
+    @staticmethod
+    def _candidates(raw: Any) -> list[dict]:
+        """Up to three named product picks from the model's answer."""
+        if not isinstance(raw, list):
+            raw = raw.get("products", []) if isinstance(raw, dict) else []
+        return [
+            item for item in raw
+            if isinstance(item, dict) and str(item.get("name", "")).strip()
+        ][:3]
+
 
 # ---------------------------------------------------------------------------
 # Product Detail Agent (scrape + analyse in one pass)
 # ---------------------------------------------------------------------------
 
 
-class ProductDetailAgent:
+_DETAIL_FIELDS = (
+    "{{\n"
+    '  "name": "Full product name (corrected if needed)",\n'
+    '  "approximate_price": "numeric string e.g. 299.99 or null if unknown",\n'
+    '  "rating": 4.5,\n'
+    '  "reviews_count": 1234,\n'
+    '  "features": ["feature 1", "feature 2"],\n'
+    '  "pros": ["pro 1", "pro 2", "pro 3"],\n'
+    '  "cons": ["con 1", "con 2"],\n'
+    '  "why_to_buy": "1-2 sentence compelling reason",\n'
+    '  "is_valid_product": true\n'
+    "}}\n\n"
+)
+_DETAIL_RULES = (
+    "RULES:\n"
+    "- rating MUST be a float 1.0-5.0.\n"
+    "- 3-5 features, 3-4 pros, 2-3 cons.\n"
+    "- is_valid_product = false if the product doesn't seem to exist "
+    "or search results are irrelevant.\n"
+    "- Do NOT generate URLs or image links.\n"
+)
+
+
+class ProductDetailAgent(_LLMAgent):
     """Validates primary agent picks and gathers product details.
 
     This agent focuses ONLY on product quality information (features,
@@ -597,10 +1197,20 @@ class ProductDetailAgent:
       3. Returns validation verdict + detail fields
     """
 
-    def __init__(self):
-        self.llm = default_llm
+    _JSON_PROMPTS = ("_prompt", "_batch_prompt")
 
     def gather_details(self, product_name: str) -> dict:
+        inputs = self._analysis_inputs(product_name)
+        return self._build_details(self._json_chain(self._prompt).invoke(inputs), product_name)
+
+    async def agather_details(self, product_name: str) -> dict:
+        """gather_details with a non-blocking LLM call (search runs in a thread)."""
+        inputs = await asyncio.to_thread(self._analysis_inputs, product_name)
+        return self._build_details(
+            await self._json_chain(self._prompt).ainvoke(inputs), product_name
+        )
+
+    def _analysis_inputs(self, product_name: str) -> dict:
         # -- 1. Targeted search for reviews & specs --
         search_data = tavily_search(
             query=f"{product_name} detailed review specs features pros cons",
@@ -609,59 +1219,109 @@ class ProductDetailAgent:
         )
         results = search_data.get("results", [])
 
-        # -- 2. Build context text --
+        # -- 2. Build context text (a per-source cap, so one long page
+        #       can't crowd the other sources out of the budget) --
         content_parts = []
         for r in results:
             content_parts.append(
-                f"Source: {r.get('url', '')}\n{r.get('content', '')}"
+                f"Source: {r.get('url', '')}\n{_snippet(r, 1000)}"
             )
         content_text = "\n\n---\n\n".join(content_parts)[:5000]
+        return {"product_name": product_name, "content": content_text}
+
+    # -- 3. LLM analysis (no URLs, no images) --
+    _prompt = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                "You are a Product Analyst that validates product picks.\n"
+                "Analyse the search content and return a JSON object with these EXACT fields:\n"
+                + _DETAIL_FIELDS
+                + _DETAIL_RULES
+                + "- No <think> tags, no markdown fences, ONLY the JSON object.",
+            ),
+            (
+                "user",
+                "Product to validate: {product_name}\n\n"
+                "Search Content:\n{content}",
+            ),
+        ]
+    )
 
-        # -- 3. LLM analysis (no URLs, no images) --
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                (
-                    "system",
-                    "You are a Product Analyst that validates product picks.\n"
-                    "Analyse the search content and return a JSON object with these EXACT fields:\n"
-                    "{{\n"
-                    '  "name": "Full product name (corrected if needed)",\n'
-                    '  "approximate_price": "numeric string e.g. 299.99 or null if unknown",\n'
-                    '  "rating": 4.5,\n'
-                    '  "reviews_count": 1234,\n'
-                    '  "features": ["feature 1", "feature 2"],\n'
-                    '  "pros": ["pro 1", "pro 2", "pro 3"],\n'
-                    '  "cons": ["con 1", "con 2"],\n'
-                    '  "why_to_buy": "1-2 sentence compelling reason",\n'
-                    '  "is_valid_product": true\n'
-                    "}}\n\n"
-                    "RULES:\n"
-                    "- rating MUST be a float 1.0-5.0.\n"
-                    "- 3-5 features, 3-4 pros, 2-3 cons.\n"
-                    "- is_valid_product = false if the product doesn't seem to exist "
-                    "or search results are irrelevant.\n"
-                    "- Do NOT generate URLs or image links.\n"
-                    "- No <think> tags, no markdown fences, ONLY the JSON object.",
-                ),
-                (
-                    "user",
-                    "Product to validate: {product_name}\n\n"
-                    "Search Content:\n{content}",
-                ),
-            ]
+    _batch_prompt = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                "You are a Product Analyst that validates several product picks at once.\n"
+                "Each numbered product below comes with its own search content. For EACH "
+                "product return an object with these EXACT fields, plus \"index\" (the "
+                "product's number):\n"
+                + _DETAIL_FIELDS
+                + _DETAIL_RULES
+                + "- Analyse each product ONLY from its own search content.\n"
+                '- Return ONLY {{"analyses": [...]}} with one object per product. '
+                "No <think> tags, no markdown fences.",
+            ),
+            ("user", "Products to validate:\n\n{products}"),
+        ]
+    )
+
+    async def agather_details_batch(
+        self,
+        product_names: list[str],
+        on_analysis: Callable[[int, dict], None] | None = None,
+    ) -> list[dict | None]:
+        """Details for several products with a single LLM round-trip.
+
+        Searches run concurrently in threads. Returns one entry per name, in
+        order; None where the model's answer had no usable analysis, so the
+        caller can fall back to gather_details for just those. The answer is
+        streamed, and ``on_analysis(i, details)`` fires as soon as each
+        product's object closes, before the rest has been generated.
+        """
+        inputs = await asyncio.gather(
+            *[asyncio.to_thread(self._analysis_inputs, n) for n in product_names]
         )
-        chain = prompt | self.llm | StrOutputParser()
-        analysis = parse_json_output(
-            chain.invoke(
-                {
-                    "product_name": product_name,
-                    "content": content_text,
-                }
-            )
+        products = "\n\n".join(
+            f"=== [{i}] {item['product_name']} ===\n{item['content']}"
+            for i, item in enumerate(inputs)
         )
+        stream = _JsonArrayStream("analyses")
+        chunks: list[str] = []
+        async for chunk in self._chain(self._batch_prompt).astream({"products": products}):
+            chunks.append(chunk)
+            if on_analysis is None:
+                continue
+            for pos, analysis in stream.feed(chunk):
+                idx = self._analysis_index(analysis, pos)
+                if idx is not None and 0 <= idx < len(product_names):
+                    on_analysis(idx, self._details_from(analysis, product_names[idx]))
+
+        raw = parse_json_output("".join(chunks))
+        analyses = raw.get("analyses", []) if isinstance(raw, dict) else raw
+        by_index: dict[int, dict] = {}
+        for pos, analysis in enumerate(analyses if isinstance(analyses, list) else []):
+            idx = self._analysis_index(analysis, pos)
+            if idx is not None:
+                by_index.setdefault(idx, analysis)
+        return [
+            self._details_from(by_index[i], name) if i in by_index else None
+            for i, name in enumerate(product_names)
+        ]
+
+    @staticmethod
+    def _analysis_index(analysis: Any, pos: int) -> int | None:
         if not isinstance(analysis, dict):
-            analysis = {}
+            return None
+        idx = analysis.get("index", pos)
+        return idx if isinstance(idx, int) else pos
 
+    @classmethod
+    def _build_details(cls, analysis: Any, product_name: str) -> dict:
+        return cls._details_from(analysis if isinstance(analysis, dict) else {}, product_name)
+
+    @staticmethod
+    def _details_from(analysis: dict, product_name: str) -> dict:
         return {
             "name": analysis.get("name", product_name),
             "approximate_price": analysis.get("approximate_price"),
@@ -680,7 +1340,20 @@ class ProductDetailAgent:
 # ---------------------------------------------------------------------------
 
 
-class PriceComparisonAgent:
+# Products whose snippets can't be priced within this many seconds of each
+# other share one LLM call (see PriceComparisonAgent._allm_prices).
+PRICE_BATCH_WINDOW = float(os.getenv("PRICE_BATCH_WINDOW", "0.05"))
+
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _background(task: asyncio.Task) -> None:
+    """Hold a fire-and-forget task until it finishes (the loop only keeps weak refs)."""
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+class PriceComparisonAgent(_LLMAgent):
     """Finds best prices across retailers AND provides the primary buy links/images.
 
     This is the single source of truth for:
@@ -692,98 +1365,236 @@ class PriceComparisonAgent:
 
     Workflow:
       1. Search Tavily for "{product_name}" buy price across retailers
-      2. LLM identifies retailers + prices from search results
+      2. Read retailers + prices off the result snippets (LLM only when
+         fewer than two retailer prices can be parsed locally; concurrent
+         fallbacks share one call)
       3. Scrape top retailer pages → extract image, price, canonical URL
       4. Return all data including the best buy URL and image
     """
 
+    _JSON_PROMPTS = ("_prompt", "_batch_prompt")
+
     def __init__(self):
-        self.llm = default_llm
+        # loop -> [(inputs, future)] waiting for that loop's next price flush
+        self._price_batches: dict[asyncio.AbstractEventLoop, list] = {}
 
     def compare_prices(self, product_name: str, approximate_price: str | None = None) -> dict:
-        # -- 1. Search for buy links --
-        search_data = tavily_search(
-            query=f'"{product_name}" buy price',
-            max_results=5,
-            search_depth="advanced",
-            include_images=True,
+        # -- 1. Search for buy links (general + retailer-targeted, in parallel) --
+        searches = [
+            _search_pool.submit(tavily_search, **kwargs)
+            for kwargs in self._buy_searches(product_name)
+        ]
+        results = self._merge_results([f.result() for f in searches])
+        raw = _extract_prices_from_results(results, product_name)
+        if raw is None:
+            inputs = self._llm_inputs(product_name, results)
+            raw = self._json_chain(self._prompt).invoke(inputs)
+        return self._resolve(raw, product_name, results, approximate_price)
+
+    async def acompare_prices(
+        self, product_name: str, approximate_price: str | None = None
+    ) -> dict:
+        """compare_prices with a non-blocking LLM call.
+
+        Searches and page scrapes are blocking I/O and run in threads.
+        """
+        searches = await asyncio.gather(
+            *[
+                asyncio.to_thread(tavily_search, **kwargs)
+                for kwargs in self._buy_searches(product_name)
+            ]
+        )
+        results = self._merge_results(searches)
+        raw = _extract_prices_from_results(results, product_name)
+        if raw is None:
+            raw = await self._allm_prices(self._llm_inputs(product_name, results))
+        return await asyncio.to_thread(
+            self._resolve, raw, product_name, results, approximate_price
         )
-        results = search_data.get("results", [])
-        search_images = search_data.get("images", [])
 
-        # Also do a targeted retailer search
-        retailer_search = tavily_search(
-            query=f"{product_name} buy site:amazon.com OR site:walmart.com OR site:bestbuy.com OR site:target.com",
-            max_results=5,
-            search_depth="basic",
-            include_images=True,
+    async def _allm_prices(self, inputs: dict) -> Any:
+        """LLM price extraction, shared with other products on this loop.
+
+        Products that miss the snippet parse within PRICE_BATCH_WINDOW of
+        each other are concatenated into one prompt, so a pipeline run
+        makes one price call rather than one per candidate.
+        """
+        loop = asyncio.get_running_loop()
+        batch = self._price_batches.get(loop)
+        if batch is None:
+            batch = self._price_batches[loop] = []
+            loop.call_later(
+                PRICE_BATCH_WINDOW,
+                lambda: _background(loop.create_task(self._flush_prices(loop))),
+            )
+        future = loop.create_future()
+        batch.append((inputs, future))
+        return await future
+
+    async def _flush_prices(self, loop: asyncio.AbstractEventLoop) -> None:
+        batch = self._price_batches.pop(loop, [])
+        if not batch:
+            return
+        futures = [f for _, f in batch]
+        try:
+            if len(batch) == 1:
+                raws = [None]
+            else:
+                raws = await self._abatch_prices([inputs for inputs, _ in batch])
+            # Single product, or ones the batched answer left out
+            missing = [i for i, raw in enumerate(raws) if raw is None]
+            answers = await asyncio.gather(
+                *[self._json_chain(self._prompt).ainvoke(batch[i][0]) for i in missing]
+            )
+            for i, raw in zip(missing, answers):
+                raws[i] = raw
+        except asyncio.CancelledError:
+            for future in futures:
+                future.cancel()
+            raise
+        except Exception as exc:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for future, raw in zip(futures, raws):
+            if not future.done():
+                future.set_result(raw)
+
+    async def _abatch_prices(self, batch: list[dict]) -> list[dict | None]:
+        """Retailer picks for several products from one LLM call.
+
+        One entry per input, in order; None where the answer had none.
+        """
+        products = "\n\n".join(
+            f"=== [{i}] {inputs['product_name']} "
+            f"(results [0]-[{inputs['max_idx']}]) ===\n{inputs['search_results']}"
+            for i, inputs in enumerate(batch)
         )
-        retailer_results = retailer_search.get("results", [])
-        retailer_images = retailer_search.get("images", [])
+        print(f"[price-comp] Extracting prices for {len(batch)} products in one call")
+        raw = await self._json_chain(self._batch_prompt).ainvoke({"products": products})
+        picks = raw.get("products", []) if isinstance(raw, dict) else raw
+        by_index: dict[int, dict] = {}
+        for pos, pick in enumerate(picks if isinstance(picks, list) else []):
+            idx = ProductDetailAgent._analysis_index(pick, pos)
+            if idx is not None:
+                by_index.setdefault(idx, pick)
+        return [by_index.get(i) for i in range(len(batch))]
+
+    @staticmethod
+    def _buy_searches(product_name: str) -> list[dict]:
+        return [
+            {
+                "query": f'"{product_name}" buy price',
+                "max_results": 5,
+                "search_depth": "advanced",
+            },
+            {
+                "query": f"{product_name} buy site:amazon.com OR site:walmart.com OR site:bestbuy.com OR site:target.com",
+                "max_results": 5,
+                "search_depth": "basic",
+            },
+        ]
 
-        # Merge results (dedup by URL)
+    @staticmethod
+    def _merge_results(searches: list[dict]) -> list[dict]:
+        """Tavily results from all searches, deduplicated by URL."""
         seen_urls: set[str] = set()
         all_results = []
-        for r in results + retailer_results:
-            url = r.get("url", "")
-            if url and url not in seen_urls:
-                seen_urls.add(url)
-                all_results.append(r)
-        all_images = search_images + retailer_images
+        for search_data in searches:
+            for r in search_data.get("results", []):
+                url = r.get("url", "")
+                if url and url not in seen_urls:
+                    seen_urls.add(url)
+                    all_results.append(r)
+        return all_results
 
+    @staticmethod
+    def _llm_inputs(product_name: str, all_results: list[dict]) -> dict:
         # -- 2. Number results for LLM --
-        url_map: dict[int, str] = {}
         numbered: list[str] = []
         for i, r in enumerate(all_results):
-            url_map[i] = r.get("url", "")
             numbered.append(
                 f"[{i}] URL: {r.get('url', '')}\n"
                 f"    Title: {r.get('title', '')}\n"
-                f"    Snippet: {r.get('content', '')[:350]}"
+                f"    Snippet: {_snippet(r, 300)}"
             )
         search_text = "\n\n".join(numbered)
+        return {
+            "product_name": product_name,
+            "search_results": search_text,
+            "max_idx": len(all_results) - 1,
+        }
 
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                (
-                    "system",
-                    "You are a Price Comparison Specialist.\n\n"
-                    "RULES:\n"
-                    "1. Reference results by index [0]-[{max_idx}].\n"
-                    "2. Extract REAL prices from the snippets - never invent prices.\n"
-                    "3. Identify retailer from the URL domain "
-                    "(amazon.com -> Amazon, bestbuy.com -> Best Buy, etc.).\n"
-                    "4. ONLY include results that are direct product/buy pages "
-                    "(NOT reviews, articles, blogs, or comparison pages).\n"
-                    "5. Return ONLY JSON - no <think> tags, no markdown fences.\n\n"
-                    "Format:\n"
-                    "{{\n"
-                    '  "retailers": [\n'
-                    '    {{"retailer": "Amazon", "price": "299.99", "source_index": 0}},\n'
-                    "    ...\n"
-                    "  ],\n"
-                    '  "best_price": "279.99",\n'
-                    '  "best_source_index": 2\n'
-                    "}}",
-                ),
-                (
-                    "user",
-                    "Product: {product_name}\n\nSearch Results:\n{search_results}",
-                ),
-            ]
-        )
-        chain = prompt | self.llm | StrOutputParser()
-        raw = parse_json_output(
-            chain.invoke(
-                {
-                    "product_name": product_name,
-                    "search_results": search_text,
-                    "max_idx": len(all_results) - 1,
-                }
-            )
-        )
+    _prompt = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                "You are a Price Comparison Specialist.\n\n"
+                "RULES:\n"
+                "1. Reference results by index [0]-[{max_idx}].\n"
+                "2. Extract REAL prices from the snippets - never invent prices.\n"
+                "3. Identify retailer from the URL domain "
+                "(amazon.com -> Amazon, bestbuy.com -> Best Buy, etc.).\n"
+                "4. ONLY include results that are direct product/buy pages "
+                "(NOT reviews, articles, blogs, or comparison pages).\n"
+                "5. Return ONLY JSON - no <think> tags, no markdown fences.\n\n"
+                "Format:\n"
+                "{{\n"
+                '  "retailers": [\n'
+                '    {{"retailer": "Amazon", "price": "299.99", "source_index": 0}},\n'
+                "    ...\n"
+                "  ],\n"
+                '  "best_price": "279.99",\n'
+                '  "best_source_index": 2\n'
+                "}}",
+            ),
+            (
+                "user",
+                "Product: {product_name}\n\nSearch Results:\n{search_results}",
+            ),
+        ]
+    )
+
+    _batch_prompt = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                "You are a Price Comparison Specialist pricing several products at once.\n"
+                "Each numbered product below comes with its own numbered search results.\n\n"
+                "RULES:\n"
+                "1. Reference results by their index within that product's results.\n"
+                "2. Extract REAL prices from the snippets - never invent prices.\n"
+                "3. Identify retailer from the URL domain "
+                "(amazon.com -> Amazon, bestbuy.com -> Best Buy, etc.).\n"
+                "4. ONLY include results that are direct product/buy pages "
+                "(NOT reviews, articles, blogs, or comparison pages).\n"
+                "5. Price each product ONLY from its own results.\n"
+                "6. Return ONLY JSON - no <think> tags, no markdown fences.\n\n"
+                "Format:\n"
+                "{{\n"
+                '  "products": [\n'
+                '    {{"index": 0, "retailers": [{{"retailer": "Amazon", "price": "299.99", '
+                '"source_index": 0}}], "best_price": "299.99", "best_source_index": 0}},\n'
+                "    ...\n"
+                "  ]\n"
+                "}}",
+            ),
+            ("user", "Products:\n\n{products}"),
+        ]
+    )
+
+    def _resolve(
+        self,
+        raw: dict,
+        product_name: str,
+        all_results: list[dict],
+        approximate_price: str | None,
+    ) -> dict:
+        """Turn the retailer picks into links, price and image (scrapes pages)."""
         if not isinstance(raw, dict):
             raw = {}
+        url_map = {i: r.get("url", "") for i, r in enumerate(all_results)}
 
         # -- 3. Map indices to real URLs and build comparison list --
         price_comparison: list[dict] = []
@@ -816,14 +1627,16 @@ class PriceComparisonAgent:
                     scrape_order.append(idx)
         # Also add any remaining result URLs that look like retailer pages
         for i, url in url_map.items():
-            if i not in scrape_order and any(d in url for d in _RETAILER_DOMAINS):
+            if i not in scrape_order and _retailer_for_url(url):
                 scrape_order.append(i)
 
         best_buy_url: str = ""
         best_image_url: Optional[str] = None
         best_scraped_price: Optional[str] = None
         scraped_seen: set[str] = set()
+        listed_price_is_concrete = _is_concrete_price(raw.get("best_price"))
 
+        to_scrape: list[str] = []
         for idx in scrape_order[:5]:
             url = url_map.get(idx, "")
             if not url or url in scraped_seen:
@@ -834,37 +1647,63 @@ class PriceComparisonAgent:
             if _LISTING_URL_PATTERNS.search(url):
                 print(f"[price-comp] Skipping listing URL: {url}")
                 continue
+            to_scrape.append(url)
+
+        # The pages are independent, so up to _SCRAPE_WINDOW are fetched at
+        # once, read in priority order. A page is only started once the
+        # loop needs those ahead of it, so when the top page already has
+        # everything the lower-priority ones are never fetched at all.
+        pages: list = []
+
+        def start(i: int) -> None:
+            if i < len(to_scrape):
+                pages.append((to_scrape[i], _scrape_pool.submit(
+                    scrape_page_metadata, to_scrape[i], target_product_name=product_name
+                )))
+
+        for i in range(_SCRAPE_WINDOW - 1):
+            start(i)
+        try:
+            for i in range(len(to_scrape)):
+                start(i + _SCRAPE_WINDOW - 1)
+                url, page = pages[i]
+                meta = page.result()
+
+                # Only accept data from single-product pages
+                if not meta.get("is_single_product", False):
+                    print(f"[price-comp] Skipping non-product page: {url}")
+                    continue
 
-            meta = scrape_page_metadata(url, target_product_name=product_name)
-
-            # Only accept data from single-product pages
-            if not meta.get("is_single_product", False):
-                print(f"[price-comp] Skipping non-product page: {url}")
-                continue
-
-            # Verify title matches our product before trusting image/price
-            title_matches = _product_name_matches_title(
-                product_name, meta.get("title")
-            )
+                # Verify title matches our product before trusting image/price
+                title_matches = _product_name_matches_title(
+                    product_name, meta.get("title")
+                )
 
-            if not best_buy_url:
-                best_buy_url = meta.get("url") or url
+                if not best_buy_url:
+                    best_buy_url = meta.get("url") or url
 
-            if not best_image_url and meta.get("image_url") and title_matches:
-                best_image_url = meta["image_url"]
+                if not best_image_url and meta.get("image_url") and title_matches:
+                    best_image_url = meta["image_url"]
 
-            if not best_scraped_price and meta.get("price") and title_matches:
-                best_scraped_price = meta["price"]
+                if not best_scraped_price and meta.get("price") and title_matches:
+                    best_scraped_price = meta["price"]
 
-            # If we have all three, stop scraping
-            if best_buy_url and best_image_url and best_scraped_price:
-                break
+                # If we have all three, stop scraping
+                if best_buy_url and best_image_url and best_scraped_price:
+                    break
+                # A concrete LLM price makes a scraped one optional
+                if best_buy_url and best_image_url and listed_price_is_concrete:
+                    print("[price-comp] Using listed best price, skipping further scrapes")
+                    break
+        finally:
+            for _, page in pages:
+                page.cancel()
 
         # -- 5. Fallback image search if scraping found nothing --
         # Use exact product name to avoid getting a generic category image
         if not best_image_url:
             best_image_url = find_product_image(product_name)
-        # NOTE: Do NOT fall back to all_images (Tavily search images) — those
+        # NOTE: Do NOT fall back to Tavily search images — those
         # are often article hero images or thumbnails from listing pages,
         # not images of our specific product.
 
@@ -872,33 +1711,16 @@ class PriceComparisonAgent:
         cheapest_link = ""
         if isinstance(best_idx, int) and best_idx in url_map:
             cheapest_link = url_map[best_idx]
-        if not cheapest_link and price_comparison:
-            min_price = float("inf")
-            for pc in price_comparison:
-                try:
-                    p = float(str(pc["price"]).replace("$", "").replace(",", ""))
-                    if p < min_price:
-                        min_price = p
-                        cheapest_link = pc["url"]
-                except (ValueError, TypeError):
-                    pass
+        cheapest = _cheapest(price_comparison)
+        if not cheapest_link and cheapest:
+            cheapest_link = cheapest[0]["url"]
         if not cheapest_link:
             cheapest_link = best_buy_url
 
         # -- 7. Determine best price --
         final_price = best_scraped_price or raw.get("best_price") or approximate_price
-        if not final_price and price_comparison:
-            prices_found: list[float] = []
-            for rp in price_comparison:
-                pv = rp.get("price", "")
-                try:
-                    prices_found.append(
-                        float(str(pv).replace("$", "").replace(",", ""))
-                    )
-                except (ValueError, TypeError):
-                    pass
-            if prices_found:
-                final_price = f"${min(prices_found):.2f}"
+        if not final_price and cheapest:
+            final_price = f"${cheapest[1]:.2f}"
 
         return {
             "price_comparison": price_comparison,
@@ -957,13 +1779,6 @@ _PRODUCT_URL_PATTERNS = re.compile(
     re.IGNORECASE,
 )
 
-# Major retailers where we'd want to find buy links
-_RETAILER_DOMAINS = [
-    "amazon.com", "walmart.com", "bestbuy.com", "target.com",
-    "newegg.com", "bhphotovideo.com", "adorama.com", "ebay.com",
-    "costco.com", "homedepot.com", "lowes.com",
-]
-
 
 def _is_product_page_by_url(url: str) -> bool:
     """Heuristic: does the URL structure look like a product page?"""
@@ -978,24 +1793,82 @@ def _is_product_page_by_url(url: str) -> bool:
     return False  # ambiguous – will need scraping to verify
 
 
-def _product_name_matches_title(product_name: str, page_title: str | None) -> bool:
-    """Check if significant words from product_name appear in page_title."""
-    if not page_title or not product_name:
-        return False
-    # Extract significant words (>2 chars, not common filler)
-    filler = {"the", "and", "for", "with", "new", "best", "buy", "sale", "price"}
-    name_words = [
-        w.lower()
-        for w in re.findall(r"\w+", product_name)
-        if len(w) > 2 and w.lower() not in filler
-    ]
-    if not name_words:
-        return False
-    title_lower = page_title.lower()
-    matched = sum(1 for w in name_words if w in title_lower)
-    # Require at least 50% of significant words to match, minimum 2
-    threshold = max(2, len(name_words) * 0.5)
-    return matched >= threshold
+_PRICE_NUMBER_RE = re.compile(r"(\d+\.?\d*)")
+_SNIPPET_PRICE_RE = re.compile(r"\$\s?(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)")
+
+# Major retailers where we'd want to find buy links, by domain
+_RETAILER_NAMES = {
+    "amazon.com": "Amazon", "walmart.com": "Walmart", "bestbuy.com": "Best Buy",
+    "target.com": "Target", "newegg.com": "Newegg", "bhphotovideo.com": "B&H Photo",
+    "adorama.com": "Adorama", "ebay.com": "eBay", "costco.com": "Costco",
+    "homedepot.com": "Home Depot", "lowes.com": "Lowe's",
+}
+
+
+def _retailer_for_url(url: str) -> str | None:
+    """Display name of the known retailer hosting url, if any.
+
+    Every known retailer domain is a two-label name, so the host's last two
+    labels are looked up directly ("smile.amazon.com" -> "amazon.com").
+    """
+    host = urlparse(url).hostname or ""
+    return _RETAILER_NAMES.get(".".join(host.rsplit(".", 2)[-2:]))
+
+
+def _extract_prices_from_results(
+    search_results: list[dict], product_name: str
+) -> dict | None:
+    """Retailer prices read straight off Tavily result snippets.
+
+    Keeps the first dollar amount from each known-retailer product result
+    whose title names the product, one per retailer. Returns the same shape
+    the price LLM produces, or None when fewer than two retailers priced,
+    in which case the caller asks the LLM instead.
+    """
+    retailers: list[dict] = []
+    seen: set[str] = set()
+    best_idx, best_value = None, float("inf")
+    for i, r in enumerate(search_results):
+        url = r.get("url", "")
+        retailer = _retailer_for_url(url)
+        if (
+            not retailer
+            or retailer in seen
+            or _LISTING_URL_PATTERNS.search(url)
+            or _GENERIC_URL_PATTERNS.search(url)
+            or not _product_name_matches_title(product_name, r.get("title"))
+        ):
+            continue
+        match = _SNIPPET_PRICE_RE.search(r.get("content") or "")
+        if not match:
+            continue
+        price = match.group(1).replace(",", "")
+        value = float(price)
+        if value <= 0:
+            continue
+        seen.add(retailer)
+        retailers.append({"retailer": retailer, "price": price, "source_index": i})
+        if value < best_value:
+            best_idx, best_value = i, value
+
+    if len(retailers) < 2:
+        return None
+    print(f"[price-comp] Parsed {len(retailers)} retailer prices from snippets")
+    return {
+        "retailers": retailers,
+        "best_price": f"{best_value:.2f}",
+        "best_source_index": best_idx,
+    }
+
+
+_CONCRETE_PRICE_RE = re.compile(r"^\$?\s*\d[\d,]*(\.\d{1,2})?$")
+
+
+def _is_concrete_price(price) -> bool:
+    """True for a single exact amount like '$279.99' (not ranges or 'varies')."""
+    if isinstance(price, (int, float)):
+        return price > 0
+    return isinstance(price, str) and bool(_CONCRETE_PRICE_RE.match(price.strip()))
 
 
 def _extract_price_float(price_str) -> float | None:
@@ -1003,7 +1876,7 @@ def _extract_price_float(price_str) -> float | None:
     if price_str is None:
         return None
     s = str(price_str).replace("$", "").replace(",", "").strip()
-    match = re.search(r"(\d+\.?\d*)", s)
+    match = _PRICE_NUMBER_RE.search(s)
     if match:
         try:
             return float(match.group(1))
@@ -1012,6 +1885,30 @@ def _extract_price_float(price_str) -> float | None:
     return None
 
 
+# First number on each line, or an empty group for a line without one, so
+# findall over newline-joined prices yields exactly one match per price
+_PRICE_LINES_RE = re.compile(r"^[^\d\n]*(\d+\.?\d*)?", re.MULTILINE)
+
+
+def _price_floats(prices) -> list[float | None]:
+    """_extract_price_float over many prices with a single regex scan."""
+    joined = "\n".join(
+        "" if p is None else str(p).replace("\n", " ") for p in prices
+    )
+    found = _PRICE_LINES_RE.findall(joined.replace("$", "").replace(",", ""))
+    return [float(n) if n else None for n in found]
+
+
+def _cheapest(entries: list[dict]) -> tuple[dict, float] | None:
+    """The entry with the lowest parseable "price" (first on ties), and that price."""
+    floats = _price_floats([e.get("price") for e in entries])
+    best = min(
+        ((value, i) for i, value in enumerate(floats) if value is not None),
+        default=None,
+    )
+    return None if best is None else (entries[best[1]], best[0])
+
+
 def _prices_match(price_a, price_b, tolerance: float = 0.15) -> bool:
     """Check if two prices are within tolerance (default 15%) of each other."""
     a = _extract_price_float(price_a)
@@ -1026,7 +1923,7 @@ def _prices_match(price_a, price_b, tolerance: float = 0.15) -> bool:
     return abs(a - b) / avg <= tolerance
 
 
-class LinkVerificationAgent:
+class LinkVerificationAgent(_LLMAgent):
     """Verifies product buy-links are real, direct purchase pages.
 
     For each product it:
@@ -1038,9 +1935,6 @@ class LinkVerificationAgent:
       5. Verifies the replacement link too before accepting it
     """
 
-    def __init__(self):
-        self.llm = default_llm
-
     # ----- scrape-based verification ------------------------------------
 
     def _scrape_verify(self, url: str, product_name: str) -> dict:
@@ -1075,123 +1969,17 @@ class LinkVerificationAgent:
             result["is_listing_page"] = True
             return result
 
-        try:
-            from bs4 import BeautifulSoup
-        except ImportError:
+        if not HAVE_LXML:
             result["is_product_page"] = _is_product_page_by_url(url)
             return result
 
         try:
-            with httpx.Client(
-                follow_redirects=True, timeout=12.0, headers=_SCRAPER_HEADERS
-            ) as client:
-                resp = client.get(url)
-                if resp.status_code >= 400:
-                    return result
-                html = resp.text
-                soup = BeautifulSoup(html, "lxml")
-
-                # --- Check if this is a listing page FIRST ---
-                if _detect_listing_page(html, soup):
-                    result["is_listing_page"] = True
-                    # Still extract title for logging
-                    tag = soup.find("meta", property="og:title")
-                    if tag and tag.get("content"):
-                        result["page_title"] = tag["content"]
-                    elif soup.title and soup.title.string:
-                        result["page_title"] = soup.title.string.strip()
-                    return result
-
-                # --- Title ---
-                tag = soup.find("meta", property="og:title")
-                if tag and tag.get("content"):
-                    result["page_title"] = tag["content"]
-                elif soup.title and soup.title.string:
-                    result["page_title"] = soup.title.string.strip()
-
-                # --- Image (og:image) ---
-                for prop in ("og:image", "og:image:url"):
-                    tag = soup.find("meta", property=prop)
-                    if tag and tag.get("content", "").startswith("http"):
-                        result["page_image"] = tag["content"]
-                        break
-                if not result["page_image"]:
-                    tag = soup.find("meta", attrs={"name": "twitter:image"})
-                    if tag and tag.get("content", "").startswith("http"):
-                        result["page_image"] = tag["content"]
-
-                # --- og:type == product ---
-                og_type = soup.find("meta", property="og:type")
-                if og_type and "product" in (og_type.get("content") or "").lower():
-                    result["has_product_schema"] = True
-
-                # --- JSON-LD Product schema ---
-                for script in soup.find_all("script", type="application/ld+json"):
-                    try:
-                        ld = json.loads(script.string or "")
-                        if isinstance(ld, list):
-                            ld = ld[0] if ld else {}
-                        ld_type = str(ld.get("@type", "")).lower()
-                        if ld_type in ("product", "offer", "indivproduct"):
-                            result["has_product_schema"] = True
-                            offers = ld.get("offers", ld.get("Offers", {}))
-                            if isinstance(offers, list):
-                                offers = offers[0] if offers else {}
-                            if isinstance(offers, dict):
-                                pv = offers.get("price") or offers.get("lowPrice")
-                                if pv:
-                                    result["page_price"] = str(pv)
-                            break
-                    except Exception:
-                        continue
-
-                # --- Price from meta ---
-                if not result["page_price"]:
-                    for prop in ("og:price:amount", "product:price:amount"):
-                        tag = soup.find("meta", property=prop)
-                        if tag and tag.get("content"):
-                            result["page_price"] = tag["content"]
-                            break
-
-                # --- Buy / Add-to-cart button (count-aware) ---
-                html_lower = html.lower()
-                atc_signals = [
-                    "add to cart", "add-to-cart", "addtocart",
-                    "buy now", "buy-now", "buynow",
-                    "add to bag", "add to basket",
-                ]
-                atc_count = sum(html_lower.count(s) for s in atc_signals)
-                result["has_buy_button"] = atc_count > 0
-                # A real product page typically has 1-2 buy buttons
-                # (e.g. sticky header + main). More than 3 is suspicious.
-                result["has_single_buy_button"] = 0 < atc_count <= 3
-
-                # --- Name match (strict: use title, not body text) ---
-                result["name_matches"] = _product_name_matches_title(
-                    product_name, result["page_title"]
-                )
-
-                # --- Final decision ---
-                # A real product page needs: name matches + (product schema OR
-                # single buy button). Listing pages get caught by the
-                # _detect_listing_page check above, but we add extra safety here:
-                # even if not detected as listing, require name match to be strict.
-                if result["name_matches"]:
-                    if result["has_product_schema"] and result["has_single_buy_button"]:
-                        result["is_product_page"] = True
-                    elif result["has_product_schema"]:
-                        result["is_product_page"] = True
-                    elif result["has_single_buy_button"]:
-                        result["is_product_page"] = True
-                # Without name match, only pass if we have both schema + buy button
-                elif result["has_product_schema"] and result["has_single_buy_button"]:
-                    result["is_product_page"] = True
-
-                # Guard: if image/price came from a page where name doesn't match,
-                # clear them to avoid using wrong product's data
-                if not result["name_matches"]:
-                    result["page_image"] = None
-                    result["page_price"] = None
+            html = _fetch_html(url, 12.0)
+            if html is None:
+                return result
+            # Parsing and the signal checks hold the GIL, so a large page
+            # goes to the parse workers; a small one is checked in-process
+            result.update(run_parser(parse_verification_signals, html, product_name))
 
         except Exception as e:
             print(f"[link-verify-scrape] {url}: {e}")
@@ -1203,33 +1991,19 @@ class LinkVerificationAgent:
     def _search_buy_links(self, product_name: str) -> list[dict]:
         """Search for direct buy links on major retailers.
 
-        Returns list of {url, retailer, price} dicts.
+        Returns list of {url, title, snippet} dicts.
         """
-        candidates: list[dict] = []
-
-        # Strategy 1: targeted retailer searches via Tavily
-        queries = [
-            f'"{product_name}" buy site:amazon.com OR site:walmart.com OR site:bestbuy.com',
-            f'"{product_name}" buy price',
+        # The same searches PriceComparisonAgent runs, so within a pipeline
+        # run they are usually served from the search cache
+        searches = [
+            _search_pool.submit(tavily_search, **kwargs)
+            for kwargs in PriceComparisonAgent._buy_searches(product_name)
+        ]
+        results = PriceComparisonAgent._merge_results([f.result() for f in searches])
+        return [
+            {"url": r["url"], "title": r.get("title", ""), "snippet": _snippet(r, 400)}
+            for r in results
         ]
-
-        seen_urls: set[str] = set()
-        for q in queries:
-            search_data = tavily_search(
-                query=q, max_results=5, search_depth="basic"
-            )
-            for r in search_data.get("results", []):
-                url = r.get("url", "")
-                if not url or url in seen_urls:
-                    continue
-                seen_urls.add(url)
-                candidates.append({
-                    "url": url,
-                    "title": r.get("title", ""),
-                    "snippet": r.get("content", "")[:400],
-                })
-
-        return candidates
 
     def _find_best_buy_link(
         self, product_name: str, expected_price=None
@@ -1239,113 +2013,157 @@ class LinkVerificationAgent:
         Returns {url, retailer, price} or None.
         """
         candidates = self._search_buy_links(product_name)
+        name_words = {
+            w.lower() for w in _WORD_RE.findall(product_name) if len(w) > 2
+        }
 
-        # Score and sort candidates
-        scored: list[tuple[float, dict]] = []
+        # Score and sort candidates; each URL's retailer and generic-ness
+        # are worked out once and reused by both passes below
+        scored: list[tuple[float, str, str | None, bool]] = []
         for c in candidates:
             url = c["url"]
+            retailer = _retailer_for_url(url)
+            generic = bool(_GENERIC_URL_PATTERNS.search(url))
             score = 0.0
 
             # Prefer known retailer domains
-            for domain in _RETAILER_DOMAINS:
-                if domain in url:
-                    score += 3.0
-                    break
+            if retailer:
+                score += 3.0
 
             # Prefer product URL patterns
             if _PRODUCT_URL_PATTERNS.search(url):
                 score += 4.0
 
             # Penalise generic URL patterns
-            if _GENERIC_URL_PATTERNS.search(url):
+            if generic:
                 score -= 5.0
 
             # Check product name words in title
-            name_words = set(
-                w.lower() for w in re.findall(r"\w+", product_name) if len(w) > 2
-            )
             title_lower = c.get("title", "").lower()
             matched = sum(1 for w in name_words if w in title_lower)
             score += matched * 0.5
 
-            scored.append((score, c))
+            scored.append((score, url, retailer, generic))
 
         scored.sort(key=lambda x: x[0], reverse=True)
 
-        # Verify top candidates (max 3) by scraping
-        for _score, c in scored[:3]:
-            url = c["url"]
-            verify = self._scrape_verify(url, product_name)
-            if verify["is_product_page"] or (
-                verify["name_matches"] and verify["has_buy_button"]
-            ):
-                # Determine retailer from domain
-                retailer = "Unknown"
-                for domain in _RETAILER_DOMAINS:
-                    if domain in url:
-                        retailer = domain.split(".")[0].capitalize()
-                        break
-
-                page_price = verify.get("page_price")
-                if expected_price and page_price and not _prices_match(
-                    expected_price, page_price, tolerance=0.25
+        # Verify top candidates (max 3) by scraping: fetched at once, still
+        # taken in score order
+        top = [
+            (url, retailer, _scrape_pool.submit(self._scrape_verify, url, product_name))
+            for _score, url, retailer, _generic in scored[:3]
+        ]
+        try:
+            for url, retailer, page in top:
+                verify = page.result()
+                if verify["is_product_page"] or (
+                    verify["name_matches"] and verify["has_buy_button"]
                 ):
-                    # Price mismatch is suspicious – might be wrong product
-                    continue
+                    page_price = verify.get("page_price")
+                    if expected_price and page_price and not _prices_match(
+                        expected_price, page_price, tolerance=0.25
+                    ):
+                        # Price mismatch is suspicious – might be wrong product
+                        continue
 
-                return {
-                    "url": url,
-                    "retailer": retailer,
-                    "price": page_price,
-                }
+                    return {
+                        "url": url,
+                        "retailer": retailer or "Unknown",
+                        "price": page_price,
+                    }
+        finally:
+            for _, _, page in top:
+                page.cancel()
 
         # If no verified candidate, return best-scored known retailer link
-        for _score, c in scored[:5]:
-            url = c["url"]
-            if any(domain in url for domain in _RETAILER_DOMAINS):
-                if not _GENERIC_URL_PATTERNS.search(url):
-                    retailer = "Unknown"
-                    for domain in _RETAILER_DOMAINS:
-                        if domain in url:
-                            retailer = domain.split(".")[0].capitalize()
-                            break
-                    return {"url": url, "retailer": retailer, "price": None}
+        for _score, url, retailer, generic in scored[:5]:
+            if retailer and not generic:
+                return {"url": url, "retailer": retailer, "price": None}
 
         return None
 
     # ----- LLM-assisted URL classification (fallback) -------------------
 
-    def _llm_classify_url(self, url: str, page_title: str | None, product_name: str) -> bool:
-        """Use LLM as fallback to decide if a URL is a direct product page."""
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                (
-                    "system",
-                    "You determine whether a URL is a DIRECT PRODUCT PURCHASE PAGE "
-                    "(where a customer can buy a specific product) versus a review, "
-                    "article, category listing, search results page, or other non-purchase page.\n\n"
-                    "Reply with ONLY 'YES' or 'NO'. No explanation.",
-                ),
-                (
-                    "user",
-                    "Product: {product_name}\n"
-                    "URL: {url}\n"
-                    "Page Title: {page_title}\n\n"
-                    "Is this a direct product purchase page?",
-                ),
-            ]
-        )
-        chain = prompt | self.llm | StrOutputParser()
+    _classify_prompt = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                "You determine whether a URL is a DIRECT PRODUCT PURCHASE PAGE "
+                "(where a customer can buy a specific product) versus a review, "
+                "article, category listing, search results page, or other non-purchase page.\n\n"
+                "Reply with ONLY 'YES' or 'NO'. No explanation.",
+            ),
+            (
+                "user",
+                "Product: {product_name}\n"
+                "URL: {url}\n"
+                "Page Title: {page_title}\n\n"
+                "Is this a direct product purchase page?",
+            ),
+        ]
+    )
+
+    _classify_batch_prompt = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                "You determine whether each URL is a DIRECT PRODUCT PURCHASE PAGE "
+                "(where a customer can buy a specific product) versus a review, "
+                "article, category listing, search results page, or other non-purchase page.\n\n"
+                "Return ONLY valid JSON, one entry per page:\n"
+                '{{"pages": [{{"index": <page number>, "purchase_page": true}}]}}',
+            ),
+            (
+                "user",
+                "Product: {product_name}\n\n{pages}\n\n"
+                "Which of these are direct product purchase pages?",
+            ),
+        ]
+    )
+
+    _JSON_PROMPTS = ("_classify_batch_prompt",)
+
+    def _llm_classify_urls(
+        self, pages: list[tuple[str, str | None]], product_name: str
+    ) -> list[bool]:
+        """LLM fallback deciding which (url, page_title) pages are direct
+        product pages. Several pages are classified in a single call."""
+        if not pages:
+            return []
+        if len(pages) > 1:
+            return self._llm_classify_batch(pages, product_name)
+        url, title = pages[0]
         try:
-            answer = chain.invoke({
-                "product_name": product_name,
-                "url": url,
-                "page_title": page_title or "Unknown",
-            }).strip().upper()
-            return answer.startswith("YES")
+            answer = self._chain(self._classify_prompt).invoke(
+                {"product_name": product_name, "url": url, "page_title": title or "Unknown"}
+            )
         except Exception as e:
             print(f"[link-verify-llm] {url}: {e}")
-            return False
+            return [False]
+        return [answer.strip().upper().startswith("YES")]
+
+    def _llm_classify_batch(
+        self, pages: list[tuple[str, str | None]], product_name: str
+    ) -> list[bool]:
+        listing = "\n".join(
+            f"[{i}] URL: {url}\n    Page Title: {title or 'Unknown'}"
+            for i, (url, title) in enumerate(pages)
+        )
+        try:
+            raw = self._json_chain(self._classify_batch_prompt).invoke(
+                {"product_name": product_name, "pages": listing}
+            )
+        except Exception as e:
+            print(f"[link-verify-llm] {len(pages)} pages: {e}")
+            return [False] * len(pages)
+        answers = raw.get("pages", []) if isinstance(raw, dict) else raw
+        by_index: dict[int, dict] = {}
+        for pos, answer in enumerate(answers if isinstance(answers, list) else []):
+            idx = ProductDetailAgent._analysis_index(answer, pos)
+            if idx is not None:
+                by_index.setdefault(idx, answer)
+        # Pages the answer skipped count as unverified, as failed calls do
+        return [by_index.get(i, {}).get("purchase_page") is True for i in range(len(pages))]
 
     # ----- Main entry point ---------------------------------------------
 
@@ -1370,46 +2188,59 @@ class LinkVerificationAgent:
             if v.get("page_image") and not product.get("image_url"):
                 product["image_url"] = v["page_image"]
 
-        # --- Verify main URL ---
-        main_verified = False
+        # --- Verify main URL and cheapest_link (if different from main) ---
+        checks = []
         if main_url:
-            v = self._scrape_verify(main_url, product_name)
-            main_verified = v["is_product_page"]
-            if not main_verified and v.get("page_title"):
-                # LLM fallback for ambiguous cases
-                main_verified = self._llm_classify_url(
-                    main_url, v["page_title"], product_name
-                )
-            if main_verified:
-                _update_from_verification(v)
+            checks.append(main_url)
+        if cheapest_link and cheapest_link != main_url:
+            checks.append(cheapest_link)
+
+        # Comparison links that need a light scrape check (see below)
+        comparisons = [
+            pc for pc in product.get("price_comparison", [])
+            if pc.get("url") and not _GENERIC_URL_PATTERNS.search(pc["url"])
+        ]
+        to_scrape = checks + [
+            pc["url"] for pc in comparisons if not _is_product_page_by_url(pc["url"])
+        ]
+        # The pages are independent, so they are all fetched at once
+        # (_scrape_verify never raises); a URL listed twice is fetched once
+        pages = {
+            url: _scrape_pool.submit(self._scrape_verify, url, product_name)
+            for url in dict.fromkeys(to_scrape)
+        }
+        scraped = {url: pages[url].result() for url in checks}
+        verified = {url: v["is_product_page"] for url, v in scraped.items()}
+
+        # LLM fallback for ambiguous pages, both classified in one batch
+        ambiguous = [
+            (url, v["page_title"])
+            for url, v in scraped.items()
+            if not v["is_product_page"] and v.get("page_title")
+        ]
+        for (url, _), ok in zip(ambiguous, self._llm_classify_urls(ambiguous, product_name)):
+            verified[url] = ok
+        for url in checks:
+            if verified[url]:
+                _update_from_verification(scraped[url])
 
-        # --- Verify cheapest_link (if different from main) ---
+        main_verified = verified.get(main_url, False) if main_url else False
         cheapest_verified = False
         if cheapest_link and cheapest_link != main_url:
-            v2 = self._scrape_verify(cheapest_link, product_name)
-            cheapest_verified = v2["is_product_page"]
-            if not cheapest_verified and v2.get("page_title"):
-                cheapest_verified = self._llm_classify_url(
-                    cheapest_link, v2["page_title"], product_name
-                )
-            if cheapest_verified:
-                _update_from_verification(v2)
+            cheapest_verified = verified[cheapest_link]
         elif cheapest_link == main_url:
             cheapest_verified = main_verified
 
         # --- Verify price_comparison links ---
+        # Clearly generic links are dropped; the rest pass on their URL or
+        # a light scrape check (no LLM for individual comparison links)
         verified_comparisons: list[dict] = []
-        for pc in product.get("price_comparison", []):
-            pc_url = pc.get("url", "")
-            if not pc_url:
-                continue
-            if _GENERIC_URL_PATTERNS.search(pc_url):
-                continue  # drop clearly generic links
+        for pc in comparisons:
+            pc_url = pc["url"]
             if _is_product_page_by_url(pc_url):
                 verified_comparisons.append(pc)
             else:
-                # Light scrape check (no LLM for individual comparison links)
-                v3 = self._scrape_verify(pc_url, product_name)
+                v3 = pages[pc_url].result()
                 if v3["is_product_page"] or v3["name_matches"]:
                     verified_comparisons.append(pc)
         product["price_comparison"] = verified_comparisons
@@ -1440,28 +2271,80 @@ class LinkVerificationAgent:
                 product["cheapest_link"] = product["url"]
             else:
                 # Try to pick from verified comparison links
-                if verified_comparisons:
-                    best_pc = None
-                    best_price = float("inf")
-                    for pc in verified_comparisons:
-                        p = _extract_price_float(pc.get("price"))
-                        if p is not None and p < best_price:
-                            best_price = p
-                            best_pc = pc
-                    if best_pc:
-                        product["cheapest_link"] = best_pc["url"]
+                cheapest = _cheapest(verified_comparisons)
+                if cheapest:
+                    product["cheapest_link"] = cheapest[0]["url"]
 
         product["link_verified"] = main_verified
         return product
 
 
-class RecommendationAgent:
+class RecommendationAgent(_LLMAgent):
     """Generates the final markdown recommendation."""
 
-    def __init__(self):
-        self.llm = default_llm
+    _prompt = ChatPromptTemplate.from_messages(
+        [
+            (
+                "system",
+                "You are Maven's Recommendation Engine.\n\n"
+                "RULES:\n"
+                "- Maximum 4-5 sentences.\n"
+                "- Use **bold** for product names and key points.\n"
+                "- Clearly state the top pick and WHY.\n"
+                "- Mention price differences if significant.\n"
+                "- Be specific, not generic platitudes.\n"
+                "- Return ONLY the recommendation text "
+                "(no <think> tags, no markdown fences).",
+            ),
+            (
+                "user",
+                "Query: {query}\n\nProducts:\n{products}\n\n"
+                "Provide your recommendation.",
+            ),
+        ]
+    )
 
     def recommend(self, products: list[dict], query: str) -> str:
+        text = self._chain(self._prompt).invoke(self._inputs(products, query))
+        return _THINK_RE.sub("", text).strip()
+
+    async def arecommend(
+        self, products: list[dict], query: str, timeout: float | None = None
+    ) -> str:
+        """recommend, streamed so a timeout keeps what was already written.
+
+        On timeout the text generated so far is returned, cut back to its
+        last full sentence; TimeoutError is raised only if there is none.
+        """
+        chunks: list[str] = []
+
+        async def _stream() -> None:
+            async for chunk in self._chain(self._prompt).astream(
+                self._inputs(products, query)
+            ):
+                chunks.append(chunk)
+
+        try:
+            await asyncio.wait_for(_stream(), timeout)
+        except asyncio.TimeoutError:
+            partial = self._complete_sentences("".join(chunks))
+            if not partial:
+                raise
+            print(f"[recommend] Timed out, keeping {len(partial)} streamed chars")
+            return partial
+        return _THINK_RE.sub("", "".join(chunks)).strip()
+
+    @staticmethod
+    def _complete_sentences(text: str) -> str:
+        text = _THINK_RE.sub("", text).split("<think>", 1)[0]
+        bold = text.rfind(".**")
+        end = max(text.rfind(". "), text.rfind(".\n"), bold + 2 if bold >= 0 else -1)
+        if text.rstrip().endswith((".", ".**")):
+            end = len(text.rstrip()) - 1
+        return text[: end + 1].strip() if end >= 0 else ""
+
+    @staticmethod
+    def _inputs(products: list[dict], query: str) -> dict:
         summaries = []
         for p in products:
             summaries.append(
@@ -1471,28 +2354,4 @@ class RecommendationAgent:
                 f"Pros: {', '.join(p.get('pros', [])[:3])}, "
                 f"Cons: {', '.join(p.get('cons', [])[:2])}"
             )
-
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                (
-                    "system",
-                    "You are Maven's Recommendation Engine.\n\n"
-                    "RULES:\n"
-                    "- Maximum 4-5 sentences.\n"
-                    "- Use **bold** for product names and key points.\n"
-                    "- Clearly state the top pick and WHY.\n"
-                    "- Mention price differences if significant.\n"
-                    "- Be specific, not generic platitudes.\n"
-                    "- Return ONLY the recommendation text "
-                    "(no <think> tags, no markdown fences).",
-                ),
-                (
-                    "user",
-                    "Query: {query}\n\nProducts:\n{products}\n\n"
-                    "Provide your recommendation.",
-                ),
-            ]
-        )
-        chain = prompt | self.llm | StrOutputParser()
-        text = chain.invoke({"query": query, "products": "\n".join(summaries)})
-        return re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL).strip()
+        return {"query": query, "products": "\n".join(summaries)}
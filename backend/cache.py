@@ -0,0 +1,323 @@
+import asyncio
+import concurrent.futures
+import copy
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+from jsonutil import dumps as json_dumps
+
+# ---------------------------------------------------------------------------
+# Keys
+# ---------------------------------------------------------------------------
+
+
+def normalize_query(text: str) -> str:
+    """Lowercase, strip and collapse whitespace so trivial variants share a key."""
+    return " ".join(str(text).lower().split())
+
+
+def cache_key(*parts: Any) -> str:
+    """Stable hash of the (normalized) call arguments."""
+    raw = "\x1f".join(
+        normalize_query(p) if isinstance(p, str) else repr(p) for p in parts
+    )
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def content_key(obj: Any) -> str:
+    """Hash of a JSON-like value's canonical form (key order doesn't matter)."""
+    raw = json_dumps(obj, sort_keys=True)
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# TTL + LRU cache
+# ---------------------------------------------------------------------------
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire ``ttl`` seconds after insert.
+
+    Values are deep-copied on the way in and out, so callers may mutate what
+    they get back (the pipeline does) without corrupting the cached copy.
+    ``ttl=None`` disables expiry.
+
+    An optional ``store`` (``load(key) -> (value, unix_time) | None``,
+    ``save(key, value)``, ``delete(key)``) persists entries behind the
+    in-memory LRU: misses fall through to it and sets write through, so
+    results outlive a restart. clear() only empties the memory tier.
+
+    get_or_call / aget_or_call coalesce concurrent misses: while one caller
+    is computing a key, others asking for it wait for that result instead
+    of repeating the upstream call.
+    """
+
+    def __init__(
+        self, maxsize: int = 512, ttl: Optional[float] = None, store: Any = None
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.store = store
+        self._data: "OrderedDict[str, tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # key -> [future, waiter count] for computations in progress; sync
+        # and async callers wait on different future types, so kept apart
+        self._pending: dict[str, list] = {}
+        self._apending: dict[str, list] = {}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self._memory_get(key)
+        if entry is None:
+            return default if self.store is None else self._load(key, default)
+        return copy.deepcopy(entry[0])
+
+    async def aget(self, key: str, default: Any = None) -> Any:
+        """get() for the event loop: a store fallback runs in a worker thread."""
+        entry = self._memory_get(key)
+        if entry is None:
+            if self.store is None:
+                return default
+            return await asyncio.to_thread(self._load, key, default)
+        return copy.deepcopy(entry[0])
+
+    def _memory_get(self, key: str) -> Optional[tuple[Any, float]]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+                    del self._data[key]
+                    return None
+                self._data.move_to_end(key)
+            return entry
+
+    def _load(self, key: str, default: Any) -> Any:
+        saved = self.store.load(key)
+        if saved is None:
+            return default
+        value, saved_at = saved
+        age = max(0.0, time.time() - saved_at)
+        if self.ttl is not None and age > self.ttl:
+            self.store.delete(key)
+            return default
+        self._put(key, copy.deepcopy(value), time.monotonic() - age)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self._put(key, copy.deepcopy(value), time.monotonic())
+        if self.store is not None:
+            self.store.save(key, value)
+
+    def _put(self, key: str, value: Any, stored_at: float) -> None:
+        with self._lock:
+            self._data[key] = (value, stored_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def keys(self) -> list[str]:
+        """Unexpired in-memory keys, oldest first; expired entries are dropped."""
+        now = time.monotonic()
+        with self._lock:
+            if self.ttl is not None:
+                for key in [k for k, (_, at) in self._data.items() if now - at > self.ttl]:
+                    del self._data[key]
+            return list(self._data)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def get_or_call(
+        self,
+        key: str,
+        fn: Callable[..., Any],
+        *args: Any,
+        should_cache: Callable[[Any], bool] = bool,
+        **kwargs: Any,
+    ) -> Any:
+        """Return the cached value for key, or call fn and cache its result.
+
+        Results failing ``should_cache`` (empty by default) are returned but
+        not stored, so a transient upstream failure is retried next time.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        pending, owner = self._join(self._pending, key, concurrent.futures.Future)
+        if not owner:
+            return copy.deepcopy(pending.result())
+        try:
+            value = self.get(key)  # filled while we were joining?
+            if value is None:
+                value = fn(*args, **kwargs)
+                if value is not None and should_cache(value):
+                    self.set(key, value)
+        except BaseException as exc:
+            if self._leave(self._pending, key):
+                pending.set_exception(exc)
+            raise
+        if self._leave(self._pending, key):
+            pending.set_result(copy.deepcopy(value))
+        return value
+
+    async def aget_or_call(
+        self,
+        key: str,
+        fn: Callable[..., Awaitable[Any]],
+        *args: Any,
+        should_cache: Callable[[Any], bool] = bool,
+        **kwargs: Any,
+    ) -> Any:
+        """get_or_call for a coroutine function.
+
+        fn runs in a task owned by the flight rather than by the first
+        caller, and every caller awaits it through a shield: one caller
+        timing out or being cancelled leaves the others (and the cache
+        fill) unaffected.
+        """
+        cached = await self.aget(key)
+        if cached is not None:
+            return cached
+        task, owner = self._join(
+            self._apending, key,
+            lambda: asyncio.ensure_future(self._acompute(key, fn, args, kwargs, should_cache)),
+        )
+        value, shared = await asyncio.shield(task)
+        # A lone owner keeps the computed value; shared results are copied
+        return copy.deepcopy(value) if shared or not owner else value
+
+    async def _acompute(
+        self, key: str, fn: Callable[..., Awaitable[Any]], args: tuple, kwargs: dict,
+        should_cache: Callable[[Any], bool],
+    ) -> tuple[Any, bool]:
+        """(value, whether anyone joined) for one aget_or_call flight."""
+        try:
+            value = await self.aget(key)  # filled while we were joining?
+            if value is None:
+                value = await fn(*args, **kwargs)
+                if value is not None and should_cache(value):
+                    self.set(key, value)
+        finally:
+            shared = self._leave(self._apending, key)
+        return value, shared
+
+    def _join(
+        self, pending: dict[str, list], key: str, new_future: Callable[[], Any]
+    ) -> tuple[Any, bool]:
+        """(future, True) to compute key, or (someone else's future, False)."""
+        with self._lock:
+            entry = pending.get(key)
+            if entry is None:
+                entry = pending[key] = [new_future(), 0]
+                if isinstance(entry[0], asyncio.Task):
+                    # Retrieve a failure even if every caller has gone
+                    entry[0].add_done_callback(_consume_exception)
+                return entry[0], True
+            entry[1] += 1
+            return entry[0], False
+
+    def _leave(self, pending: dict[str, list], key: str) -> bool:
+        """Drop key's pending entry; True if anyone is waiting on it.
+
+        The count is final here: nobody can join once the entry is gone.
+        """
+        with self._lock:
+            entry = pending.pop(key, None)
+        return bool(entry and entry[1])
+
+
+def _consume_exception(task: asyncio.Task) -> None:
+    if not task.cancelled():
+        task.exception()
+
+
+# ---------------------------------------------------------------------------
+# Near-duplicate query cache
+# ---------------------------------------------------------------------------
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_DOUBLED_RE = re.compile(r"([a-z])\1")
+_NUMBER_RE = re.compile(r"\d")
+
+# Words that rank or pad a shopping query without changing what is wanted
+_FILLER_WORDS = frozenset(
+    "a an the for to of in on with and best top good great recommended "
+    "recommend buy find me some i want need looking".split()
+)
+
+
+def query_tokens(text: str) -> frozenset:
+    """Canonical token set for a query.
+
+    Filler words are dropped and each token is lightly stemmed (doubled
+    letters collapsed, plural 's' removed), so spelling and word-order
+    variants map to the same set: 'top noise-cancelling headphones' and
+    'best noise canceling headphone' both become {noise, canceling, headphone}.
+    """
+    tokens = set()
+    for tok in _TOKEN_RE.findall(str(text).lower()):
+        if tok in _FILLER_WORDS:
+            continue
+        tok = _DOUBLED_RE.sub(r"\1", tok)
+        if len(tok) > 3 and tok.endswith("s") and not tok.endswith("ss"):
+            tok = tok[:-1]
+        tokens.add(tok)
+    return frozenset(tokens)
+
+
+class SimilarityCache:
+    """TTL + LRU cache looked up by query similarity rather than exact key.
+
+    A lookup hits when the Jaccard similarity of the canonical token sets is
+    at least ``threshold`` and both queries contain the same numbers, so
+    'under $100' never answers for 'under $200'. Entries are scanned
+    linearly, which is microseconds at the sizes used here.
+    """
+
+    def __init__(
+        self, maxsize: int = 256, ttl: Optional[float] = None, threshold: float = 0.85
+    ):
+        self.threshold = threshold
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _key(tokens: frozenset) -> str:
+        return " ".join(sorted(tokens))
+
+    def get(self, text: str, default: Any = None) -> Any:
+        tokens = query_tokens(text)
+        if not tokens:
+            return default
+        hit = self._entries.get(self._key(tokens))
+        if hit is not None:
+            return hit[1]
+
+        numbers = {t for t in tokens if _NUMBER_RE.search(t)}
+        best_key, best_score = None, self.threshold
+        # Keys are the sorted tokens, so the scan never touches the values
+        for key in self._entries.keys():
+            other = frozenset(key.split())
+            if {t for t in other if _NUMBER_RE.search(t)} != numbers:
+                continue
+            score = len(tokens & other) / len(tokens | other)
+            if score >= best_score:
+                best_key, best_score = key, score
+        if best_key is None:
+            return default
+        hit = self._entries.get(best_key)
+        return default if hit is None else hit[1]
+
+    def set(self, text: str, value: Any) -> None:
+        tokens = query_tokens(text)
+        if tokens:
+            self._entries.set(self._key(tokens), (tokens, value))
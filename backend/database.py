@@ -1,16 +1,25 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, JSON
+from sqlalchemy import create_engine, Column, Float, Integer, String, Text, DateTime, ForeignKey, JSON
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import os
+import time
 from pathlib import Path
 
+from jsonutil import dumps as json_dumps, loads as json_loads
+
 # Use absolute path so the DB location is independent of the working directory
 _BASE_DIR = Path(__file__).resolve().parent
 _DEFAULT_DB = f"sqlite:///{_BASE_DIR / 'maven.db'}"
 DATABASE_URL = os.getenv("DATABASE_URL", _DEFAULT_DB)
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    json_serializer=json_dumps,
+    json_deserializer=json_loads,
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -40,6 +49,106 @@ class SearchHistory(Base):
     user = relationship("User", back_populates="searches")
 
 
+class PipelineCheckpoint(Base):
+    """A finished pipeline stage result, kept so restarts don't redo it."""
+    __tablename__ = "pipeline_checkpoints"
+
+    namespace = Column(String(32), primary_key=True)
+    key = Column(String(64), primary_key=True)
+    payload = Column(JSON, nullable=False)
+    saved_at = Column(Float, nullable=False)  # unix time
+
+
+# One writer thread: checkpoint saves are fire-and-forget from the event loop
+_checkpoint_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint")
+
+
+class CheckpointStore:
+    """Backing store for a cache.TTLCache, one namespace per pipeline stage.
+
+    Failures (e.g. tables not created yet) are logged and treated as a miss;
+    the in-memory cache keeps working without it. Rows older than
+    ``max_age`` seconds are deleted by prune_checkpoints(); an expired row
+    is otherwise only removed when its key is looked up again, so one-off
+    queries would pile up forever.
+    """
+
+    def __init__(self, namespace: str, max_age: float | None = None):
+        self.namespace = namespace
+        self.max_age = max_age
+        _stores.append(self)
+
+    def load(self, key: str):
+        """(payload, saved_at) for key, or None."""
+        db = SessionLocal()
+        try:
+            row = db.get(PipelineCheckpoint, (self.namespace, key))
+            return None if row is None else (row.payload, row.saved_at)
+        except Exception as e:
+            print(f"[checkpoint] load failed ({self.namespace}): {e}")
+            return None
+        finally:
+            db.close()
+
+    def save(self, key: str, payload) -> None:
+        _checkpoint_writer.submit(self._write, key, payload, time.time())
+
+    def _write(self, key: str, payload, saved_at: float) -> None:
+        db = SessionLocal()
+        try:
+            db.merge(PipelineCheckpoint(
+                namespace=self.namespace, key=key, payload=payload, saved_at=saved_at,
+            ))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"[checkpoint] save failed ({self.namespace}): {e}")
+        finally:
+            db.close()
+
+    def delete(self, key: str) -> None:
+        _checkpoint_writer.submit(self._delete, key)
+
+    def _delete(self, key: str) -> None:
+        db = SessionLocal()
+        try:
+            db.query(PipelineCheckpoint).filter_by(namespace=self.namespace, key=key).delete()
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"[checkpoint] delete failed ({self.namespace}): {e}")
+        finally:
+            db.close()
+
+    def _prune(self) -> int:
+        db = SessionLocal()
+        try:
+            removed = db.query(PipelineCheckpoint).filter(
+                PipelineCheckpoint.namespace == self.namespace,
+                PipelineCheckpoint.saved_at < time.time() - self.max_age,
+            ).delete()
+            db.commit()
+            if removed:
+                print(f"[checkpoint] pruned {removed} expired {self.namespace} rows")
+            return removed
+        except Exception as e:
+            db.rollback()
+            print(f"[checkpoint] prune failed ({self.namespace}): {e}")
+            return 0
+        finally:
+            db.close()
+
+
+_stores: list[CheckpointStore] = []
+
+
+def prune_checkpoints() -> None:
+    """Drop expired rows from every store with a max_age (on the writer thread)."""
+    for store in _stores:
+        if store.max_age is not None:
+            _checkpoint_writer.submit(store._prune)
+
+
 def create_tables():
     Base.metadata.create_all(bind=engine)
 
@@ -0,0 +1,463 @@
+import functools
+import importlib.util
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable
+
+from jsonutil import loads as json_loads
+
+# Pure HTML → metadata parsers. Nothing here touches the network or the LLM
+# clients, so worker processes only pay for lxml on import.
+
+# lxml is imported on first parse rather than with this module, so
+# importing the app doesn't pay for it; warmup loads it early.
+HAVE_LXML = importlib.util.find_spec("lxml") is not None
+
+# ---------------------------------------------------------------------------
+# Parse worker pool
+# ---------------------------------------------------------------------------
+# Parsing and querying a large retailer page holds the GIL for several to
+# tens of ms, serialising the otherwise parallel per-candidate scrapes. Big
+# documents are parsed in a small process pool instead; small ones aren't
+# worth the pickling round-trip.
+
+PARSE_WORKERS = int(
+    os.getenv("HTML_PARSE_WORKERS", str(max(1, min(4, (os.cpu_count() or 1) - 1))))
+)
+OFFLOAD_MIN_CHARS = 50_000
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn, not fork: the parent has live threads and sockets
+                _pool = ProcessPoolExecutor(
+                    max_workers=PARSE_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _pool
+
+
+def run_parser(fn: Callable[..., Any], html: str, *args: Any) -> Any:
+    """Call ``fn(html, *args)``, in the worker pool when html is large.
+
+    Falls back to parsing in-process if the pool is disabled
+    (HTML_PARSE_WORKERS=0) or a worker has died.
+    """
+    global _pool
+    if PARSE_WORKERS <= 0 or len(html) < OFFLOAD_MIN_CHARS:
+        return fn(html, *args)
+    try:
+        return _get_pool().submit(fn, html, *args).result()
+    except BrokenProcessPool:
+        print("[html-parse] worker pool broken, parsing in-process")
+        with _pool_lock:
+            _pool = None
+        return fn(html, *args)
+
+
+def warm_pool() -> None:
+    """Load lxml here and start the parse workers (and their imports) ahead of use."""
+    if not HAVE_LXML:
+        return
+    doc = "<html><head><title>warmup</title></head></html>"
+    parse_product_metadata(doc, "")  # small pages are parsed in-process
+    if PARSE_WORKERS <= 0:
+        return
+    futures = [_get_pool().submit(parse_product_metadata, doc, "") for _ in range(PARSE_WORKERS)]
+    for future in futures:
+        future.result()
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+# ---------------------------------------------------------------------------
+# Parsers
+# ---------------------------------------------------------------------------
+# Pages are parsed straight into an lxml tree. The tree is built in C,
+# roughly 10x faster than a BeautifulSoup tree over the same lxml parser on
+# large retailer pages. One filtered walk then indexes the tags the parsers
+# read (see Page), instead of a separate XPath search per lookup.
+
+_EXSLT_RE = {"re": "http://exslt.org/regular-expressions"}
+
+
+@functools.cache
+def _html_parser():
+    from lxml import html as lxml_html
+
+    # Fed UTF-8 bytes, so a page's own charset declaration can't re-decode it
+    return lxml_html.HTMLParser(encoding="utf-8")
+
+
+class Page:
+    """A parsed page with its meta tags, <title>, canonical link and JSON-LD
+    blocks collected in a single pass over the tree.
+
+    ``meta`` maps ("property" | "name", value) to the first such tag's
+    content; ``ld_json`` holds each JSON-LD block that parsed, in document
+    order. ``doc`` is the lxml document and ``lower`` the lowercased source
+    HTML, for anything else.
+    """
+
+    __slots__ = ("doc", "lower", "meta", "title", "canonical", "ld_json", "_cart_signals")
+
+    def __init__(self, doc, lower: str = ""):
+        self.doc = doc
+        self.lower = lower
+        self._cart_signals: int | None = None
+        self.meta: dict[tuple[str, str], str] = {}
+        self.title: str | None = None
+        self.canonical: str | None = None
+        self.ld_json: list[Any] = []
+        seen_title = seen_canonical = False
+        for el in doc.iter("meta", "script", "link", "title"):
+            tag = el.tag
+            if tag == "meta":
+                content = el.get("content", "")
+                for attr in ("property", "name"):
+                    value = el.get(attr)
+                    if value is not None:
+                        self.meta.setdefault((attr, value), content)
+            elif tag == "script":
+                if el.get("type") == "application/ld+json":
+                    try:
+                        self.ld_json.append(json_loads(el.text or ""))
+                    except ValueError:
+                        pass
+            elif tag == "link":
+                # rel is a space-separated list; the first canonical link wins
+                if not seen_canonical and "canonical" in (el.get("rel") or "").split():
+                    seen_canonical = True
+                    self.canonical = el.get("href") or None
+            elif not seen_title:
+                seen_title = True
+                self.title = el.text
+
+    @property
+    def cart_signals(self) -> int:
+        """Occurrences of add-to-cart style phrases (counted once, on first use)."""
+        if self._cart_signals is None:
+            self._cart_signals = sum(self.lower.count(s) for s in _CART_SIGNALS)
+        return self._cart_signals
+
+
+def parse_html(html: str) -> Page:
+    """The indexed Page for html. Raises on an empty document."""
+    from lxml import html as lxml_html
+
+    return Page(
+        lxml_html.document_fromstring(
+            html.encode("utf-8", "replace"), parser=_html_parser()
+        ),
+        html.lower(),
+    )
+
+
+# Matched against class attributes by XPath (EXSLT re:test, case-insensitive).
+# re:test calls back into Python per element, so a C-level contains() on the
+# lowercased class drops the elements that can't match first.
+_PRODUCT_CARD_PATTERN = r"product[-_]?card|product[-_]?tile|product[-_]?item"
+_PRODUCT_CARD_XPATH = (
+    "//*[contains(translate(@class, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ',"
+    " 'abcdefghijklmnopqrstuvwxyz'), 'product')]"
+    "[re:test(@class, $pattern, 'i')]"
+)
+# Page-text signals, counted in the lowercased HTML. Each str.count is a
+# full pass over the page, so the listing check and the buy-button check
+# share the add-to-cart counts through Page.cart_signals.
+_CART_SIGNALS = ("add to cart", "add-to-cart", "addtocart", "add to bag", "add to basket")
+_BUY_NOW_SIGNALS = ("buy now", "buy-now", "buynow")
+_GRID_PATTERNS = (
+    'class="product-grid', 'class="product-list',
+    'class="products-grid', 'class="products-list',
+    'class="search-results', 'class="collection-products',
+    'data-product-grid', 'product-card',
+)
+_LISTING_LD_TYPES = frozenset(
+    {"itemlist", "collectionpage", "searchresultspage", "offerlist", "breadcrumblist"}
+)
+PRODUCT_LD_TYPES = frozenset({"product", "offer", "indivproduct"})
+_WORD_RE = re.compile(r"\w+")
+_TITLE_FILLER = frozenset(
+    {"the", "and", "for", "with", "new", "best", "buy", "sale", "price"}
+)
+
+
+def page_title(page: Page) -> str | None:
+    """og:title, else the <title> text."""
+    title = page.meta.get(("property", "og:title"))
+    if title:
+        return title
+    if page.title:
+        return page.title.strip()
+    return None
+
+
+def page_image(page: Page) -> str | None:
+    """og:image / og:image:url, else twitter:image (absolute URLs only)."""
+    for key in (("property", "og:image"), ("property", "og:image:url"),
+                ("name", "twitter:image")):
+        content = page.meta.get(key, "")
+        if content.startswith("http"):
+            return content
+    return None
+
+
+def meta_price(page: Page) -> str | None:
+    for prop in ("og:price:amount", "product:price:amount"):
+        content = page.meta.get(("property", prop))
+        if content:
+            return content
+    return None
+
+
+def canonical_url(page: Page) -> str | None:
+    return page.canonical
+
+
+def buy_button_count(page: Page) -> int:
+    """Add-to-cart and buy-now phrases on the page."""
+    return page.cart_signals + sum(page.lower.count(s) for s in _BUY_NOW_SIGNALS)
+
+
+def offer_price(ld: dict) -> str | None:
+    """Price (or lowPrice) of a JSON-LD Product/Offer's first offer."""
+    offers = ld.get("offers", ld.get("Offers", {}))
+    if isinstance(offers, list):
+        offers = offers[0] if offers else {}
+    if isinstance(offers, dict):
+        pv = offers.get("price") or offers.get("lowPrice")
+        if pv:
+            return str(pv)
+    return None
+
+
+def parse_product_metadata(
+    html: str, url: str, target_product_name: str | None = None
+) -> dict:
+    """Product metadata from a fetched page (see agents.scrape_page_metadata)."""
+    data: dict = {
+        "image_url": None, "price": None, "title": None, "url": url,
+        "is_single_product": False,
+    }
+    page = parse_html(html)
+    data["title"] = page_title(page)
+
+    # -- Detect listing / multi-product page --
+    is_listing = detect_listing_page(page)
+    if is_listing:
+        data["is_single_product"] = False
+        # On a listing page, only return canonical URL / title — not
+        # image or price, because they belong to the page, not our product.
+        data["url"] = canonical_url(page) or data["url"]
+        return data
+
+    # -- If target_product_name given, verify title matches --
+    title_matches = True
+    if target_product_name and data["title"]:
+        title_matches = product_name_matches_title(
+            target_product_name, data["title"]
+        )
+
+    data["is_single_product"] = True
+
+    # -- Image and meta price (only if title matches) --
+    if title_matches:
+        data["image_url"] = page_image(page)
+        data["price"] = meta_price(page)
+
+    # -- Price (JSON-LD, with product-name guard) --
+    if not data["price"]:
+        for ld in page.ld_json:
+            try:
+                if isinstance(ld, list):
+                    ld = ld[0] if ld else {}
+                # Skip non-product schemas
+                if str(ld.get("@type", "")).lower() not in PRODUCT_LD_TYPES:
+                    continue
+                # If we have a target name, verify JSON-LD name matches
+                ld_name = ld.get("name", "")
+                if target_product_name and ld_name:
+                    if not product_name_matches_title(
+                        target_product_name, ld_name
+                    ):
+                        continue
+                price = offer_price(ld)
+                if price:
+                    data["price"] = price
+                    break
+            except Exception:
+                continue
+
+    # -- Canonical URL --
+    data["url"] = canonical_url(page) or data["url"]
+
+    return data
+
+
+def parse_verification_signals(html: str, product_name: str) -> dict:
+    """Link-verification signals for a fetched page (see
+    agents.LinkVerificationAgent._scrape_verify, which fills in defaults).
+
+    Returns a subset of is_product_page, is_listing_page, page_title,
+    page_price, page_image, has_buy_button, has_single_buy_button,
+    has_product_schema and name_matches.
+    """
+    result: dict = {"page_price": None}
+    page = parse_html(html)
+
+    # --- Check if this is a listing page FIRST ---
+    result["page_title"] = page_title(page)  # kept for logging too
+    if detect_listing_page(page):
+        result["is_listing_page"] = True
+        return result
+
+    # --- Image (og:image) ---
+    result["page_image"] = page_image(page)
+
+    # --- og:type == product ---
+    og_type = page.meta.get(("property", "og:type"), "")
+    result["has_product_schema"] = "product" in og_type.lower()
+
+    # --- JSON-LD Product schema ---
+    for ld in page.ld_json:
+        try:
+            if isinstance(ld, list):
+                ld = ld[0] if ld else {}
+            if str(ld.get("@type", "")).lower() in PRODUCT_LD_TYPES:
+                result["has_product_schema"] = True
+                result["page_price"] = offer_price(ld)
+                break
+        except Exception:
+            continue
+
+    # --- Price from meta ---
+    if not result["page_price"]:
+        result["page_price"] = meta_price(page)
+
+    # --- Buy / Add-to-cart button (count-aware) ---
+    atc_count = buy_button_count(page)
+    result["has_buy_button"] = atc_count > 0
+    # A real product page typically has 1-2 buy buttons
+    # (e.g. sticky header + main). More than 3 is suspicious.
+    result["has_single_buy_button"] = 0 < atc_count <= 3
+
+    # --- Name match (strict: use title, not body text) ---
+    result["name_matches"] = product_name_matches_title(
+        product_name, result["page_title"]
+    )
+
+    # --- Final decision ---
+    # A real product page needs: name matches + (product schema OR
+    # single buy button). Listing pages get caught by the
+    # detect_listing_page check above, but we add extra safety here:
+    # even if not detected as listing, require name match to be strict.
+    if result["name_matches"]:
+        result["is_product_page"] = (
+            result["has_product_schema"] or result["has_single_buy_button"]
+        )
+    # Without name match, only pass if we have both schema + buy button
+    else:
+        result["is_product_page"] = (
+            result["has_product_schema"] and result["has_single_buy_button"]
+        )
+
+    # Guard: if image/price came from a page where name doesn't match,
+    # clear them to avoid using wrong product's data
+    if not result["name_matches"]:
+        result["page_image"] = None
+        result["page_price"] = None
+
+    return result
+
+
+def detect_listing_page(page: Page) -> bool:
+    """Detect whether an HTML page is a listing/category page with multiple products.
+
+    Checks: multiple add-to-cart buttons, ItemList/CollectionPage JSON-LD,
+    product-grid CSS patterns, and <h1> content.
+    """
+    # 1. Count "add to cart" occurrences — a product page has ~1, a listing
+    #    page has many.
+    if page.cart_signals > 3:
+        return True
+
+    # 2. JSON-LD types that mean "listing" not "single product"
+    for ld in page.ld_json:
+        try:
+            if isinstance(ld, list):
+                # Multiple Product objects in one JSON-LD block → listing
+                product_count = sum(
+                    1 for item in ld
+                    if isinstance(item, dict)
+                    and str(item.get("@type", "")).lower() == "product"
+                )
+                if product_count > 1:
+                    return True
+                ld = ld[0] if ld else {}
+            ld_type = str(ld.get("@type", "")).lower()
+            if ld_type in _LISTING_LD_TYPES:
+                # BreadcrumbList alone is fine on product pages — only flag if
+                # it's the ONLY LD+JSON block (no Product block found)
+                if ld_type != "breadcrumblist":
+                    return True
+            # Check for itemListElement with many entries
+            items = ld.get("itemListElement", [])
+            if isinstance(items, list) and len(items) > 3:
+                return True
+        except Exception:
+            continue
+
+    # 3. CSS class patterns typical of product grids (two are enough)
+    html_lower = page.lower
+    grid_hits = 0
+    for p in _GRID_PATTERNS:
+        if p in html_lower:
+            grid_hits += 1
+            if grid_hits >= 2:
+                return True
+
+    # 4. Count separate product-card-like elements (none can match unless
+    #    "product" appears somewhere in the page)
+    if "product" in html_lower:
+        product_cards = page.doc.xpath(
+            _PRODUCT_CARD_XPATH, namespaces=_EXSLT_RE, pattern=_PRODUCT_CARD_PATTERN
+        )
+        if len(product_cards) > 2:
+            return True
+
+    return False
+
+
+def product_name_matches_title(product_name: str, page_title: str | None) -> bool:
+    """Check if significant words from product_name appear in page_title."""
+    if not page_title or not product_name:
+        return False
+    # Extract significant words (>2 chars, not common filler)
+    name_words = [
+        w.lower()
+        for w in _WORD_RE.findall(product_name)
+        if len(w) > 2 and w.lower() not in _TITLE_FILLER
+    ]
+    if not name_words:
+        return False
+    title_lower = page_title.lower()
+    matched = sum(1 for w in name_words if w in title_lower)
+    # Require at least 50% of significant words to match, minimum 2
+    threshold = max(2, len(name_words) * 0.5)
+    return matched >= threshold
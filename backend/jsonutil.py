@@ -0,0 +1,53 @@
+import json
+from typing import Any
+
+# JSON encode/decode used on the hot paths (LLM output, JSON-LD blocks, SSE
+# payloads, cache keys, DB JSON columns). orjson is several times faster
+# than the stdlib and is used when installed; dumps gives str either way and
+# dumps_bytes UTF-8 bytes (orjson's native output, for writing to the wire).
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+if orjson is not None:
+    _OPTS = orjson.OPT_NON_STR_KEYS
+
+    def loads(text: str | bytes) -> Any:
+        """Parse JSON; raises ValueError (json.JSONDecodeError) on bad input."""
+        if isinstance(text, str) and type(text) is not str:
+            text = str(text)  # orjson refuses str subclasses (lxml's XPath strings)
+        return orjson.loads(text)
+
+    def dumps(obj: Any, sort_keys: bool = False) -> str:
+        """Serialise to a compact JSON str; unknown types go through str()."""
+        try:
+            return orjson.dumps(
+                obj, default=str, option=_OPTS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+            ).decode()
+        except TypeError:
+            # e.g. ints beyond 64 bits, which orjson refuses
+            return json.dumps(obj, default=str, sort_keys=sort_keys)
+
+    def dumps_bytes(obj: Any) -> bytes:
+        """dumps() as UTF-8 bytes, without a decode/encode round trip."""
+        try:
+            return orjson.dumps(obj, default=str, option=_OPTS)
+        except TypeError:
+            return json.dumps(obj, default=str).encode()
+
+else:
+
+    def loads(text: str | bytes) -> Any:
+        """Parse JSON; raises ValueError (json.JSONDecodeError) on bad input."""
+        return json.loads(text)
+
+    def dumps(obj: Any, sort_keys: bool = False) -> str:
+        """Serialise to a compact JSON str; unknown types go through str()."""
+        return json.dumps(obj, default=str, sort_keys=sort_keys, separators=(",", ":"))
+
+    def dumps_bytes(obj: Any) -> bytes:
+        """dumps() as UTF-8 bytes, without a decode/encode round trip."""
+        return dumps(obj).encode()
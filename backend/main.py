@@ -1,11 +1,16 @@
-from fastapi import FastAPI, HTTPException, Response, Depends, status
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, Header, HTTPException, Response, Depends, status
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from typing import Optional, List, Union, Callable
-from agent_graph import app as graph_app, set_progress_callback, clear_progress_callback
+from agent_graph import (
+    app as graph_app,
+    clear_progress_callback,
+    prefetch_candidates,
+    set_progress_callback,
+)
 from models import (
     ResearchRequest,
     ResearchResponse,
@@ -14,7 +19,7 @@ from models import (
     PersonalizationAnswersRequest,
     PersonalizationAnswersResponse,
 )
-from database import create_tables, get_db, User, SearchHistory
+from database import create_tables, get_db, prune_checkpoints, User, SearchHistory
 from auth import (
     hash_password,
     verify_password,
@@ -22,19 +27,37 @@ from auth import (
     get_current_user,
 )
 import os
-import json
+import stat
+import ipaddress
 import asyncio
+import hashlib
 import httpx
-from collections import OrderedDict
-import uuid
+import secrets
 import time
+import threading
+from collections import deque
+from urllib.parse import urlsplit
 
-from agents import PersonalizationAgent
+from agents import HTTP2, PersonalizationAgent, warmup as agents_warmup
+from cache import TTLCache
+from jsonutil import dumps_bytes as json_dumps_bytes
 
 # ---------------------------------------------------------------------------
 # App setup
 # ---------------------------------------------------------------------------
-app = FastAPI(title="Maven API", version="2.0.0")
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered through jsonutil (orjson when installed).
+
+    Route return values are validated and converted to JSON-ready data by
+    pydantic-core already; the stdlib json.dumps in JSONResponse.render was
+    the slowest remaining step for a full research response.
+    """
+
+    def render(self, content) -> bytes:
+        return json_dumps_bytes(content)
+
+
+app = FastAPI(title="Maven API", version="2.0.0", default_response_class=FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -48,6 +71,10 @@ app.add_middleware(
 @app.on_event("startup")
 def on_startup():
     create_tables()
+    prune_checkpoints()
+    threading.Thread(target=prune_image_cache, name="image-cache-prune", daemon=True).start()
+    # Warm scraping deps in the background so startup isn't delayed
+    threading.Thread(target=agents_warmup, name="warmup", daemon=True).start()
 
 
 # ---------------------------------------------------------------------------
@@ -176,54 +203,52 @@ def delete_history_item(history_id: int, current_user: User = Depends(get_curren
 # ---------------------------------------------------------------------------
 # Research helpers (unchanged logic)
 # ---------------------------------------------------------------------------
-def execute_research(query: str, progress_callback: Optional[Callable] = None):
-    initial_state = {"query": query, "product_candidates": [], "detailed_reports": [], "final_response": {}}
-    if progress_callback:
-        set_progress_callback(progress_callback)
+async def execute_research(
+    query: str, progress_callback: Optional[Callable] = None, candidates: Optional[list] = None
+):
+    initial_state = {
+        "query": query, "product_candidates": candidates or [], "detailed_reports": [], "final_response": {},
+    }
+    token = set_progress_callback(progress_callback)
     try:
-        result = graph_app.invoke(initial_state)
+        return await graph_app.ainvoke(initial_state)
     finally:
-        clear_progress_callback()
-    return result
+        clear_progress_callback(token)
 
 
 # --- Personalization session store (in-memory) ---
-_PERSONALIZATION_SESSIONS: "OrderedDict[str, dict]" = OrderedDict()
+# LRU-capped and expiring: a session idle (unwritten) for an hour is dropped.
+# TTLCache locks internally, so no extra guard is needed here even if a
+# worker thread reads a session. Sessions are per process: running uvicorn
+# with several workers needs sticky routing or a shared store.
 _MAX_SESSIONS = 200
+SESSION_TTL = 60 * 60
+_PERSONALIZATION_SESSIONS = TTLCache(maxsize=_MAX_SESSIONS, ttl=SESSION_TTL)
 
 
 def _session_put(session_id: str, payload: dict) -> None:
-    if session_id in _PERSONALIZATION_SESSIONS:
-        _PERSONALIZATION_SESSIONS.pop(session_id, None)
-    _PERSONALIZATION_SESSIONS[session_id] = payload
-    while len(_PERSONALIZATION_SESSIONS) > _MAX_SESSIONS:
-        _PERSONALIZATION_SESSIONS.popitem(last=False)
+    _PERSONALIZATION_SESSIONS.set(session_id, payload)
 
 
 def _session_get(session_id: str) -> Optional[dict]:
-    payload = _PERSONALIZATION_SESSIONS.get(session_id)
-    if not payload:
-        return None
-    _PERSONALIZATION_SESSIONS.pop(session_id, None)
-    _PERSONALIZATION_SESSIONS[session_id] = payload
-    return payload
+    return _PERSONALIZATION_SESSIONS.get(session_id) or None
+
+
+def _answer_text(val) -> str:
+    if isinstance(val, list):
+        # str() each item once; None and blank items are dropped
+        return ", ".join(s for v in val if v is not None and (s := str(v)).strip()).strip()
+    return str(val).strip()
 
 
 def _build_personalized_query(query: str, answers: Optional[dict]) -> str:
     if not answers:
         return query
-    lines = []
-    for key, val in answers.items():
-        if val is None:
-            continue
-        if isinstance(val, list):
-            val_str = ", ".join([str(v) for v in val if v is not None and str(v).strip()])
-        else:
-            val_str = str(val)
-        val_str = val_str.strip()
-        if not val_str:
-            continue
-        lines.append(f"- {key}: {val_str}")
+    lines = [
+        f"- {key}: {text}"
+        for key, val in answers.items()
+        if val is not None and (text := _answer_text(val))
+    ]
     if not lines:
         return query
     return (
@@ -239,20 +264,57 @@ personalization_agent = PersonalizationAgent()
 # ---------------------------------------------------------------------------
 # Personalization endpoints
 # ---------------------------------------------------------------------------
+# Off by default: each prefetch is a paid search that answered sessions
+# may not need. When on, the raw query's candidates are found while the
+# questions are shown and stored on the session; its research run reuses
+# them only if the answers left the query unchanged.
+PREFETCH_CANDIDATES = os.getenv("PREFETCH_CANDIDATES", "0").strip() == "1"
+_prefetch_tasks: set[asyncio.Task] = set()
+
+
+async def _prefetch_for_session(session_id: str, query: str) -> None:
+    try:
+        candidates = await prefetch_candidates(query)
+    except Exception as e:
+        print(f"[prefetch] candidate search failed: {e}")
+        return
+    session = _session_get(session_id)
+    if candidates and session is not None:
+        session["candidates"] = candidates
+        session["candidates_query"] = query
+        _session_put(session_id, session)
+
+
+def _session_candidates(session: dict, query: str) -> Optional[list]:
+    """Prefetched candidates, if they were searched for exactly this query."""
+    if session.get("candidates_query") == query:
+        return session.get("candidates")
+    return None
+
+
 @app.post("/api/personalization/init", response_model=PersonalizationInitResponse)
 async def personalization_init(request: PersonalizationInitRequest):
     query = (request.query or "").strip()
     if not query:
         raise HTTPException(status_code=400, detail="Query is required")
 
+    # The session exists from the start so a prefetch can attach to it
+    session_id = secrets.token_hex(16)
+    _session_put(session_id, {"query": query, "questions": [], "answers": {}, "created_at": time.time()})
+    if PREFETCH_CANDIDATES:
+        task = asyncio.create_task(_prefetch_for_session(session_id, query))
+        _prefetch_tasks.add(task)  # the loop only keeps weak refs
+        task.add_done_callback(_prefetch_tasks.discard)
+
     try:
-        questions = personalization_agent.generate_questions(query)
+        questions = await personalization_agent.agenerate_questions(query)
     except Exception as e:
         print(f"Error generating personalization questions: {e}")
         questions = []
 
-    session_id = uuid.uuid4().hex
-    _session_put(session_id, {"query": query, "questions": questions, "answers": {}, "created_at": time.time()})
+    session = _session_get(session_id) or {"query": query, "answers": {}, "created_at": time.time()}
+    session["questions"] = questions
+    _session_put(session_id, session)
     return {"session_id": session_id, "query": query, "questions": questions}
 
 
@@ -265,6 +327,8 @@ async def personalization_answers(request: PersonalizationAnswersRequest):
     if not isinstance(answers, dict):
         raise HTTPException(status_code=400, detail="answers must be an object")
     session["answers"] = answers
+    # Built once here; every research call for the session reuses it
+    session["personalized_query"] = _build_personalized_query(session.get("query", ""), answers)
     _session_put(request.session_id, session)
     return {"ok": True}
 
@@ -276,15 +340,17 @@ async def personalization_answers(request: PersonalizationAnswersRequest):
 async def research(request: ResearchRequest):
     try:
         query = (request.query or "").strip()
+        candidates = None
         if request.session_id:
             session = _session_get(request.session_id)
             if session:
-                query = _build_personalized_query(session.get("query", query), session.get("answers"))
+                query = session.get("personalized_query") or session.get("query", query)
+                candidates = _session_candidates(session, query)
         elif request.preferences:
             query = _build_personalized_query(query, request.preferences)
 
         print(f"Received research request: {query}")
-        result = execute_research(query)
+        result = await execute_research(query, candidates=candidates)
         final_response = result.get("final_response", {})
         if not final_response:
             raise HTTPException(status_code=500, detail="Failed to generate research response")
@@ -297,127 +363,492 @@ async def research(request: ResearchRequest):
 # ---------------------------------------------------------------------------
 # Image proxy
 # ---------------------------------------------------------------------------
+_IMAGE_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+    "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Referer": "https://www.google.com/",
+}
+# A results page requests every product image at once. One pooled client
+# keeps those connections alive (a client per request paid a fresh connect
+# and TLS handshake each time) and bounds how many fetches run at once.
+# With h2 installed, a page's images from one CDN share a single
+# multiplexed HTTP/2 connection.
+_image_client: httpx.AsyncClient | None = None
+
+
+def _get_image_client() -> httpx.AsyncClient:
+    global _image_client
+    if _image_client is None:
+        _image_client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=10.0,
+            headers=_IMAGE_HEADERS,
+            # Runs for every hop, so a redirect can't lead to a rejected host
+            event_hooks={"request": [_check_image_request]},
+            # retries cover failed connects only, never a sent request
+            transport=httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(
+                    max_connections=32, max_keepalive_connections=16, keepalive_expiry=30.0
+                ),
+                http2=HTTP2,
+                retries=1,
+            ),
+        )
+    return _image_client
+
+
+@app.on_event("startup")
+def open_image_client():
+    # Built (with its SSL context) before the first results page asks for images
+    _get_image_client()
+
+
+@app.on_event("shutdown")
+async def close_image_client():
+    global _image_client
+    if _image_client is not None:
+        await _image_client.aclose()
+        _image_client = None
+
+
+# Proxied images are kept on disk under a hash of their URL, so the
+# thumbnails a repeat search shows again are sent from the file instead of
+# being fetched upstream and held in memory a second time.
+IMAGE_CACHE_DIR = os.getenv(
+    "IMAGE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "img_cache")
+)
+IMAGE_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+IMAGE_CACHE_MAX_BYTES = 5 * 1024 * 1024
+# The hottest small images are also held in memory, so a repeat request
+# skips even the disk: at most 256 entries of <= 256 KB (64 MB worst case).
+IMAGE_MEMORY_MAX_BYTES = 256 * 1024
+_image_memory = TTLCache(maxsize=256, ttl=60 * 60)
+# The file extension records the content type. SVG isn't cached: it's
+# markup, not pixels.
+_IMAGE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+    "image/avif": ".avif",
+}
+
+
+def _image_extension(content_type: str) -> str | None:
+    """Cache file extension for a Content-Type; None if it isn't cached."""
+    return _IMAGE_EXTENSIONS.get(content_type.split(";")[0].strip().lower())
+
+
+def _image_cache_key(url: str) -> str:
+    return hashlib.blake2b(url.encode(), digest_size=16).hexdigest()
+
+
+def _cached_image(key: str) -> tuple[str, str, os.stat_result] | None:
+    """(path, content type, stat) of a cached image, or None.
+
+    The stat is handed to FileResponse, which would otherwise stat the file
+    again (on a worker thread) before sending it.
+    """
+    if not IMAGE_CACHE_DIR:
+        return None
+    for content_type, ext in _IMAGE_EXTENSIONS.items():
+        path = os.path.join(IMAGE_CACHE_DIR, key + ext)
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            continue
+        if stat.S_ISREG(file_stat.st_mode):
+            return path, content_type, file_stat
+    return None
+
+
+def _store_image(key: str, content_type: str, content: bytes) -> None:
+    """Write an image into the cache; unknown types and failures are skipped."""
+    ext = _image_extension(content_type)
+    if not IMAGE_CACHE_DIR or ext is None or len(content) > IMAGE_CACHE_MAX_BYTES:
+        return
+    try:
+        os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+        path = os.path.join(IMAGE_CACHE_DIR, key + ext)
+        # Written aside and renamed, so a concurrent read never sees half a file
+        tmp = f"{path}.{secrets.token_hex(16)}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(content)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"[image-cache] write failed: {e}")
+
+
+def prune_image_cache() -> None:
+    """Delete cached images (and stray temp files) older than IMAGE_CACHE_MAX_AGE."""
+    if not IMAGE_CACHE_DIR or not os.path.isdir(IMAGE_CACHE_DIR):
+        return
+    cutoff = time.time() - IMAGE_CACHE_MAX_AGE
+    removed = 0
+    try:
+        with os.scandir(IMAGE_CACHE_DIR) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+    except OSError as e:
+        print(f"[image-cache] prune failed: {e}")
+    if removed:
+        print(f"[image-cache] pruned {removed} file(s)")
+
+
+# Product images come from whatever retailers the search turns up, so any
+# public host is proxied by default; IMAGE_PROXY_HOSTS (comma-separated
+# domains, subdomains included) narrows that to a fixed list.
+IMAGE_PROXY_HOSTS = frozenset(
+    h.strip().lower().strip(".") for h in os.getenv("IMAGE_PROXY_HOSTS", "").split(",") if h.strip()
+)
+
+
+def _image_url_allowed(url: str) -> bool:
+    """Whether url may be fetched: decided from the URL alone, no DNS.
+
+    Rejects loopback/private/link-local addresses, localhost and numeric
+    host spellings (e.g. 2130706433 or 127.1) that resolve to an address,
+    so such requests never reach the connect timeout.
+    """
+    try:
+        parts = urlsplit(url)
+        host = parts.hostname
+        parts.port  # ValueError on a malformed port
+    except ValueError:
+        return False
+    if parts.scheme not in ("http", "https") or not host:
+        return False
+    host = host.rstrip(".")
+    try:
+        return ipaddress.ip_address(host).is_global
+    except ValueError:
+        pass
+    tld = host.rsplit(".", 1)[-1]
+    if tld.isdigit() or tld.startswith("0x") or tld in ("localhost", "local", "internal"):
+        return False
+    if IMAGE_PROXY_HOSTS:
+        return any(host == h or host.endswith("." + h) for h in IMAGE_PROXY_HOSTS)
+    return True
+
+
+async def _check_image_request(request: httpx.Request) -> None:
+    if not _image_url_allowed(str(request.url)):
+        raise httpx.RequestError("Image URL host not allowed", request=request)
+
+
 @app.get("/api/image-proxy")
 async def proxy_image(url: str):
-    if not url or not url.startswith(("http://", "https://")):
+    if not url or not _image_url_allowed(url):
         raise HTTPException(status_code=400, detail="Invalid image URL")
 
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-        "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Referer": "https://www.google.com/",
-    }
+    cache_headers = {"Cache-Control": "public, max-age=86400"}
+    key = _image_cache_key(url)
+    remembered = _image_memory.get(key)
+    if remembered is not None:
+        content_type, body = remembered
+        return Response(body, media_type=content_type, headers=cache_headers)
+    cached = _cached_image(key)
+    if cached is not None:
+        path, content_type, file_stat = cached
+        return FileResponse(
+            path, media_type=content_type, headers=cache_headers, stat_result=file_stat
+        )
+
+    client = _get_image_client()
     try:
-        async with httpx.AsyncClient(follow_redirects=True, timeout=10.0) as client:
-            response = await client.get(url, headers=headers)
+        # Headers first: an error page or non-image is rejected without
+        # downloading its body
+        response = await client.send(client.build_request("GET", url), stream=True)
     except httpx.RequestError as exc:
         raise HTTPException(status_code=502, detail=f"Image fetch failed: {exc.__class__.__name__}")
-
     content_type = response.headers.get("Content-Type", "image/jpeg")
-    if response.status_code >= 400:
-        raise HTTPException(status_code=502, detail="Upstream image fetch failed")
-    if "image" not in content_type.lower():
+    if response.status_code >= 400 or "image" not in content_type.lower():
+        await response.aclose()
+        if response.status_code >= 400:
+            raise HTTPException(status_code=502, detail="Upstream image fetch failed")
         raise HTTPException(status_code=415, detail="URL did not return image content")
 
-    return Response(
-        content=response.content,
-        media_type=content_type,
-        headers={"Cache-Control": "public, max-age=86400"},
+    headers = dict(cache_headers)
+    # The body is forwarded decoded, so a length or tag only holds for an
+    # unencoded upstream body
+    if "Content-Encoding" not in response.headers:
+        for name in ("Content-Length", "ETag"):
+            if name in response.headers:
+                headers[name] = response.headers[name]
+    return StreamingResponse(
+        _relay_image(response, key, content_type), media_type=content_type, headers=headers
     )
 
 
+async def _relay_image(response: httpx.Response, key: str, content_type: str):
+    """Forward an upstream image as it arrives, caching it once complete.
+
+    Only the chunks of an image small enough to cache are kept; a larger
+    one passes through without being held in memory.
+    """
+    kept: list[bytes] | None = []
+    size = 0
+    try:
+        async for chunk in response.aiter_bytes():
+            if kept is not None:
+                size += len(chunk)
+                if size <= IMAGE_CACHE_MAX_BYTES:
+                    kept.append(chunk)
+                else:
+                    kept = None
+            yield chunk
+    except httpx.HTTPError as exc:
+        # Too late for an error status; the browser sees a cut-off image
+        print(f"[image-proxy] {response.url}: {exc.__class__.__name__}")
+        return
+    finally:
+        await response.aclose()
+    if kept is not None:
+        body = b"".join(kept)
+        if size <= IMAGE_MEMORY_MAX_BYTES and _image_extension(content_type):
+            _image_memory.set(key, (content_type, body))
+        await asyncio.to_thread(_store_image, key, content_type, body)
+
+
 # ---------------------------------------------------------------------------
 # SSE stream endpoint (saves result to history when done)
 # ---------------------------------------------------------------------------
+def _save_search_history(user_id: int, query: str, final_response: dict) -> None:
+    try:
+        from database import SessionLocal
+        db = SessionLocal()
+        try:
+            db.add(SearchHistory(
+                user_id=user_id,
+                query=query,
+                products=final_response.get("products"),
+                recommendation=final_response.get("final_recommendation", ""),
+            ))
+            db.commit()
+        finally:
+            db.close()
+    except Exception as e:
+        print(f"Failed to save search history: {e}")
+
+
+SSE_HEARTBEAT_SECONDS = 15.0
+# Progress must reach the browser as it's written: no caching, no proxy
+# buffering (nginx honours X-Accel-Buffering) and no compression, which
+# would hold events back until a compressor block fills
+_SSE_HEADERS = {
+    "Cache-Control": "no-cache, no-transform",
+    "X-Accel-Buffering": "no",
+    "Content-Encoding": "identity",
+}
+
+
+def _sse(payload: dict) -> bytes:
+    # Frames are written as bytes so orjson's output goes out without a
+    # decode here and a re-encode in StreamingResponse
+    return b"data: " + json_dumps_bytes(payload) + b"\n\n"
+
+
+# Each stream's frames carry an id and are kept for a while, so an
+# EventSource reconnect (which sends Last-Event-ID) resumes the same run
+# instead of starting the research again.
+SSE_RETRY_MS = 3000
+SSE_REPLAY_FRAMES = 200
+SSE_REPLAY_SECONDS = 60.0
+
+
+class _StreamLog:
+    """Events of one research stream, for its connection and any reconnects.
+
+    The research runs in its own task and appends here; each connection
+    replays the events after the id it last saw, then follows along.
+    """
+
+    def __init__(self):
+        self.events: "deque[tuple[int, dict]]" = deque(maxlen=SSE_REPLAY_FRAMES)
+        self.last_id = 0
+        self.done = False
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def append(self, payload: dict, final: bool = False) -> None:
+        self.last_id += 1
+        self.events.append((self.last_id, payload))
+        if final:
+            self.finish()
+        else:
+            self._changed.set()
+
+    def finish(self) -> None:
+        self.done = True
+        self._changed.set()
+
+    async def follow(self, after: int = 0):
+        while True:
+            pending = [(i, payload) for i, payload in list(self.events) if i > after]
+            if pending:
+                after = pending[-1][0]
+                for frame in _event_frames(pending):
+                    yield frame
+                continue  # more may have arrived while those were written
+            if self.done:
+                return
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # Only when idle: keeps proxies from closing the stream
+                yield _HEARTBEAT
+
+
+def _event_frames(events: list):
+    """SSE frames for (id, payload) events, oldest first.
+
+    Progress that queued up while the last frame was written goes out as
+    one frame, under the newest id it covers.
+    """
+    messages: list = []
+    progress_id = 0
+    for event_id, payload in events:
+        if payload["type"] == "progress":
+            messages.extend(payload.get("messages") or [payload["message"]])
+            progress_id = event_id
+            continue
+        if messages:
+            yield _progress_frame(progress_id, messages)
+            messages = []
+        yield b"id: %d\n" % event_id + _sse(payload)
+    if messages:
+        yield _progress_frame(progress_id, messages)
+
+
+# Progress frames have a fixed shape, so only the message text (or list)
+# is serialised; the result is byte-identical to _sse() of the full dict
+_PROGRESS_ONE = b'\ndata: {"type":"progress","message":'
+_PROGRESS_MANY = b'\ndata: {"type":"progress","messages":'
+_FRAME_END = b"}\n\n"
+_HEARTBEAT = b": heartbeat\n\n"
+_RETRY_FRAME = b"retry: %d\n\n" % SSE_RETRY_MS
+
+
+def _progress_frame(event_id: int, messages: list) -> bytes:
+    if len(messages) == 1:
+        return b"id: %d" % event_id + _PROGRESS_ONE + json_dumps_bytes(messages[0]) + _FRAME_END
+    return b"id: %d" % event_id + _PROGRESS_MANY + json_dumps_bytes(messages) + _FRAME_END
+
+
+# (session_id, query, user_id) -> the latest stream for those parameters
+_stream_logs: dict[tuple, _StreamLog] = {}
+
+
+def _forget_stream(key: tuple, log: _StreamLog) -> None:
+    if _stream_logs.get(key) is log:
+        del _stream_logs[key]
+
+
+async def _produce_stream(
+    log: _StreamLog,
+    key: tuple,
+    resolved_query: str,
+    original_query: str,
+    user_id: Optional[int],
+    candidates: Optional[list] = None,
+) -> None:
+    """Run the research for a stream, recording progress and the result in log."""
+    try:
+        loop = asyncio.get_running_loop()
+
+        def progress_callback(message: str):
+            try:
+                loop.call_soon_threadsafe(log.append, {'type': 'progress', 'message': message})
+            except Exception as e:
+                print(f"Error in progress_callback: {e}")
+
+        result = await execute_research(resolved_query, progress_callback, candidates)
+        # Yield once so progress scheduled before the run finished (even
+        # from the loop thread itself) is appended ahead of the result
+        await asyncio.sleep(0)
+        final_response = result.get("final_response", {})
+
+        if not final_response:
+            log.append({'type': 'error', 'message': 'Failed to generate research response'}, final=True)
+        else:
+            # Persist to search history if user_id provided (in a thread:
+            # the commit is blocking database I/O)
+            if user_id:
+                await asyncio.to_thread(
+                    _save_search_history, user_id, original_query, final_response
+                )
+
+            log.append({'type': 'complete', 'data': final_response}, final=True)
+
+    except Exception as e:
+        print(f"Error in stream: {e}")
+        import traceback
+        traceback.print_exc()
+        log.append({'type': 'error', 'message': str(e)}, final=True)
+    finally:
+        log.finish()
+        asyncio.get_running_loop().call_later(SSE_REPLAY_SECONDS, _forget_stream, key, log)
+
+
 @app.get("/api/research/stream")
 async def research_stream(
     query: Optional[str] = None,
     session_id: Optional[str] = None,
     user_id: Optional[int] = None,
+    last_event_id: Optional[str] = Header(None),
 ):
     """Stream research progress via Server-Sent Events.
     user_id is passed as a query-param by the authenticated frontend.
+    A reconnect carrying Last-Event-ID resumes the stream it dropped.
     """
+    key = (session_id, query, user_id)
 
     async def event_generator():
-        try:
-            resolved_query = (query or "").strip()
-            original_query = resolved_query
-
-            if session_id:
-                session = _session_get(session_id)
-                if not session:
-                    yield f"data: {json.dumps({'type': 'error', 'message': 'Unknown session_id'})}\n\n"
-                    return
-                original_query = session.get("query", resolved_query)
-                resolved_query = _build_personalized_query(original_query, session.get("answers"))
-
-            if not resolved_query:
-                yield f"data: {json.dumps({'type': 'error', 'message': 'Query is required'})}\n\n"
+        yield _RETRY_FRAME
+
+        log = _stream_logs.get(key)
+        if log is not None and last_event_id and last_event_id.isdigit():
+            async for frame in log.follow(int(last_event_id)):
+                yield frame
+            return
+
+        resolved_query = (query or "").strip()
+        original_query = resolved_query
+        candidates = None
+
+        if session_id:
+            session = _session_get(session_id)
+            if not session:
+                yield _sse({'type': 'error', 'message': 'Unknown session_id'})
                 return
-
-            message_queue = asyncio.Queue()
-            loop = asyncio.get_event_loop()
-
-            def progress_callback(message: str):
-                try:
-                    loop.call_soon_threadsafe(message_queue.put_nowait, message)
-                except Exception as e:
-                    print(f"Error in progress_callback: {e}")
-
-            import concurrent.futures
-            executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
-            future = executor.submit(execute_research, resolved_query, progress_callback)
-
-            while not future.done():
-                try:
-                    message = await asyncio.wait_for(message_queue.get(), timeout=0.5)
-                    yield f"data: {json.dumps({'type': 'progress', 'message': message})}\n\n"
-                except asyncio.TimeoutError:
-                    yield f": heartbeat\n\n"
-
-            while not message_queue.empty():
-                try:
-                    message = message_queue.get_nowait()
-                    yield f"data: {json.dumps({'type': 'progress', 'message': message})}\n\n"
-                except Exception:
-                    break
-
-            result = future.result()
-            final_response = result.get("final_response", {})
-
-            if not final_response:
-                yield f"data: {json.dumps({'type': 'error', 'message': 'Failed to generate research response'})}\n\n"
-            else:
-                # Persist to search history if user_id provided
-                if user_id:
-                    try:
-                        from database import SessionLocal
-                        db = SessionLocal()
-                        entry = SearchHistory(
-                            user_id=user_id,
-                            query=original_query,
-                            products=final_response.get("products"),
-                            recommendation=final_response.get("final_recommendation", ""),
-                        )
-                        db.add(entry)
-                        db.commit()
-                        db.close()
-                    except Exception as e:
-                        print(f"Failed to save search history: {e}")
-
-                yield f"data: {json.dumps({'type': 'complete', 'data': final_response})}\n\n"
-
-        except Exception as e:
-            print(f"Error in stream: {e}")
-            import traceback
-            traceback.print_exc()
-            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
-
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+            original_query = session.get("query", resolved_query)
+            resolved_query = session.get("personalized_query") or original_query
+            candidates = _session_candidates(session, resolved_query)
+
+        if not resolved_query:
+            yield _sse({'type': 'error', 'message': 'Query is required'})
+            return
+
+        log = _stream_logs[key] = _StreamLog()
+        # Runs on if this connection drops; the log holds the task
+        log.task = asyncio.create_task(
+            _produce_stream(log, key, resolved_query, original_query, user_id, candidates)
+        )
+        async for frame in log.follow():
+            yield frame
+
+    return StreamingResponse(
+        event_generator(), media_type="text/event-stream", headers=_SSE_HEADERS
+    )
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # "auto" picks uvloop and httptools when installed (see requirements.txt)
+    # and falls back to asyncio/h11. One worker: personalization sessions
+    # and the single-flight/result caches are per process.
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="auto", http="auto")
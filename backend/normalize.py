@@ -0,0 +1,195 @@
+import re
+from typing import Any, Callable, Optional
+
+from cache import TTLCache, content_key
+
+_RATING_RE = re.compile(r"(\d+\.?\d*)")
+_REVIEWS_RE = re.compile(r"\d+")
+
+# Field coercions are dispatched on type(value) through these tables, one
+# dict lookup per field instead of an isinstance ladder. Types without an
+# entry fall back to the handler passed to .get().
+#
+# Everything here is fully annotated and avoids dynamic tricks so the module
+# can be compiled with mypyc (``mypyc normalize.py``); a built extension is
+# picked up in place of this file with no import changes.
+
+Handler = Callable[[Any], Any]
+
+
+def _keep(value: Any) -> Any:
+    return value
+
+
+_MISSING = object()
+
+
+def _price_from_dict(price: dict[str, Any]) -> Any:
+    # One probe per key (a present-but-None value still wins, as before)
+    for key in ("starting", "msrp", "price", "lowPrice"):
+        value = price.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+    return next(
+        (v for v in price.values() if isinstance(v, (int, float))), "Price varies"
+    )
+
+
+def _coerce_price(price: Any) -> Any:
+    return _PRICE_HANDLERS.get(type(price), _keep)(price)
+
+
+_PRICE_HANDLERS: dict[type, Handler] = {
+    dict: _price_from_dict,
+    str: lambda s: s or "Price not available",
+    type(None): lambda _: "Price not available",
+}
+
+
+def _rating_from_str(rating: str) -> float:
+    m = _RATING_RE.search(rating)
+    return float(m.group(1)) if m else 4.0
+
+
+def _rating_fallback(rating: Any) -> float:
+    try:
+        return float(rating)
+    except (ValueError, TypeError):
+        return 4.0
+
+
+def _coerce_rating(rating: Any) -> float:
+    return _RATING_HANDLERS.get(type(rating), _rating_fallback)(rating)
+
+
+_RATING_HANDLERS: dict[type, Handler] = {
+    float: _keep,
+    int: float,
+    str: _rating_from_str,
+    dict: lambda d: _coerce_rating(d.get("score", d.get("value", 4.0))),
+    type(None): lambda _: 4.0,
+}
+
+
+def _features_from_dict(features: dict[Any, Any]) -> list[str]:
+    # The frontend renders features as a list, so a dict has to be flattened;
+    # map/zip/join keep the per-item work in C
+    return list(map(": ".join, zip(map(str, features), map(str, features.values()))))
+
+
+_FEATURES_HANDLERS: dict[type, Handler] = {
+    list: _keep,
+    dict: _features_from_dict,
+}
+
+
+def _reviews_from_str(rc: str) -> Optional[int]:
+    m = _REVIEWS_RE.search(rc.replace(",", ""))
+    return int(m.group()) if m else None
+
+
+_REVIEWS_HANDLERS: dict[type, Handler] = {
+    dict: lambda _: None,
+    str: _reviews_from_str,
+}
+
+
+# Popular products come back from the (cached) upstream agents with
+# identical payloads, so finished results are memoised by content hash.
+_normalize_cache = TTLCache(maxsize=256)
+
+
+_LIST_FIELDS = ("features", "pros", "cons")
+_INTERNAL_KEYS = ("source_urls", "search_image")
+
+
+def _is_normalized(product: dict[str, Any]) -> bool:
+    """True if _normalize_fields would leave ``product`` unchanged."""
+    if not product.get("name") or "link_verified" not in product:
+        return False
+    price = product.get("price")
+    if type(price) not in (int, float) and not (type(price) is str and price):
+        return False
+    rating = product.get("rating")
+    if type(rating) is not float or not 1.0 <= rating <= 5.0:
+        return False
+    for key in _LIST_FIELDS:
+        if type(product.get(key)) is not list:
+            return False
+    if type(product.get("reviews_count")) not in (int, type(None)):
+        return False
+    url = product.get("url")
+    link = product.get("cheapest_link")
+    if type(url) is not str or not (link or (link == "" and url == "")):
+        return False
+    image = product.get("image_url", "")
+    if not image and image is not None:
+        return False
+    if "image_data" not in product or product["image_data"] is not None:
+        return False
+    return not any(key in product for key in _INTERNAL_KEYS)
+
+
+def normalize_product_data(product: dict[str, Any]) -> dict[str, Any]:
+    """Ensure product data matches the Product Pydantic model.
+
+    Normalises ``product`` in place and returns it.
+    """
+    # Already-clean products (e.g. re-normalised cached results) skip both
+    # the field walk and the content hash
+    if _is_normalized(product):
+        return product
+
+    key = content_key(product)
+    cached = _normalize_cache.get(key)
+    if cached is not None:
+        product.clear()
+        product.update(cached)
+        return product
+
+    _normalize_fields(product)
+    _normalize_cache.set(key, product)
+    return product
+
+
+def _normalize_fields(product: dict[str, Any]) -> None:
+    # -- name --
+    if not product.get("name"):
+        product["name"] = "Unknown Product"
+
+    # -- price --
+    product["price"] = _coerce_price(product.get("price"))
+
+    # -- rating (float 1.0-5.0) --
+    rating = _coerce_rating(product.get("rating", 4.0))
+    product["rating"] = max(1.0, min(5.0, rating))
+
+    # -- features --
+    features = product.get("features", [])
+    product["features"] = _FEATURES_HANDLERS.get(type(features), lambda _: [])(features)
+
+    # -- pros / cons --
+    for key in ("pros", "cons"):
+        if not isinstance(product.get(key), list):
+            product[key] = []
+
+    # -- reviews_count --
+    rc = product.get("reviews_count")
+    product["reviews_count"] = _REVIEWS_HANDLERS.get(type(rc), _keep)(rc)
+
+    # -- urls --
+    url = product.get("url") or ""
+    product["url"] = url
+    if not product.get("cheapest_link"):
+        product["cheapest_link"] = url
+
+    # -- image --
+    product["image_url"] = product.get("image_url") or None
+    product["image_data"] = None  # legacy field, not used
+
+    # -- drop internal-only keys --
+    product.pop("source_urls", None)
+    product.pop("search_image", None)
+
+    # -- link_verified (from LinkVerificationAgent) --
+    product.setdefault("link_verified", False)
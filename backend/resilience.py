@@ -0,0 +1,207 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable
+
+import httpx
+
+# ---------------------------------------------------------------------------
+# Transient-error classification
+# ---------------------------------------------------------------------------
+
+_TRANSIENT_TYPES = (httpx.TransportError, TimeoutError, ConnectionError)
+
+# Provider SDKs (groq, google-genai, tavily) each ship their own exception
+# hierarchy; match on class name so none of them has to be imported here.
+_TRANSIENT_NAMES = {
+    "RateLimitError",
+    "APITimeoutError",
+    "APIConnectionError",
+    "InternalServerError",
+    "ResourceExhausted",
+    "ServiceUnavailable",
+    "DeadlineExceeded",
+}
+
+
+def is_transient(exc: BaseException) -> bool:
+    return isinstance(exc, _TRANSIENT_TYPES) or type(exc).__name__ in _TRANSIENT_NAMES
+
+
+def retry_with_backoff(
+    fn: Callable[..., Any],
+    *args: Any,
+    attempts: int = 3,
+    base: float = 0.5,
+    cap: float = 4.0,
+    **kwargs: Any,
+) -> Any:
+    """Call fn, retrying transient errors with full-jitter exponential backoff.
+
+    Sleep before retry n is uniform(0, min(cap, base * 2**n)), which spreads
+    retries from concurrent callers instead of having them stampede together.
+    Non-transient errors are raised immediately.
+    """
+    for attempt in range(attempts):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as exc:
+            if attempt == attempts - 1 or not is_transient(exc):
+                raise
+            time.sleep(random.uniform(0, min(cap, base * 2 ** attempt)))
+
+
+async def aretry_with_backoff(
+    fn: Callable[..., Awaitable[Any]],
+    *args: Any,
+    attempts: int = 3,
+    base: float = 0.5,
+    cap: float = 4.0,
+    **kwargs: Any,
+) -> Any:
+    """retry_with_backoff for a coroutine function; sleeps without blocking."""
+    for attempt in range(attempts):
+        try:
+            return await fn(*args, **kwargs)
+        except Exception as exc:
+            if attempt == attempts - 1 or not is_transient(exc):
+                raise
+            await asyncio.sleep(random.uniform(0, min(cap, base * 2 ** attempt)))
+
+
+# ---------------------------------------------------------------------------
+# Rate limiting
+# ---------------------------------------------------------------------------
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` calls per `period` seconds (bursts up to
+    `rate`); rate <= 0 disables it.
+
+    Pacing calls under a provider's RPM up front is cheaper than running into
+    429s, whose backoff retries serialise an otherwise parallel fan-out. A
+    caller reserves its token under the lock and sleeps outside it, so
+    threads and coroutines can share one limiter.
+    """
+
+    def __init__(self, name: str, rate: float, period: float = 60.0):
+        self.name = name
+        self.rate = rate
+        self.period = period
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take a token; return how long to wait before it may be used."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.rate,
+                self._tokens + (now - self._updated) * self.rate / self.period,
+            )
+            self._updated = now
+            # Going negative queues the caller behind earlier reservations
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens * self.period / self.rate
+
+    def acquire(self) -> None:
+        delay = self._reserve()
+        if delay:
+            time.sleep(delay)
+
+    async def aacquire(self) -> None:
+        delay = self._reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+# ---------------------------------------------------------------------------
+# Circuit breaker
+# ---------------------------------------------------------------------------
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+
+class CircuitBreaker:
+    """CLOSED → OPEN after fail_threshold consecutive failures; OPEN → HALF_OPEN
+    after reset_after seconds, letting a single trial call through. The trial
+    closes the circuit on success and re-opens it on failure.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, fail_threshold: int = 3, reset_after: float = 60.0):
+        self.name = name
+        self.fail_threshold = fail_threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_after:
+                self.state = self.HALF_OPEN
+                return True
+            return False  # OPEN, or HALF_OPEN with the trial still in flight
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.state = self.CLOSED
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.fail_threshold:
+                if self.state != self.OPEN:
+                    print(f"[circuit] {self.name} opened after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def _release_trial(self) -> None:
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                # Let the next allow() start a fresh trial straight away
+                self.opened_at = time.monotonic() - self.reset_after
+
+    def call(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit open for {self.name}")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    async def acall(self, fn: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any) -> Any:
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit open for {self.name}")
+        try:
+            result = await fn(*args, **kwargs)
+        except asyncio.CancelledError:
+            # A caller's deadline isn't an upstream verdict, but a cancelled
+            # half-open trial must not leave the circuit stuck half-open
+            self._release_trial()
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
@@ -2,7 +2,8 @@
 Tests for the Maven backend API endpoints.
 
 Covers auth (signup, login, /me), search history CRUD,
-personalization, and the research endpoint.
+personalization, the research endpoint, product normalisation, and the
+pipeline caches / circuit breaker.
 
 Run:
     cd backend && python -m pytest test_api.py -v
@@ -10,6 +11,7 @@ Run:
 
 import os
 import sys
+import asyncio
 import tempfile
 
 import pytest
@@ -32,6 +34,14 @@ os.environ["DATABASE_URL"] = TEST_DATABASE_URL
 
 from database import Base, get_db, engine, SessionLocal, SearchHistory  # noqa: E402
 from main import app  # noqa: E402
+from cache import SimilarityCache, TTLCache, cache_key  # noqa: E402
+from resilience import (  # noqa: E402
+    CircuitBreaker, CircuitOpenError, RateLimiter, retry_with_backoff,
+)
+import agent_graph  # noqa: E402
+import agents  # noqa: E402
+import html_parse  # noqa: E402
+from normalize import normalize_product_data  # noqa: E402
 
 
 @pytest.fixture(autouse=True)
@@ -242,6 +252,89 @@ class TestPersonalization:
         resp = client.post("/api/personalization/init", json={})
         assert resp.status_code == 422
 
+    def test_init_awaits_the_llm_instead_of_blocking(self, client, monkeypatch):
+        import main
+        from langchain_core.language_models import FakeListChatModel
+
+        class AsyncOnlyModel(FakeListChatModel):
+            def invoke(self, *args, **kwargs):
+                raise AssertionError("blocking call on the event loop")
+
+        monkeypatch.setattr(main.personalization_agent, "llm", AsyncOnlyModel(
+            responses=['[{"id": "budget", "question": "Budget?", "type": "text"}]']
+        ))
+        monkeypatch.setattr(agents, "_questions_cache", SimilarityCache())
+        monkeypatch.setattr(main, "PREFETCH_CANDIDATES", False)
+        resp = client.post("/api/personalization/init", json={"query": "trail shoes"})
+        assert resp.status_code == 200
+        assert resp.json()["questions"][0]["id"] == "budget"
+
+    def test_prefetch_is_off_by_default(self):
+        import main
+
+        assert main.PREFETCH_CANDIDATES is False
+
+    def test_prefetched_candidates_are_reused_by_the_session(self, client, monkeypatch):
+        import time
+        import main
+
+        searches, used = [], []
+
+        async def fake_search(query):
+            searches.append(query)
+            await asyncio.sleep(0.05)
+            return [{"name": "Trail Runner 2"}]
+
+        async def fake_questions(query):
+            return [{"id": "budget", "question": "Budget?", "type": "text", "options": []}]
+
+        async def fake_execute(query, progress_callback=None, candidates=None):
+            used.append((query, candidates))
+            return {"final_response": {"products": [], "final_recommendation": "r"}}
+
+        monkeypatch.setattr(agent_graph, "search_products", fake_search)
+        monkeypatch.setattr(agent_graph, "_result_cache", SimilarityCache())
+        monkeypatch.setattr(main.personalization_agent, "agenerate_questions", fake_questions)
+        monkeypatch.setattr(main, "execute_research", fake_execute)
+        monkeypatch.setattr(main, "PREFETCH_CANDIDATES", True)
+
+        resp = client.post("/api/personalization/init", json={"query": " trail shoes "})
+        session_id = resp.json()["session_id"]
+        assert resp.json()["questions"][0]["id"] == "budget"
+        deadline = time.time() + 2
+        while not main._session_get(session_id).get("candidates") and time.time() < deadline:
+            time.sleep(0.01)
+        assert searches == ["trail shoes"]
+
+        client.post("/api/research", json={"query": "trail shoes", "session_id": session_id})
+        assert used[0] == ("trail shoes", [{"name": "Trail Runner 2"}])
+
+        # Answers change the query, so the raw query's candidates no longer apply
+        client.post("/api/personalization/answers", json={"session_id": session_id, "answers": {"budget": "100"}})
+        client.post("/api/research", json={"query": "trail shoes", "session_id": session_id})
+        client.get("/api/research/stream", params={"session_id": session_id})
+        assert [q.startswith("User request: trail shoes") for q, _ in used[1:]] == [True, True]
+        assert [c for _, c in used[1:]] == [None, None]
+
+    def test_prefetch_respects_result_cache_and_slots(self, monkeypatch):
+        searches = []
+
+        async def fake_search(query):
+            searches.append(agent_graph._research_slots().locked())
+            return {"products": [{"name": "A"}, {"name": "B"}]}
+
+        monkeypatch.setattr(agent_graph, "search_products", fake_search)
+        monkeypatch.setattr(agent_graph, "RESEARCH_CONCURRENCY", 1)
+        monkeypatch.setattr(agent_graph, "_loop_slots", agent_graph.weakref.WeakKeyDictionary())
+        cached = SimilarityCache()
+        cached.set("desk lamp", {"final_response": {"products": [{"name": "A"}]}})
+        monkeypatch.setattr(agent_graph, "_result_cache", cached)
+
+        assert asyncio.run(agent_graph.prefetch_candidates("best desk lamp")) is None
+        assert searches == []
+        assert asyncio.run(agent_graph.prefetch_candidates("standing desk")) == [{"name": "A"}, {"name": "B"}]
+        assert searches == [True]  # searched while holding a research slot
+
     def test_answers_unknown_session(self, client):
         resp = client.post("/api/personalization/answers", json={
             "session_id": "nonexistent",
@@ -255,6 +348,59 @@ class TestPersonalization:
         })
         assert resp.status_code == 422
 
+    def test_answers_precompute_personalized_query(self, client, monkeypatch):
+        import main
+
+        main._session_put("s1", {"query": "laptop", "questions": [], "answers": {}})
+        resp = client.post("/api/personalization/answers", json={
+            "session_id": "s1", "answers": {"budget": "500", "use": ["games", ""]},
+        })
+        assert resp.status_code == 200
+        expected = main._build_personalized_query("laptop", {"budget": "500", "use": ["games", ""]})
+        assert main._session_get("s1")["personalized_query"] == expected
+
+        seen = []
+
+        async def fake_execute(query, progress_callback=None, candidates=None):
+            seen.append(query)
+            return {"final_response": {"products": [], "final_recommendation": "none"}}
+
+        monkeypatch.setattr(main, "execute_research", fake_execute)
+        client.post("/api/research", json={"query": "ignored", "session_id": "s1"})
+        assert seen == [expected]
+
+    def test_sessions_expire_and_stay_capped(self, monkeypatch):
+        import main
+
+        sessions = main.TTLCache(maxsize=2, ttl=60)
+        monkeypatch.setattr(main, "_PERSONALIZATION_SESSIONS", sessions)
+        for sid in ("a", "b", "c"):
+            main._session_put(sid, {"query": sid, "answers": {}})
+        assert main._session_get("a") is None
+        assert main._session_get("c") == {"query": "c", "answers": {}}
+
+        sessions.ttl = 0
+        main._session_put("d", {"query": "d"})
+        assert main._session_get("d") is None
+
+    def test_session_store_is_safe_across_threads(self, monkeypatch):
+        import main
+        from concurrent.futures import ThreadPoolExecutor
+
+        sessions = main.TTLCache(maxsize=16, ttl=60)
+        monkeypatch.setattr(main, "_PERSONALIZATION_SESSIONS", sessions)
+
+        def churn(worker):
+            for i in range(500):
+                sid = f"{worker}-{i % 32}"
+                main._session_put(sid, {"query": sid})
+                session = main._session_get(sid)
+                assert session is None or session["query"] == sid
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(churn, range(8)))
+        assert len(sessions) <= 16
+
 
 # ---------------------------------------------------------------------------
 # Research (non-streaming) – quick smoke test
@@ -270,11 +416,33 @@ class TestResearch:
         resp = client.post("/api/research")
         assert resp.status_code == 422
 
+    def test_research_response_is_rendered_by_jsonutil(self, client, monkeypatch):
+        import main
+
+        async def fake_execute(query, progress_callback=None, candidates=None):
+            product = {"name": "Café lamp", "price": "Price varies", "rating": 4.5}
+            return {"final_response": {"products": [product], "final_recommendation": "✓"}}
+
+        monkeypatch.setattr(main, "execute_research", fake_execute)
+        resp = client.post("/api/research", json={"query": "lamp"})
+        assert resp.status_code == 200
+        assert resp.headers["content-type"] == "application/json"
+        assert "Café lamp".encode() in resp.content  # UTF-8, not \u escapes
+        body = resp.json()
+        assert body["products"][0]["price"] == "Price varies"
+        assert body["final_recommendation"] == "✓"
+
 
 # ---------------------------------------------------------------------------
 # Image proxy
 # ---------------------------------------------------------------------------
 class TestImageProxy:
+    @pytest.fixture(autouse=True)
+    def fresh_image_memory(self, monkeypatch):
+        import main
+
+        monkeypatch.setattr(main, "_image_memory", TTLCache(maxsize=256, ttl=60))
+
     def test_image_proxy_no_url(self, client):
         resp = client.get("/api/image-proxy")
         assert resp.status_code in (400, 422)
@@ -283,16 +451,1177 @@ class TestImageProxy:
         resp = client.get("/api/image-proxy", params={"url": "not-a-url"})
         assert resp.status_code == 400
 
+    @pytest.mark.parametrize("url", [
+        "ftp://cdn.example.com/a.png",
+        "http://localhost:8000/api/history",
+        "http://127.0.0.1/a.png",
+        "http://10.0.0.5/a.png",
+        "http://169.254.169.254/latest/meta-data/",
+        "http://[::1]/a.png",
+        "http://[::ffff:127.0.0.1]/a.png",
+        "http://2130706433/a.png",
+        "http://127.1/a.png",
+        "http://0x7f.0x1/a.png",
+        "http://printer.local/a.png",
+        "http://cdn.example.com:99999/a.png",
+        "https:///a.png",
+    ])
+    def test_image_proxy_rejects_non_public_hosts(self, client, monkeypatch, url):
+        import main
+
+        def no_network():
+            raise AssertionError("rejected URL reached the client")
+
+        monkeypatch.setattr(main, "_get_image_client", no_network)
+        assert client.get("/api/image-proxy", params={"url": url}).status_code == 400
+
+    def test_image_proxy_refuses_redirects_to_private_hosts(self, client, monkeypatch):
+        import httpx
+        import main
+
+        fetched = []
+
+        def handler(request):
+            fetched.append(request.url.host)
+            return httpx.Response(302, headers={"Location": "http://127.0.0.1/secret.png"})
+
+        # the real client (with its hooks) over a mock transport
+        monkeypatch.setattr(main, "_image_client", None)
+        monkeypatch.setattr(httpx, "AsyncHTTPTransport", lambda **kw: httpx.MockTransport(handler))
+        resp = client.get("/api/image-proxy", params={"url": "https://cdn.example.com/a.png"})
+        assert resp.status_code == 502
+        assert fetched == ["cdn.example.com"]
+
+    def test_image_proxy_host_allowlist(self, monkeypatch):
+        import main
+
+        assert main._image_url_allowed("https://images.retailer.example/x.jpg")
+        assert main._image_url_allowed("https://8.8.8.8/x.jpg")
+        monkeypatch.setattr(main, "IMAGE_PROXY_HOSTS", frozenset({"media-amazon.com"}))
+        assert main._image_url_allowed("https://m.media-amazon.com/images/I/x.jpg")
+        assert main._image_url_allowed("https://media-amazon.com/x.jpg")
+        assert not main._image_url_allowed("https://evilmedia-amazon.com/x.jpg")
+        assert not main._image_url_allowed("https://images.retailer.example/x.jpg")
+
+    def test_image_proxy_reuses_one_client(self, client, monkeypatch, tmp_path):
+        import httpx
+        import main
+
+        def handler(request):
+            assert request.headers["referer"] == "https://www.google.com/"
+            return httpx.Response(200, content=b"img", headers={"Content-Type": "image/png"})
+
+        assert main._image_client is not None  # built at startup
+        shared = httpx.AsyncClient(
+            transport=httpx.MockTransport(handler), headers=main._IMAGE_HEADERS
+        )
+        monkeypatch.setattr(main, "_image_client", shared)
+        monkeypatch.setattr(main, "IMAGE_CACHE_DIR", str(tmp_path))
+        for n in range(2):
+            resp = client.get("/api/image-proxy", params={"url": f"https://cdn.example.com/{n}.png"})
+            assert resp.status_code == 200 and resp.content == b"img"
+        assert main._get_image_client() is shared
+
+    def test_repeat_images_are_served_from_disk(self, client, monkeypatch, tmp_path):
+        import httpx
+        import main
+
+        fetched = []
+
+        def handler(request):
+            fetched.append(str(request.url))
+            content_type = "image/svg+xml" if request.url.path.endswith(".svg") else "image/webp"
+            return httpx.Response(200, content=b"img", headers={"Content-Type": content_type})
+
+        monkeypatch.setattr(main, "_image_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        monkeypatch.setattr(main, "IMAGE_CACHE_DIR", str(tmp_path))
+        for url in ["https://cdn.example.com/a.webp"] * 2 + ["https://cdn.example.com/b.svg"] * 2:
+            resp = client.get("/api/image-proxy", params={"url": url})
+            assert resp.status_code == 200 and resp.content == b"img"
+            assert resp.headers["content-type"] == "image/" + ("svg+xml" if url.endswith(".svg") else "webp")
+        # the webp is cached (and keeps its type); the svg never is
+        assert fetched == ["https://cdn.example.com/a.webp"] + ["https://cdn.example.com/b.svg"] * 2
+        assert [p.suffix for p in tmp_path.iterdir()] == [".webp"]
+
+    def test_small_images_are_served_from_memory(self, client, monkeypatch):
+        import httpx
+        import main
+
+        fetched = []
+
+        def handler(request):
+            fetched.append(str(request.url))
+            return httpx.Response(200, content=b"thumb", headers={"Content-Type": "image/jpeg"})
+
+        monkeypatch.setattr(main, "_image_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        monkeypatch.setattr(main, "IMAGE_CACHE_DIR", "")  # memory tier works without the disk
+        for _ in range(3):
+            resp = client.get("/api/image-proxy", params={"url": "https://cdn.example.com/t.jpg"})
+            assert resp.status_code == 200 and resp.content == b"thumb"
+            assert resp.headers["content-type"] == "image/jpeg"
+            assert resp.headers["cache-control"] == "public, max-age=86400"
+        assert fetched == ["https://cdn.example.com/t.jpg"]
+
+        monkeypatch.setattr(main, "IMAGE_MEMORY_MAX_BYTES", 2)
+        client.get("/api/image-proxy", params={"url": "https://cdn.example.com/big.jpg"})
+        client.get("/api/image-proxy", params={"url": "https://cdn.example.com/big.jpg"})
+        assert fetched.count("https://cdn.example.com/big.jpg") == 2
+
+    def test_disk_hits_reuse_the_lookup_stat(self, client, monkeypatch, tmp_path):
+        import main
+
+        monkeypatch.setattr(main, "IMAGE_CACHE_DIR", str(tmp_path))
+        url = "https://cdn.example.com/c.png"
+        main._store_image(main._image_cache_key(url), "image/png", b"png-bytes")
+        path, content_type, file_stat = main._cached_image(main._image_cache_key(url))
+        assert content_type == "image/png" and file_stat.st_size == 9
+
+        resp = client.get("/api/image-proxy", params={"url": url})
+        assert resp.status_code == 200 and resp.content == b"png-bytes"
+        assert resp.headers["content-length"] == "9" and "etag" in resp.headers
+
+    def test_images_are_relayed_as_they_stream(self, client, monkeypatch, tmp_path):
+        import httpx
+        import main
+
+        async def chunks():
+            yield b"12345"
+            yield b"6789"
+
+        def handler(request):
+            return httpx.Response(200, content=chunks(), headers={
+                "Content-Type": "image/png", "Content-Length": "9", "ETag": '"v1"',
+            })
+
+        monkeypatch.setattr(main, "_image_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        monkeypatch.setattr(main, "IMAGE_CACHE_DIR", str(tmp_path))
+        monkeypatch.setattr(main, "IMAGE_CACHE_MAX_BYTES", 8)
+        resp = client.get("/api/image-proxy", params={"url": "https://cdn.example.com/big.png"})
+        assert resp.content == b"123456789"
+        assert resp.headers["content-length"] == "9" and resp.headers["etag"] == '"v1"'
+        assert list(tmp_path.iterdir()) == []  # over the cap: passed through, not kept
+
 
 # ---------------------------------------------------------------------------
 # SSE stream endpoint – verify it starts and returns correct content type
 # ---------------------------------------------------------------------------
+def _sse_frames(text):
+    """Split an SSE body into frames of {field: value} (comments under ":")."""
+    frames = []
+    for block in text.split("\n\n"):
+        if block:
+            frame = {}
+            for line in block.split("\n"):
+                field, _, value = line.partition(":")
+                frame[field] = value.removeprefix(" ")
+            frames.append(frame)
+    return frames
+
+
+def _sse_events(text):
+    import json
+
+    return [json.loads(f["data"]) for f in _sse_frames(text) if "data" in f]
+
+
 class TestStream:
     def test_stream_endpoint_exists(self, client):
         """The stream endpoint should accept GET requests (returns event-stream)."""
         resp = client.get("/api/research/stream", params={"query": ""})
         assert resp.status_code == 200
         assert "text/event-stream" in resp.headers.get("content-type", "")
+        assert resp.headers["x-accel-buffering"] == "no"
+        assert resp.headers["content-encoding"] == "identity"
+
+    def test_progress_is_delivered_in_order_before_the_result(self, client, monkeypatch):
+        import main
+
+        async def fake_research(query, progress_callback=None, candidates=None):
+            for n in range(3):
+                # from worker threads, like the agents' progress
+                await asyncio.to_thread(progress_callback, f"step {n}")
+            return {"final_response": {"products": [], "final_recommendation": "r"}}
+
+        monkeypatch.setattr(main, "execute_research", fake_research)
+        resp = client.get("/api/research/stream", params={"query": "desk lamp"})
+        frames = _sse_frames(resp.text)
+        # a retry hint first, then no heartbeats while messages flow
+        assert frames[0] == {"retry": "3000"}
+        assert all("data" in f and "id" in f for f in frames[1:])
+        events = _sse_events(resp.text)
+        messages = [m for e in events[:-1] for m in e.get("messages", [e.get("message")])]
+        assert messages == ["step 0", "step 1", "step 2"]
+        assert events[-1]["type"] == "complete"
+
+    def test_queued_progress_is_sent_as_one_frame(self, client, monkeypatch):
+        import main
+
+        async def fake_research(query, progress_callback=None, candidates=None):
+            for n in range(3):  # all queued before the stream reads any
+                progress_callback(f"step {n}")
+            return {"final_response": {"products": [], "final_recommendation": "r"}}
+
+        monkeypatch.setattr(main, "execute_research", fake_research)
+        resp = client.get("/api/research/stream", params={"query": "desk lamp"})
+        events = _sse_events(resp.text)
+        assert events[0] == {"type": "progress", "messages": ["step 0", "step 1", "step 2"]}
+        assert [e["type"] for e in events] == ["progress", "complete"]
+
+    def test_reconnect_resumes_after_last_event_id(self, client, monkeypatch):
+        import main
+
+        runs = []
+
+        async def fake_research(query, progress_callback=None, candidates=None):
+            runs.append(query)
+            for n in range(3):
+                await asyncio.to_thread(progress_callback, f"step {n}")
+            return {"final_response": {"products": [], "final_recommendation": "r"}}
+
+        monkeypatch.setattr(main, "execute_research", fake_research)
+        monkeypatch.setattr(main, "_stream_logs", {})
+        params = {"query": "desk lamp", "user_id": 7}
+        first = client.get("/api/research/stream", params=params).text
+        ids = [int(f["id"]) for f in _sse_frames(first) if "id" in f]
+        assert ids == sorted(set(ids))
+        events = _sse_events(first)
+        seen = events[0].get("messages", [events[0].get("message")])
+
+        resumed = client.get(
+            "/api/research/stream", params=params, headers={"Last-Event-ID": str(ids[0])}
+        )
+        replayed = _sse_events(resumed.text)
+        messages = [m for e in replayed[:-1] for m in e.get("messages", [e.get("message")])]
+        assert seen + messages == ["step 0", "step 1", "step 2"]
+        assert replayed[-1] == events[-1] and replayed[-1]["type"] == "complete"
+        assert runs == ["desk lamp"]  # replayed, not researched again
+
+        # a fresh connection (no Last-Event-ID) starts a new run
+        client.get("/api/research/stream", params=params)
+        assert runs == ["desk lamp", "desk lamp"]
+
+    @pytest.mark.parametrize("messages", [["Café ✓ \"quoted\"\n"], ["a", "b"]])
+    def test_progress_templates_match_full_serialisation(self, messages):
+        import main
+
+        payload = {"type": "progress", "message": messages[0]} if len(messages) == 1 else {
+            "type": "progress", "messages": messages,
+        }
+        assert main._progress_frame(3, messages) == b"id: 3\n" + main._sse(payload)
+
+    def test_sse_frames_are_utf8_bytes(self):
+        import json
+        import main
+
+        frame = main._sse({"type": "progress", "message": "Café ✓", "n": 2 ** 70})
+        assert frame.startswith(b"data: ") and frame.endswith(b"\n\n")
+        assert json.loads(frame[6:].decode()) == {"type": "progress", "message": "Café ✓", "n": 2 ** 70}
+
+
+# ---------------------------------------------------------------------------
+# Product normalisation
+# ---------------------------------------------------------------------------
+class TestNormalizeProduct:
+    @pytest.mark.parametrize("raw, expected", [
+        ({"msrp": 199, "sale": 149}, 199),
+        ({"a": "x", "b": 5}, 5),
+        ({}, "Price varies"),
+        ("", "Price not available"),
+        (None, "Price not available"),
+        ("$89.99", "$89.99"),
+    ])
+    def test_price(self, raw, expected):
+        assert normalize_product_data({"price": raw})["price"] == expected
+
+    @pytest.mark.parametrize("raw, expected", [
+        ({"score": "4.7/5"}, 4.7),
+        ("n/a", 4.0),
+        (None, 4.0),
+        (7, 5.0),
+        ([1], 4.0),
+    ])
+    def test_rating(self, raw, expected):
+        assert normalize_product_data({"rating": raw})["rating"] == expected
+
+    def test_features_reviews_and_defaults(self):
+        out = normalize_product_data({
+            "features": {"Battery": "30h"},
+            "reviews_count": "1,234 reviews",
+            "pros": "not a list",
+            "url": "https://example.com/p",
+            "search_image": "https://example.com/i.jpg",
+        })
+        assert out["features"] == ["Battery: 30h"]
+        assert out["reviews_count"] == 1234
+        assert out["pros"] == []
+        assert out["name"] == "Unknown Product"
+        assert out["cheapest_link"] == "https://example.com/p"
+        assert out["image_url"] is None and out["image_data"] is None
+        assert out["link_verified"] is False
+        assert "search_image" not in out
+
+    def test_memoised_result_is_not_shared(self):
+        first = normalize_product_data({"name": "Memo", "features": {"a": 1}})
+        second = normalize_product_data({"name": "Memo", "features": {"a": 1}})
+        assert second == first
+        second["features"].append("extra")
+        assert normalize_product_data({"name": "Memo", "features": {"a": 1}})["features"] == ["a: 1"]
+
+    def test_normalized_product_takes_fast_path_unchanged(self):
+        out = normalize_product_data({"name": "Fast", "price": {"msrp": 99}, "rating": "4.4"})
+        snapshot = dict(out)
+        assert normalize_product_data(out) is out
+        assert out == snapshot
+
+
+# ---------------------------------------------------------------------------
+# Pipeline caches
+# ---------------------------------------------------------------------------
+class TestTTLCache:
+    def test_key_ignores_case_and_whitespace(self):
+        assert cache_key("Best  Wireless Earbuds ") == cache_key("best wireless earbuds")
+        assert cache_key("earbuds") != cache_key("headphones")
+
+    def test_hit_returns_independent_copy(self):
+        cache = TTLCache(maxsize=4)
+        cache.set("k", {"products": [{"name": "A"}]})
+        cache.get("k")["products"].append({"name": "B"})
+        assert cache.get("k") == {"products": [{"name": "A"}]}
+
+    def test_entries_expire(self):
+        cache = TTLCache(maxsize=4, ttl=0)
+        cache.set("k", [1])
+        assert cache.get("k") is None
+
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1 and cache.get("c") == 3
+
+    def test_get_or_call_skips_empty_results(self):
+        cache = TTLCache(maxsize=4)
+        calls = []
+
+        def fn():
+            calls.append(1)
+            return []
+
+        cache.get_or_call("k", fn)
+        cache.get_or_call("k", fn)
+        assert len(calls) == 2
+
+    def test_concurrent_misses_share_one_call(self):
+        from concurrent.futures import ThreadPoolExecutor
+        import time
+
+        cache = TTLCache(maxsize=4)
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.05)
+            return {"v": 1}
+
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(lambda _: cache.get_or_call("k", slow), range(4)))
+        assert calls == [1] and results == [{"v": 1}] * 4
+
+        async def aslow():
+            calls.append(2)
+            await asyncio.sleep(0.02)
+            raise ValueError("down")
+
+        async def run():
+            return await asyncio.gather(
+                *[cache.aget_or_call("a", aslow) for _ in range(3)], return_exceptions=True
+            )
+
+        assert [type(r) for r in asyncio.run(run())] == [ValueError] * 3
+        assert calls == [1, 2] and cache._pending == cache._apending == {}
+
+    def test_owner_timeout_does_not_cancel_joiners(self):
+        cache = TTLCache(maxsize=4)
+        calls = []
+
+        async def slow():
+            calls.append(1)
+            await asyncio.sleep(0.2)
+            return {"v": 1}
+
+        async def run():
+            owner = asyncio.ensure_future(asyncio.wait_for(cache.aget_or_call("k", slow), 0.05))
+            await asyncio.sleep(0)
+            joiner = asyncio.ensure_future(asyncio.wait_for(cache.aget_or_call("k", slow), 5))
+            return await asyncio.gather(owner, joiner, return_exceptions=True)
+
+        owner, joiner = asyncio.run(run())
+        assert isinstance(owner, asyncio.TimeoutError)
+        assert joiner == {"v": 1} and calls == [1]
+        assert cache.get("k") == {"v": 1}  # the work finished and was cached
+        assert cache._apending == {}
+
+    def test_checkpoint_store_survives_a_fresh_cache(self):
+        import database
+
+        cache = TTLCache(maxsize=4, ttl=60, store=database.CheckpointStore("test"))
+        cache.set("k", {"products": [{"name": "A"}]})
+        database._checkpoint_writer.submit(lambda: None).result()  # wait for the write
+
+        restarted = TTLCache(maxsize=4, ttl=60, store=database.CheckpointStore("test"))
+        assert restarted.get("k") == {"products": [{"name": "A"}]}
+        assert len(restarted) == 1
+        assert TTLCache(ttl=0, store=database.CheckpointStore("test")).get("k") is None
+
+    def test_async_store_reads_leave_the_loop(self):
+        import threading
+        import time
+
+        class Store:
+            def __init__(self):
+                self.threads = []
+
+            def load(self, key):
+                self.threads.append(threading.get_ident())
+                return ({"v": 1}, time.time()) if key == "saved" else None
+
+            def save(self, key, value):
+                pass
+
+        store = Store()
+        cache = TTLCache(maxsize=4, ttl=60, store=store)
+
+        async def fetch():
+            return {"v": 2}
+
+        async def run():
+            saved = await cache.aget("saved")
+            fetched = await cache.aget_or_call("new", fetch)
+            return threading.get_ident(), saved, fetched
+
+        loop_thread, saved, fetched = asyncio.run(run())
+        assert saved == {"v": 1} and fetched == {"v": 2}
+        assert len(store.threads) == 3 and loop_thread not in store.threads
+        assert cache.get("saved") == {"v": 1}  # promoted to memory by the load
+
+    def test_prune_drops_only_expired_rows(self):
+        import database
+
+        fresh = database.CheckpointStore("prune-fresh", max_age=60)
+        stale = database.CheckpointStore("prune-stale", max_age=60)
+        fresh.save("k", [1])
+        stale._write("k", [2], saved_at=0.0)
+        database.prune_checkpoints()
+        database._checkpoint_writer.submit(lambda: None).result()
+        assert fresh.load("k")[0] == [1]
+        assert stale.load("k") is None
+
+    def test_llm_answers_are_replayed_from_the_checkpoint_store(self, monkeypatch):
+        import database
+        from langchain_core.language_models import FakeListChatModel
+
+        cache = agents._CheckpointLLMCache()
+        model = FakeListChatModel(responses=["first", "second", "third"], cache=cache)
+        assert model.invoke("same prompt").content == "first"
+        database._checkpoint_writer.submit(lambda: None).result()
+        assert model.invoke("same prompt").content == "first"
+        assert model.invoke("other prompt").content == "second"
+
+        monkeypatch.setattr(agents, "LLM_CACHE_TTL", -1)  # everything has expired
+        assert model.invoke("same prompt").content == "third"
+        database._checkpoint_writer.submit(lambda: None).result()
+
+
+# ---------------------------------------------------------------------------
+# Circuit breaker / backoff
+# ---------------------------------------------------------------------------
+def _boom():
+    raise ValueError("upstream down")
+
+
+class TestCircuitBreaker:
+    def test_opens_after_threshold_and_short_circuits(self):
+        breaker = CircuitBreaker("test", fail_threshold=2, reset_after=60)
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                breaker.call(_boom)
+        assert breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.call(lambda: "never called")
+
+    def test_half_open_trial_closes_on_success(self):
+        breaker = CircuitBreaker("test", fail_threshold=1, reset_after=0)
+        with pytest.raises(ValueError):
+            breaker.call(_boom)
+        assert breaker.call(lambda: "ok") == "ok"
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_retry_only_transient_errors(self):
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise TimeoutError()
+            return "ok"
+
+        assert retry_with_backoff(flaky, base=0) == "ok"
+        assert len(calls) == 3
+        with pytest.raises(ValueError):
+            retry_with_backoff(_boom, base=0)
+
+    def test_cancelled_half_open_trial_does_not_wedge_circuit(self):
+        breaker = CircuitBreaker("test", fail_threshold=1, reset_after=0)
+        with pytest.raises(ValueError):
+            breaker.call(_boom)
+
+        async def hang():
+            await asyncio.sleep(10)
+
+        async def ok():
+            return "ok"
+
+        async def run():
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(breaker.acall(hang), 0.01)
+            return await breaker.acall(ok)
+
+        assert asyncio.run(run()) == "ok"
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_rate_limiter_paces_calls_past_the_burst(self):
+        limiter = RateLimiter("test", rate=2, period=1.0)
+        # The burst goes straight through; later callers queue up in turn
+        delays = [limiter._reserve() for _ in range(4)]
+        assert delays[:2] == [0.0, 0.0]
+        assert delays[2] == pytest.approx(0.5, abs=0.05)
+        assert delays[3] == pytest.approx(1.0, abs=0.05)
+        assert RateLimiter("off", rate=0)._reserve() == 0.0
+
+
+class TestSimilarityCache:
+    def test_near_duplicate_phrasings_hit(self):
+        cache = SimilarityCache()
+        cache.set("best noise cancelling headphones", {"products": [1]})
+        assert cache.get("top noise-canceling headphone") == {"products": [1]}
+        assert cache.get("Noise Cancelling Headphones for travel") is None
+
+    def test_numbers_must_match(self):
+        cache = SimilarityCache(threshold=0.5)
+        cache.set("gaming laptop under $1000 with rtx graphics", "a")
+        assert cache.get("gaming laptop under $1500 with rtx graphics") is None
+        assert cache.get("gaming laptop under $1000 rtx graphics card") == "a"
+
+    def test_expired_best_match_does_not_hide_live_one(self, monkeypatch):
+        import cache as cache_module
+
+        now = [1000.0]
+        monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+        cache = SimilarityCache(ttl=10, threshold=0.5)
+        cache.set("wireless gaming mouse lightweight", "old")
+        now[0] += 8
+        cache.set("wireless gaming mouse for fps", "live")
+        now[0] += 5
+        assert cache.get("lightweight wireless gaming mouse black") == "live"
+        assert cache._entries.keys() == [cache._key(cache_module.query_tokens("wireless gaming mouse for fps"))]
+
+    def test_near_duplicate_queries_share_questions(self, monkeypatch):
+        from langchain_core.language_models import FakeListChatModel
+
+        agent = agents.PersonalizationAgent()
+        agent.llm = FakeListChatModel(responses=[
+            '[{"id": "budget", "question": "Budget?", "type": "text"}]',
+            '[{"id": "color", "question": "Colour?", "type": "text"}]',
+        ])
+        monkeypatch.setattr(agents, "_questions_cache", SimilarityCache())
+        first = agent.generate_questions("best wireless earbuds for running")
+        assert agent.generate_questions("top wireless earbud for running") == first
+        assert agent.generate_questions("mechanical keyboard")[0]["id"] == "color"
+
+
+# ---------------------------------------------------------------------------
+# HTML parsing
+# ---------------------------------------------------------------------------
+PRODUCT_PAGE = """<html><head>
+<meta property="og:title" content="Sony WH-1000XM5 Wireless Headphones">
+<meta property="og:image" content="https://img.example.com/xm5.jpg">
+<link rel="canonical" href="https://shop.example.com/p/xm5">
+<script type="application/ld+json">
+{"@type": "Product", "name": "Sony WH-1000XM5", "offers": {"price": "329.99"}}
+</script></head><body><button>Add to cart</button></body></html>"""
+
+
+class TestHtmlParse:
+    def test_product_page_metadata(self):
+        data = html_parse.parse_product_metadata(
+            PRODUCT_PAGE, "https://shop.example.com/x", "Sony WH-1000XM5"
+        )
+        assert data["is_single_product"] is True
+        assert data["image_url"] == "https://img.example.com/xm5.jpg"
+        assert data["price"] == "329.99"
+        assert data["url"] == "https://shop.example.com/p/xm5"
+
+    def test_product_card_grid_is_a_listing(self):
+        cards = '<div class="tile Product-Card">x</div>' * 3
+        html = PRODUCT_PAGE.replace("<body>", "<body>" + cards)
+        data = html_parse.parse_product_metadata(html, "https://shop.example.com/x")
+        assert data["is_single_product"] is False
+        assert data["image_url"] is None
+        assert data["url"] == "https://shop.example.com/p/xm5"
+
+    def test_non_html_responses_are_skipped_before_the_body(self, monkeypatch):
+        import httpx
+
+        fetched = []
+
+        def handler(request):
+            fetched.append(request.url.path)
+            if request.url.path.endswith(".pdf"):
+                return httpx.Response(200, headers={"Content-Type": "application/pdf"},
+                                      stream=httpx.ByteStream(b"never read"))
+            return httpx.Response(200, text=PRODUCT_PAGE,
+                                  headers={"Content-Type": "text/html; charset=utf-8"})
+
+        monkeypatch.setattr(agents, "_http_client", httpx.Client(transport=httpx.MockTransport(handler)))
+        agents._page_cache.clear()
+        assert agents._fetch_html("https://shop.example.com/manual.pdf", 5.0) is None
+        for _ in range(2):  # the second fetch is served from the page cache
+            assert agents._fetch_html("https://shop.example.com/p/xm5", 5.0) == PRODUCT_PAGE
+        assert fetched == ["/manual.pdf", "/p/xm5"]
+        agents._page_cache.clear()
+
+    def test_oversized_pages_stop_downloading_at_the_cap(self, monkeypatch):
+        import httpx
+
+        sent = []
+
+        def body():
+            yield PRODUCT_PAGE.encode()
+            for _ in range(100):
+                sent.append(1)
+                yield b"x" * 1024
+
+        def handler(request):
+            return httpx.Response(200, content=body(), headers={"Content-Type": "text/html"})
+
+        monkeypatch.setattr(agents, "_http_client", httpx.Client(transport=httpx.MockTransport(handler)))
+        monkeypatch.setattr(agents, "MAX_PAGE_BYTES", 4096)
+        html = agents._fetch_html_uncached("https://shop.example.com/p/huge", 5.0)
+        assert html.startswith(PRODUCT_PAGE) and len(html) == 4096
+        assert len(sent) < 10
+
+    def test_large_pages_parse_in_worker_pool(self):
+        big = PRODUCT_PAGE.replace("</body>", "<!--" + "x" * html_parse.OFFLOAD_MIN_CHARS + "--></body>")
+        args = ("https://shop.example.com/x", "Sony WH-1000XM5")
+        assert html_parse.run_parser(html_parse.parse_product_metadata, big, *args) == (
+            html_parse.parse_product_metadata(big, *args)
+        )
+        signals = html_parse.run_parser(html_parse.parse_verification_signals, big, "Sony WH-1000XM5")
+        assert signals == html_parse.parse_verification_signals(big, "Sony WH-1000XM5")
+        assert signals["is_product_page"] and signals["page_price"] == "329.99"
+
+
+class TestParseJsonOutput:
+    @pytest.mark.parametrize("text,expected", [
+        ('```json\n{"a": [1]}\n```', {"a": [1]}),
+        ("<think>maybe {}</think>[1, 2]", [1, 2]),
+        ('Sure: {"s": "b}[", "n": {"d": 2}} hope that helps [1]', {"s": "b}[", "n": {"d": 2}}),
+        ('See [note] then {"x": 1}', {"x": 1}),
+        ('Here: {"p": [{"n": "A"}, {"n": "B"}]}. Done!', {"p": [{"n": "A"}, {"n": "B"}]}),
+        ('{"why": "<think>is data</think>"}', {"why": "<think>is data</think>"}),
+        ('Result: {"p": [{"n": "A",}, {"n": "B, ]"},\n],}', {"p": [{"n": "A"}, {"n": "B, ]"}]}),
+        ('{"truncated": 1', {}),
+        ("no json here", {}),
+    ])
+    def test_extracts_first_valid_json(self, text, expected):
+        assert agents.parse_json_output(text) == expected
+
+    def test_stream_yields_array_items_as_they_close(self):
+        stream = agents._JsonArrayStream("analyses")
+        text = '<think>"analyses": [</think>{"analyses": [{"i": "}"}, {"i": 2}]}'
+        got = [stream.feed(text[a:b]) for a, b in ((0, 45), (45, 54), (54, len(text)))]
+        assert got == [[], [(0, {"i": "}"})], [(1, {"i": 2})]]
+
+
+class TestSnippetPrices:
+    RESULTS = [
+        {"url": "https://www.amazon.com/dp/B09XS7JWHH", "title": "Sony WH-1000XM5 Headphones",
+         "content": "Sony WH-1000XM5 ... $328.00 with free shipping"},
+        {"url": "https://www.rtings.com/headphones/reviews/sony/wh-1000xm5", "title": "Sony WH-1000XM5 Review",
+         "content": "Launched at $399.99"},
+        {"url": "https://www.bestbuy.com/site/sony-wh1000xm5/6505727.p", "title": "Sony WH-1000XM5 - Black",
+         "content": "Was $399.99, now $1,299.99 bundle"},
+    ]
+
+    def test_parses_retailer_prices_without_llm(self):
+        raw = agents._extract_prices_from_results(self.RESULTS, "Sony WH-1000XM5")
+        assert raw["retailers"] == [
+            {"retailer": "Amazon", "price": "328.00", "source_index": 0},
+            {"retailer": "Best Buy", "price": "399.99", "source_index": 2},
+        ]
+        assert raw["best_price"] == "328.00" and raw["best_source_index"] == 0
+
+    def test_single_retailer_falls_back_to_llm(self):
+        assert agents._extract_prices_from_results(self.RESULTS[:2], "Sony WH-1000XM5") is None
+
+    def test_batch_price_parse_matches_per_item_parse(self):
+        prices = ["$1,299.99", "N/A", None, "from 279 to 300", "two\nlines 12.5", 5, "$.99"]
+        assert agents._price_floats(prices) == [agents._extract_price_float(p) for p in prices]
+        entries = [{"price": "$5", "url": "a"}, {"price": "4.00", "url": "b"}, {"price": "4", "url": "c"}]
+        assert agents._cheapest(entries) == (entries[1], 4.0)
+
+    def test_pages_scrape_concurrently_but_resolve_in_priority_order(self, monkeypatch):
+        import threading
+        import time
+
+        started = []
+        both_started = threading.Event()
+
+        def fake_scrape(url, timeout=10.0, target_product_name=None):
+            started.append(url)
+            if len(started) == 2:
+                both_started.set()
+            both_started.wait(1)
+            time.sleep(0.05 if "amazon" in url else 0)  # the best page is the slowest
+            return {"url": url, "title": "Sony WH-1000XM5", "image_url": f"{url}.jpg",
+                    "price": "$1", "is_single_product": True}
+
+        monkeypatch.setattr(agents, "scrape_page_metadata", fake_scrape)
+        raw = agents._extract_prices_from_results(self.RESULTS, "Sony WH-1000XM5")
+        out = agents.PriceComparisonAgent()._resolve(raw, "Sony WH-1000XM5", self.RESULTS, None)
+        assert both_started.is_set()
+        assert out["url"] == self.RESULTS[0]["url"]
+        assert out["image_url"] == self.RESULTS[0]["url"] + ".jpg"
+
+    def test_lower_priority_pages_are_skipped_once_the_top_page_suffices(self, monkeypatch):
+        started = []
+
+        def fake_scrape(url, timeout=10.0, target_product_name=None):
+            started.append(url)
+            return {"url": url, "title": "Sony WH-1000XM5", "image_url": f"{url}.jpg",
+                    "price": "$1", "is_single_product": "rtings" not in url}
+
+        monkeypatch.setattr(agents, "scrape_page_metadata", fake_scrape)
+        results = self.RESULTS + [
+            {"url": f"https://www.walmart.com/ip/{n}", "title": "Sony WH-1000XM5", "content": ""}
+            for n in range(3)
+        ]
+        raw = {"retailers": [{"retailer": "x", "price": "1", "source_index": i}
+                             for i in range(len(results))]}
+        agents.PriceComparisonAgent()._resolve(raw, "Sony WH-1000XM5", results, None)
+        assert started == [results[0]["url"], results[1]["url"]]
+
+    def test_retailer_is_read_from_the_host(self):
+        assert agents._retailer_for_url("https://smile.amazon.com/dp/B0") == "Amazon"
+        assert agents._retailer_for_url("https://www.bestbuy.com:443/site/x") == "Best Buy"
+        assert agents._retailer_for_url("https://blog.example.com/amazon.com-vs-walmart") is None
+        assert agents._retailer_for_url("not a url") is None
+
+    def test_concurrent_llm_fallbacks_share_one_call(self):
+        agent = agents.PriceComparisonAgent()
+        calls = []
+
+        class FakeChain:
+            def __init__(self, prompt):
+                self.prompt = prompt
+
+            async def ainvoke(self, inputs):
+                calls.append(self.prompt)
+                if self.prompt is agent._batch_prompt:
+                    return {"products": [{"index": 1, "best_price": "2"}]}
+                return {"best_price": "1"}
+
+        agent._json_chain = FakeChain
+        inputs = [agent._llm_inputs(n, self.RESULTS) for n in ("A", "B")]
+
+        async def run():
+            return await asyncio.gather(*[agent._allm_prices(i) for i in inputs])
+
+        first, second = asyncio.run(run())
+        # One batched call; the product it left out is retried on its own
+        assert calls == [agent._batch_prompt, agent._prompt]
+        assert first == {"best_price": "1"} and second["best_price"] == "2"
+
+
+class TestSearchCache:
+    def test_repeat_searches_hit_the_api_once(self, monkeypatch):
+        calls = []
+
+        def fake_search(query, max_results, search_depth, include_images):
+            calls.append(query)
+            return {"results": [{"url": "https://example.com", "content": query}], "images": []}
+
+        monkeypatch.setattr(agents, "_tavily_search_uncached", fake_search)
+        agents._search_results_cache.clear()
+        first = agents.tavily_search("Sony WH-1000XM5 review")
+        assert agents.tavily_search("  sony wh-1000xm5   REVIEW") == first
+        agents.tavily_search("Sony WH-1000XM5 review", search_depth="basic")
+        assert len(calls) == 2
+        for _ in range(2):
+            agents.tavily_search("headphone deals today")
+        assert len(calls) == 4
+
+    def test_image_search_prefers_photo_files(self, monkeypatch):
+        monkeypatch.setattr(agents, "_get_tavily_client", lambda: object())
+        monkeypatch.setattr(agents, "tavily_search", lambda **kw: {"images": [
+            "https://cdn.example.com/logo.svg", "/relative.jpg", "https://cdn.example.com/xm5.JPG?w=800",
+        ]})
+        assert agents._search_images_tavily("Sony WH-1000XM5") == [
+            "https://cdn.example.com/xm5.JPG?w=800", "https://cdn.example.com/logo.svg",
+        ]
+
+    def test_buy_link_fallback_reuses_price_searches(self, monkeypatch):
+        calls = []
+
+        def fake_search(query, max_results, search_depth, include_images):
+            calls.append(query)
+            return {"results": [{"url": f"https://www.amazon.com/dp/{len(calls)}", "content": ""}]}
+
+        monkeypatch.setattr(agents, "_tavily_search_uncached", fake_search)
+        agents._search_results_cache.clear()
+        for kwargs in agents.PriceComparisonAgent._buy_searches("Reuse Widget"):
+            agents.tavily_search(**kwargs)
+        links = agents.LinkVerificationAgent()._search_buy_links("Reuse Widget")
+        assert len(calls) == 2 and len(links) == 2
+
+    def test_results_are_compacted_for_cache_and_prompts(self):
+        data = agents._compact_search({
+            "query": "q", "response_time": 1.2, "images": ["https://i/x.jpg"],
+            "results": [{"url": "u", "title": "t", "content": "a\n\n   b", "score": 0.9, "raw_content": None}],
+        })
+        assert data == {"results": [{"url": "u", "title": "t", "content": "a\n\n   b"}], "images": ["https://i/x.jpg"]}
+        assert agents._snippet(data["results"][0], 5) == "a b"
+
+
+# ---------------------------------------------------------------------------
+# Progress queue
+# ---------------------------------------------------------------------------
+class TestProgress:
+    def test_flush_delivers_in_order_to_captured_callback(self):
+        received = []
+        token = agent_graph.set_progress_callback(received.append)
+        try:
+            for i in range(100):
+                agent_graph.emit_progress(f"step {i}")
+        finally:
+            agent_graph.clear_progress_callback(token)
+        agent_graph.flush_progress()
+        assert received == [f"step {i}" for i in range(100)]
+
+    def test_concurrent_research_runs_keep_their_own_progress(self, monkeypatch):
+        import main
+
+        async def fake_ainvoke(state):
+            for i in range(3):
+                agent_graph.emit_progress(f"{state['query']} {i}")
+                await asyncio.sleep(0)
+            await asyncio.to_thread(agent_graph.emit_progress, f"{state['query']} done")
+            return {"final_response": None}
+
+        monkeypatch.setattr(main.graph_app, "ainvoke", fake_ainvoke)
+        received = {"a": [], "b": []}
+
+        async def run():
+            await asyncio.gather(
+                main.execute_research("a", received["a"].append),
+                main.execute_research("b", received["b"].append),
+                main.execute_research("c"),
+            )
+
+        asyncio.run(run())
+        agent_graph.flush_progress()
+        for q in ("a", "b"):
+            assert received[q] == [f"{q} 0", f"{q} 1", f"{q} 2", f"{q} done"]
+
+
+class TestSingleFlight:
+    def test_identical_concurrent_queries_share_one_run(self, monkeypatch):
+        calls = []
+
+        async def fake_pipeline(query, candidates=None):
+            calls.append(query)
+            await asyncio.sleep(0.05)
+            return {"products": [], "query": query}
+
+        monkeypatch.setattr(agent_graph, "run_shopping_pipeline_async", fake_pipeline)
+        shop = agent_graph.SimpleShoppingApp()
+
+        async def run():
+            return await asyncio.gather(
+                shop.ainvoke({"query": "Wireless Mouse"}),
+                shop.ainvoke({"query": "  wireless   mouse "}),
+                shop.ainvoke({"query": "keyboard"}),
+            )
+
+        a, b, c = asyncio.run(run())
+        assert len(calls) == 2
+        assert a == b and a is not b
+        assert c["query"] == "keyboard"
+        assert shop._inflight == {}
+
+    def test_initial_candidates_reach_the_pipeline(self, monkeypatch):
+        seen = []
+
+        async def fake_pipeline(query, candidates=None):
+            seen.append(candidates)
+            return {"products": []}
+
+        monkeypatch.setattr(agent_graph, "run_shopping_pipeline_async", fake_pipeline)
+        shop = agent_graph.SimpleShoppingApp()
+        asyncio.run(shop.ainvoke({"query": "mouse", "product_candidates": [{"name": "M1"}]}))
+        asyncio.run(shop.ainvoke({"query": "mouse", "product_candidates": []}))
+        assert seen == [[{"name": "M1"}], None]
+
+    def test_lone_caller_gets_result_without_copy(self, monkeypatch):
+        result = {"products": [{"name": "A"}]}
+
+        async def fake_pipeline(query, candidates=None):
+            return result
+
+        monkeypatch.setattr(agent_graph, "run_shopping_pipeline_async", fake_pipeline)
+        shop = agent_graph.SimpleShoppingApp()
+        assert asyncio.run(shop.ainvoke({"query": "mouse"})) is result
+
+    def test_joined_callers_all_receive_shared_progress(self, monkeypatch):
+        async def fake_pipeline(query, candidates=None):
+            await asyncio.sleep(0.02)
+            agent_graph.emit_progress("halfway")
+            return {"products": []}
+
+        monkeypatch.setattr(agent_graph, "run_shopping_pipeline_async", fake_pipeline)
+        shop = agent_graph.SimpleShoppingApp()
+        first, second = [], []
+
+        async def caller(callback):
+            token = agent_graph.set_progress_callback(callback)
+            try:
+                return await shop.ainvoke({"query": "mouse"})
+            finally:
+                agent_graph.clear_progress_callback(token)
+
+        async def run():
+            await asyncio.gather(caller(first.append), caller(second.append))
+
+        asyncio.run(run())
+        assert first == ["halfway"]
+        assert second == ["Joining an identical search already in progress...", "halfway"]
+
+
+class TestLLMSlots:
+    def test_concurrent_calls_are_capped(self, monkeypatch):
+        monkeypatch.setattr(agents, "LLM_CONCURRENCY", 2)
+        monkeypatch.setattr(agents, "_loop_llm_slots", agents.weakref.WeakKeyDictionary())
+        running, peak = [0], [0]
+
+        class SlowRunnable:
+            async def ainvoke(self, inputs, config=None):
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+                await asyncio.sleep(0.02)
+                running[0] -= 1
+                return inputs
+
+        chain = agents._SlottedChain(SlowRunnable())
+
+        async def run():
+            return await asyncio.gather(*[chain.ainvoke(i) for i in range(6)])
+
+        assert asyncio.run(run()) == list(range(6))
+        assert peak[0] == 2
+
+
+class TestCascade:
+    def test_rejected_cheap_answer_escalates(self, monkeypatch):
+        from langchain_core.language_models import FakeListChatModel
+
+        cheap = FakeListChatModel(responses=['[{"name": "Only One"}]'])
+        full = FakeListChatModel(responses=['[{"name": "A"}, {"name": "B"}]'])
+        monkeypatch.setattr(agents, "get_cheap_llm", lambda: cheap)
+        monkeypatch.setattr(agents, "get_default_llm", lambda: full)
+        agent = agents.PrimaryResearcherAgent()
+        prompt = agent._prompt
+        inputs = {"query": "cascade test", "search_results": ""}
+
+        assert agent._cascade(prompt, inputs, lambda raw: len(raw) == 1) == [{"name": "Only One"}]
+        assert agent._cascade(prompt, inputs, lambda raw: len(raw) == 2) == [{"name": "A"}, {"name": "B"}]
+        assert asyncio.run(agent._acascade(prompt, inputs, lambda raw: len(raw) == 2)) == [{"name": "A"}, {"name": "B"}]
+
+
+class TestJsonMode:
+    def test_json_prompts_use_the_json_model(self, monkeypatch):
+        from langchain_core.language_models import FakeListChatModel
+
+        monkeypatch.setattr(agents, "get_json_llm", lambda: FakeListChatModel(responses=["{}"]))
+        monkeypatch.setattr(agents, "get_default_llm", lambda: FakeListChatModel(responses=["text"]))
+        details = agents.ProductDetailAgent()
+        recommender = agents.RecommendationAgent()
+        assert details._json_chain(details._prompt).invoke({"product_name": "x", "content": ""}) == {}
+        assert recommender._chain(recommender._prompt).invoke({"query": "x", "products": ""}) == "text"
+
+
+class TestRecommendation:
+    def test_timeout_keeps_streamed_sentences(self):
+        agent = agents.RecommendationAgent()
+
+        class SlowChain:
+            async def astream(self, inputs):
+                for chunk in ["**Sony** is the pick. It has", " the best ANC"]:
+                    yield chunk
+                await asyncio.sleep(1)
+
+        agent._chain = lambda prompt: SlowChain()
+        text = asyncio.run(agent.arecommend([{"name": "Sony"}], "headphones", timeout=0.05))
+        assert text == "**Sony** is the pick."
+
+    def test_partial_text_keeps_closing_bold(self):
+        complete = agents.RecommendationAgent._complete_sentences
+        assert complete("Go with **Sony WH-1000XM5.** It has the best ANC and") == "Go with **Sony WH-1000XM5.**"
+        assert complete("Go with **Sony WH-1000XM5.**") == "Go with **Sony WH-1000XM5.**"
+
+
+class TestLinkClassification:
+    def test_ambiguous_pages_share_one_llm_call(self):
+        from langchain_core.language_models import FakeListChatModel
+
+        agent = agents.LinkVerificationAgent()
+        agent.llm = FakeListChatModel(responses=[
+            '{"pages": [{"index": 1, "purchase_page": true}, {"index": 0, "purchase_page": false}]}',
+            "unused",
+        ])
+        pages = [("https://blog.example.com/review", "Review"), ("https://shop.example.com/p/1", None)]
+        assert agent._llm_classify_urls(pages, "Widget") == [False, True]
+        assert agent.llm.i == 1
+
+    def test_single_page_takes_one_plain_call(self):
+        from langchain_core.language_models import FakeListChatModel
+
+        agent = agents.LinkVerificationAgent()
+        agent.llm = FakeListChatModel(responses=["YES, a product page"])
+        assert agent._llm_classify_urls([("https://shop.example.com/p/1", "Widget")], "Widget") == [True]
+
+        class DownChain:
+            def invoke(self, inputs):
+                raise RuntimeError("provider down")
+
+        agent._chain = lambda prompt: DownChain()
+        assert agent._llm_classify_urls([("https://shop.example.com/p/1", None)], "Widget") == [False]
+
+    def test_link_pages_are_scraped_together(self, monkeypatch):
+        import threading
+
+        agent = agents.LinkVerificationAgent()
+        barrier = threading.Barrier(3, timeout=2)  # main, cheapest, one comparison
+        scraped = []
+
+        def fake_scrape(url, product_name):
+            scraped.append(url)
+            barrier.wait()
+            return {"is_product_page": "blog" not in url, "name_matches": False,
+                    "page_title": None, "page_price": None, "page_image": None}
+
+        monkeypatch.setattr(agent, "_scrape_verify", fake_scrape)
+        product = agent.verify_product_links({
+            "name": "Widget", "price": "$10",
+            "url": "https://shop.example.com/widget", "cheapest_link": "https://deals.example.com/w",
+            "price_comparison": [
+                {"url": "https://shop.example.com/widget"},
+                {"url": "https://blog.example.com/widget-deals"},
+            ],
+        })
+        assert sorted(scraped) == sorted({
+            "https://shop.example.com/widget", "https://deals.example.com/w",
+            "https://blog.example.com/widget-deals",
+        })
+        assert product["link_verified"] is True
+        assert product["price_comparison"] == [{"url": "https://shop.example.com/widget"}]
+
+
+class TestCandidateFanOut:
+    def test_runs_beyond_the_limit_wait_for_a_slot(self, monkeypatch):
+        running, peak = [0], [0]
+
+        async def fake_run(query, candidates=None):
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            await asyncio.sleep(0.01)
+            running[0] -= 1
+            return {"query": query}
+
+        monkeypatch.setattr(agent_graph, "_run_research", fake_run)
+        monkeypatch.setattr(agent_graph, "RESEARCH_CONCURRENCY", 2)
+
+        async def run():
+            return await asyncio.gather(*[
+                agent_graph.run_shopping_pipeline_async(f"slot test query {n}") for n in range(5)
+            ])
+
+        assert [r["query"] for r in asyncio.run(run())] == [f"slot test query {n}" for n in range(5)]
+        assert peak[0] == 2
+
+    def test_links_are_verified_while_details_run(self, monkeypatch):
+        order = []
+
+        async def fake_prices(name):
+            return {"url": "https://shop.example.com/p/1", "price": "Price not available"}
+
+        def fake_verify(product):
+            order.append("verify")
+            product["link_verified"] = True
+            return product
+
+        monkeypatch.setattr(agent_graph, "compare_prices", fake_prices)
+        monkeypatch.setattr(
+            agent_graph.link_verification_agent, "verify_product_links", fake_verify
+        )
+
+        async def run():
+            ready = asyncio.get_running_loop().create_future()
+
+            async def finish_details():
+                while not order:  # only answer once verification has run
+                    await asyncio.sleep(0.01)
+                order.append("details")
+                ready.set_result({"name": "Widget", "approximate_price": "$10", "pros": ["p"]})
+
+            task = asyncio.ensure_future(finish_details())
+            product = await agent_graph._research_candidate(
+                {"name": "Widget"}, 1, 1, asyncio.Semaphore(1), ready
+            )
+            await task
+            return product
+
+        product = asyncio.run(run())
+        assert order == ["verify", "details"]
+        assert product["link_verified"] and "10" in product["price"]
+
+
+class TestBatchedDetails:
+    def test_batch_gaps_fall_back_to_single_calls(self, monkeypatch):
+        agent = agent_graph.product_detail_agent
+        batches, singles = [], []
+
+        async def fake_batch(names, on_analysis=None):
+            batches.append(names)
+            return [{"name": names[0], "pros": ["p"]}, None]
+
+        async def fake_single(name):
+            singles.append(name)
+            return {"name": name, "pros": ["q"]}
+
+        monkeypatch.setattr(agent, "agather_details_batch", fake_batch)
+        monkeypatch.setattr(agent, "agather_details", fake_single)
+        agent_graph._details_cache.clear()
+
+        first, second = asyncio.run(
+            agent_graph.gather_details_many(["Batch Widget A", "Batch Widget B"])
+        )
+        assert batches == [["Batch Widget A", "Batch Widget B"]]
+        assert singles == ["Batch Widget B"]
+        assert first["pros"] == ["p"] and second["pros"] == ["q"]
+        agent_graph._details_cache.clear()
 
 
 # ---------------------------------------------------------------------------
@@ -125,7 +125,10 @@ export default function DashboardPage() {
     es.onmessage = (event) => {
       const data = JSON.parse(event.data);
       if (data.type === 'progress') {
-        setLogs((prev) => [...prev, { text: data.message, time: new Date() }]);
+        // one message, or several sent together as `messages`
+        const texts = data.messages || [data.message];
+        const time = new Date();
+        setLogs((prev) => [...prev, ...texts.map((text) => ({ text, time }))]);
       } else if (data.type === 'complete') {
         clearInterval(timerRef.current);
         setResults(data.data);
@@ -142,8 +145,10 @@ export default function DashboardPage() {
     };
 
     es.onerror = () => {
-      clearInterval(timerRef.current);
-      es.close();
+      // A dropped connection is retried by the browser, which sends the
+      // last event id so the server resumes the same run; only a stream
+      // the browser gave up on ends here
+      if (es.readyState === EventSource.CLOSED) clearInterval(timerRef.current);
     };
   }
 